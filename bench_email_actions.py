@@ -0,0 +1,364 @@
+"""
+Benchmarks of email_actions against synthetic mailboxes in fake_outlook.
+Every case runs in a fresh process so its peak RSS is its own; results are
+written as JSON and compared with a baseline to fail on regressions:
+
+    python bench_email_actions.py --sizes 1k,10k --output bench.json
+    python bench_email_actions.py --baseline bench.json --threshold 0.2
+
+cold_start times a light action's import and argument parsing in a new
+interpreter against --startup_budget.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+
+# FakeMailStore.populate arguments of each mailbox mix
+MIXES = {
+    "smtp": {"body_size": 500, "attachment_ratio": 0.1, "exchange_ratio": 0},
+    "mixed": {
+        "body_size": 2000,
+        "attachment_ratio": 0.3,
+        "exchange_ratio": 0.3,
+    },
+    "exchange": {
+        "body_size": 20000,
+        "attachment_ratio": 0.6,
+        "exchange_ratio": 1.0,
+    },
+}
+
+# Metric -> True when higher is better
+GATED_METRICS = {
+    "rows_per_sec": True,
+    "mb_per_sec": True,
+    "actions_per_sec": True,
+    "calls_per_item": False,
+    "peak_rss_mb": False,
+    "startup_seconds": False,
+}
+
+# Seconds a light action may spend importing and parsing its arguments
+STARTUP_BUDGET = 0.25
+
+# What a mark_email launch does before opening Outlook
+STARTUP_CODE = (
+    "import sys, email_actions; "
+    "email_actions.parse_args(['--email_action', 'mark_email'], 'bench'); "
+    "print('pandas' in sys.modules)"
+)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, None when unknown."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, kilobytes elsewhere
+        return peak / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().peak_wset / (1 << 20)
+
+
+def _store(count, mix):
+    from fake_outlook import FakeMailStore
+
+    store = FakeMailStore()
+    store.populate(count, seed=1, **MIXES[mix])
+    return store
+
+
+def _outlook(store):
+    from email_actions import Outlook
+    from fake_outlook import FakeBackend
+
+    return Outlook(None, None, backend=FakeBackend(store), sync="none")
+
+
+def bench_get_emails(count, mix, read_mode="table", output_format="csv"):
+    store = _store(count, mix)
+    outlook = _outlook(store)
+    folder_path = tempfile.mkdtemp()
+    try:
+        store.reset_calls()
+        start = time.perf_counter()
+        outlook.get_emails(
+            "[Unread]=True", folder_path, read_mode, output_format
+        )
+        seconds = time.perf_counter() - start
+        rows = int(outlook.metrics.counters.get("rows_exported", 0))
+    finally:
+        outlook.close()
+        shutil.rmtree(folder_path)
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds,
+        "calls_per_item": store.total_calls() / max(rows, 1),
+    }
+
+
+def bench_get_attachments(count, mix):
+    store = _store(count, mix)
+    outlook = _outlook(store)
+    folder_path = tempfile.mkdtemp()
+    try:
+        start = time.perf_counter()
+        counts = outlook.get_attachments_bulk(
+            folder_path, "*", "[Unread]=True"
+        )
+        seconds = time.perf_counter() - start
+    finally:
+        outlook.close()
+        shutil.rmtree(folder_path)
+    return {
+        "files": counts["saved"] + counts["duplicate"],
+        "bytes": counts["bytes"],
+        "seconds": seconds,
+        "mb_per_sec": counts["bytes"] / (1 << 20) / seconds,
+    }
+
+
+def bench_batch(count, mix):
+    store = _store(count, mix)
+    outlook = _outlook(store)
+    folder_path = tempfile.mkdtemp()
+    try:
+        manifest = os.path.join(folder_path, "manifest.jsonl")
+        with open(manifest, "w", encoding="utf-8") as f:
+            for n, entry_id in enumerate(store.items):
+                action = "mark_email" if n % 2 else "save_email"
+                f.write(json.dumps({"id": entry_id, "action": action}) + "\n")
+        store.reset_calls()
+        start = time.perf_counter()
+        counts = outlook.run_batch(
+            manifest, os.path.join(folder_path, "results.csv"), folder_path
+        )
+        seconds = time.perf_counter() - start
+    finally:
+        outlook.close()
+        shutil.rmtree(folder_path)
+    actions = sum(counts.values())
+    return {
+        "actions": actions,
+        "errors": counts["error"],
+        "seconds": seconds,
+        "actions_per_sec": actions / seconds,
+        "calls_per_item": store.total_calls() / max(actions, 1),
+    }
+
+
+def bench_cold_start(repeat=5):
+    """Fastest start of a light action in a new interpreter."""
+    times = []
+    for _ in range(max(repeat, 3)):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_CODE],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        times.append(time.perf_counter() - start)
+    return {
+        "seconds": min(times),
+        "startup_seconds": min(times),
+        "pandas_loaded": output.strip() == "True",
+    }
+
+
+BENCHMARKS = {
+    "get_emails": bench_get_emails,
+    "get_emails_items": lambda count, mix: bench_get_emails(
+        count, mix, "items"
+    ),
+    "get_emails_parquet": lambda count, mix: bench_get_emails(
+        count, mix, "table", "parquet"
+    ),
+    "get_attachments": bench_get_attachments,
+    "batch": bench_batch,
+}
+
+
+def run_case(benchmark, count, mix, repeat=1):
+    """Best of repeat runs in this process, with its peak RSS."""
+    # Skipped items log an error each; that is not what is measured
+    logging.disable(logging.CRITICAL)
+    try:
+        result = min(
+            (BENCHMARKS[benchmark](count, mix) for _ in range(repeat)),
+            key=lambda result: result["seconds"],
+        )
+    finally:
+        logging.disable(logging.NOTSET)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_cases(benchmarks, sizes, mixes, isolate=True, repeat=1):
+    """Results of every benchmark, size and mix, keyed by case name."""
+    results = {}
+    # spawn: a fork would inherit the parent's memory and its peak RSS
+    context = multiprocessing.get_context("spawn")
+    for benchmark in benchmarks:
+        for size in sizes:
+            for mix in mixes:
+                name = f"{benchmark}/{size}/{mix}"
+                if isolate:
+                    with ProcessPoolExecutor(1, mp_context=context) as pool:
+                        result = pool.submit(
+                            run_case, benchmark, SIZES[size], mix, repeat
+                        ).result()
+                else:
+                    result = run_case(benchmark, SIZES[size], mix, repeat)
+                results[name] = result
+                print(f"{name}: {format_result(result)}", flush=True)
+    return results
+
+
+def format_result(result):
+    return ", ".join(
+        f"{key} {value:.1f}" if isinstance(value, float) else f"{key} {value}"
+        for key, value in result.items()
+    )
+
+
+def compare(baseline, results, threshold=0.2):
+    """
+    Regressions of results against baseline, as (case, metric, baseline,
+    current) tuples. A metric regresses when it is worse by more than
+    threshold (a fraction); cases missing from either side are ignored.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in GATED_METRICS.items():
+            before = previous.get(metric)
+            after = result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if higher_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append((name, metric, before, after))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--benchmarks",
+        help=f"Comma separated, from cold_start, {', '.join(BENCHMARKS)}",
+        default=",".join(["cold_start", *BENCHMARKS]),
+    )
+    parser.add_argument(
+        "--sizes", help="Comma separated 1k, 10k, 100k", default="1k,10k"
+    )
+    parser.add_argument(
+        "--mixes",
+        help="Comma separated smtp, mixed, exchange",
+        default="mixed",
+    )
+    parser.add_argument("--output", help="Write results as JSON here")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument(
+        "--threshold",
+        help="Allowed fraction a metric may get worse",
+        type=float,
+        default=0.2,
+    )
+    parser.add_argument(
+        "--startup_budget",
+        help="cold_start: fail when a light action starts slower (seconds)",
+        type=float,
+        default=STARTUP_BUDGET,
+    )
+    parser.add_argument(
+        "--repeat",
+        help="Runs per case, the fastest is kept",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--no_isolate",
+        help="Run cases in this process (peak RSS then accumulates)",
+        action="store_true",
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    benchmarks = [b for b in args.benchmarks.split(",") if b]
+    sizes = [s for s in args.sizes.split(",") if s]
+    mixes = [m for m in args.mixes.split(",") if m]
+    for names, known in (
+        (benchmarks, ["cold_start", *BENCHMARKS]),
+        (sizes, SIZES),
+        (mixes, MIXES),
+    ):
+        unknown = set(names) - set(known)
+        if unknown:
+            raise SystemExit(f"Unknown: {', '.join(sorted(unknown))}")
+
+    failed = False
+    results = {}
+    if "cold_start" in benchmarks:
+        benchmarks.remove("cold_start")
+        results["cold_start"] = bench_cold_start(args.repeat)
+        print(f"cold_start: {format_result(results['cold_start'])}")
+        if results["cold_start"]["startup_seconds"] > args.startup_budget:
+            print(f"OVER BUDGET cold_start: {args.startup_budget}s")
+            failed = True
+    results.update(
+        run_cases(benchmarks, sizes, mixes, not args.no_isolate, args.repeat)
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        for name, metric, before, after in regressions:
+            print(f"REGRESSION {name} {metric}: {before:.1f} -> {after:.1f}")
+        if regressions:
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,58 +5,389 @@ TENARIS SOLUTIONS 2023.
 """
 import logging
 import argparse
-import win32com.client
+import csv
+import itertools
 import os
 import re
-import pandas as pd
+import sqlite3
+import time
 from datetime import datetime, timedelta
+from email_archive import (
+    PARTIAL,
+    SAVE_FORMATS,
+    archive_name,
+    archived_hashes,
+    entry_hash,
+)
+from email_attachments import AttachmentSelector, AttachmentSink
+from email_batch import (
+    SEND_RESULT_COLUMNS,
+    RateLimiter,
+    ResultWriter,
+    plan,
+    read_id_file,
+    read_manifest,
+    read_records,
+    render,
+)
+from email_cache import SenderCache, Watermark, WatermarkStore
+from email_export import DATE_FORMAT, STREAM_FORMATS, open_writer
+from email_filters import MailFilter, from_args, parse_date
+from email_index import RESULT_COLUMNS as INDEX_RESULT_COLUMNS
+from email_index import MailIndex
+from email_metrics import Metrics
+from email_retry import RetryPolicy, is_dead
+from email_sync import SYNC_POLICIES, Synchronizer
+
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:  # pywin32 only exists on Windows
+    pythoncom = None
+    win32com = None
+
+
+# Columns for dataframe
+DF_COLUMNS = [
+    "id",
+    "store_id",
+    "receiver",
+    "cc",
+    "subject",
+    "body",
+    "attachments",
+    "attachments_count",
+    "received",
+    "sent",
+    "sender",
+    "sender_add",
+    "unread",
+    "html_body",
+]
+
+# Plain item property behind each column. These are also the column
+# names read in bulk by get_emails(read_mode="table").
+ITEM_PROPERTIES = {
+    "id": "EntryID",
+    "receiver": "To",
+    "cc": "CC",
+    "subject": "Subject",
+    "received": "ReceivedTime",
+    "sent": "SentOn",
+    "sender": "SenderName",
+    "sender_add": "SenderEmailAddress",
+    "sender_type": "SenderEmailType",
+    "unread": "UnRead",
+}
+# Body, HTMLBody and attachments are not available through a Table
+ITEM_ONLY_COLUMNS = {"body", "html_body", "attachments"}
+TABLE_BATCH_SIZE = 500
+
+
+class FolderResolver:
+    """
+    Resolves folder paths such as "Vendors/2026" (under Inbox) or
+    "Inbox/Vendors/2026" (from the mailbox root, also forced by a leading
+    "/") and keeps every folder found for the rest of the session. Paths
+    not found are only remembered for missing_ttl seconds, so a folder
+    created meanwhile is found.
+    """
+
+    # Seconds a path not found is not looked up again
+    missing_ttl = 60
+
+    def __init__(self, ns, o_mailbox):
+        self.ns = ns
+        if o_mailbox:
+            self.root = ns.Folders[o_mailbox]
+            self.inbox = self.root.Folders["Inbox"]
+        else:
+            self.inbox = ns.GetDefaultFolder(6)
+            self.root = self.inbox.Parent
+        # Cache keys are lower-cased paths from the mailbox root
+        self.inbox_key = f"/{self.inbox.Name.lower()}"
+        # path -> EntryID and EntryID -> folder
+        self.paths = {}
+        self.by_id = {}
+        # Paths already looked up and not found -> when they expire
+        self.missing = {}
+
+    def _child(self, parent, parent_key, name):
+        key = f"{parent_key}/{name.lower()}"
+        if self.missing.get(key, 0) > time.monotonic():
+            return None, key
+        entry_id = self.paths.get(key)
+        if entry_id is None:
+            try:
+                folder = parent.Folders[name]
+            except Exception:
+                self.missing[key] = time.monotonic() + self.missing_ttl
+                return None, key
+            entry_id = folder.EntryID
+            self.paths[key] = entry_id
+            self.by_id[entry_id] = folder
+        return self.by_id[entry_id], key
+
+    def _walk(self, folder, key, names):
+        for name in names:
+            folder, key = self._child(folder, key, name)
+            if folder is None:
+                return None
+        return folder
+
+    def resolve(self, path):
+        names = [name for name in re.split(r"[/\\]", path) if name]
+        if not names:
+            raise LookupError(f"Empty folder path: {path!r}")
+        folder = None
+        if not path.startswith(("/", "\\")):
+            folder = self._walk(self.inbox, self.inbox_key, names)
+        if folder is None:
+            folder = self._walk(self.root, "", names)
+        if folder is None:
+            raise LookupError(f"Folder not found: {path}")
+        return folder
+
+    def clear(self):
+        self.paths.clear()
+        self.by_id.clear()
+        self.missing.clear()
+
+
+class MailBackend:
+    """
+    Source of the Outlook.Application object driven by Outlook.
+    A backend returns an object exposing the Outlook object model
+    (GetNamespace, CreateItem, Quit, folders, items, attachments...).
+    """
+
+    def dispatch(self):
+        raise NotImplementedError
+
+    def with_events(self, com_object, handler_class):
+        """Connect handler_class On<Event> methods to com_object's events."""
+        raise NotImplementedError
+
+    def pump(self):
+        """Deliver pending events to the connected handlers."""
+        raise NotImplementedError
+
+
+class ComBackend(MailBackend):
+    """Live Outlook through win32com."""
+
+    def dispatch(self):
+        if win32com is None:
+            raise RuntimeError("pywin32 is required to drive Outlook")
+        return win32com.client.Dispatch("Outlook.Application")
+
+    def with_events(self, com_object, handler_class):
+        return win32com.client.WithEvents(com_object, handler_class)
+
+    def pump(self):
+        pythoncom.PumpWaitingMessages()
+
+
+# MailRecord fields read from the full item only when accessed
+MAIL_RECORD_LAZY = {"body", "html_body", "attachments", "attachments_count"}
+_UNSET = object()
+
+
+class MailRecord:
+    """
+    One message from Outlook.iter_emails. Columns that were not requested
+    are None; body, html_body and attachments are read from Outlook on
+    first access and then kept.
+    """
+
+    __slots__ = (
+        "id",
+        "store_id",
+        "receiver",
+        "cc",
+        "subject",
+        "received",
+        "sent",
+        "sender",
+        "sender_add",
+        "sender_type",
+        "unread",
+        "_body",
+        "_html_body",
+        "_attachments",
+        "_loader",
+    )
+    COLUMNS = __slots__[:11]
+
+    def __init__(self, row, loader):
+        for name in self.COLUMNS:
+            setattr(self, name, row.get(name))
+        self._body = row.get("body", _UNSET)
+        self._html_body = row.get("html_body", _UNSET)
+        self._attachments = row.get("attachments", _UNSET)
+        self._loader = loader
+
+    def _lazy(self, field):
+        value = getattr(self, f"_{field}")
+        if value is _UNSET:
+            value = self._loader(self, field)
+            setattr(self, f"_{field}", value)
+        return value
+
+    @property
+    def body(self):
+        return self._lazy("body")
+
+    @property
+    def html_body(self):
+        return self._lazy("html_body")
+
+    @property
+    def attachments(self):
+        return self._lazy("attachments")
+
+    @property
+    def attachments_count(self):
+        return len(self.attachments)
+
+    def as_dict(self):
+        """Eager columns only; lazy ones would each open the item."""
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def __repr__(self):
+        return f"MailRecord(id={self.id!r}, subject={self.subject!r})"
 
 
 class Outlook:
-    def __init__(self, o_mailbox, o_folder) -> None:
-        # Creating an object for the outlook application.
-        self.outlook = win32com.client.Dispatch("Outlook.Application")
-        self.ns = self.outlook.GetNamespace("MAPI")
+    def __init__(
+        self,
+        o_mailbox,
+        o_folder,
+        backend=None,
+        sender_cache=None,
+        retry=None,
+        metrics=None,
+        sync="full",
+        sync_async=False,
+        index_path=None,
+    ) -> None:
+        self.backend = backend or ComBackend()
+        # Exchange sender -> SMTP address, kept for the whole session
+        self.senders = SenderCache() if sender_cache is None else sender_cache
+        # Busy Outlook calls are repeated, see email_retry
+        self.retry = retry or RetryPolicy()
+        # Timing spans of COM calls, see write_metrics
+        self.metrics = metrics or Metrics()
+        # Sync policy on open, see email_sync; async waits in fresh()
+        self.sync_policy = sync
+        self.sync_async = sync_async
+        # Messages sent in this session, flushed from the Outbox on close
+        self.sent = 0
         self.o_mailbox = o_mailbox
         self.o_folder = o_folder
-        logging.debug(f"Namespace: {self.ns} {datetime.now()}")
-        logging.debug(f"Mailbox: {self.o_mailbox} {datetime.now()}")
-        logging.debug(f"Mailbox folder: {self.o_folder} {datetime.now()}")
+        # Error swallowed by the last action that returned False
+        self.last_error = None
+        # Local search index kept in step by move_email and delete_email
+        self.index_path = index_path
+        # Items left out of the last get_emails after a permanent error
+        self.skipped = 0
+        # (EntryID, StoreID) of those items, retried by incremental runs
+        self.skipped_ids = []
+        self.connect()
+
+    # Dispatch Outlook and resolve the working folder
+    def connect(self):
+        # Creating an object for the outlook application.
+        self.outlook = self.retry.call(self.backend.dispatch)
+        self.ns = self.outlook.GetNamespace("MAPI")
+        logging.debug("Namespace: %s", self.ns)
+        logging.debug("Mailbox: %s", self.o_mailbox)
+        logging.debug("Mailbox folder: %s", self.o_folder)
+        self.sync = Synchronizer(
+            self.backend, self.ns, self.sync_policy, metrics=self.metrics
+        )
+
+        self.folders = FolderResolver(self.ns, self.o_mailbox)
+        self.inbox = self.folders.inbox
+
+        if self.o_folder != "Inbox" and self.o_folder is not None:
+            try:
+                self.inbox = self.folders.resolve(self.o_folder)
+            except LookupError:
+                print("Folder name not found.")
+                logging.debug("Folder name not found.")
+        logging.debug("__init__ - self.inbox: %s", self.inbox)
+
         # Update mailbox
         try:
-            self.ns.SendAndReceive(True)
-            self.outlook.Session.SendAndReceive(True)
+            self.sync.start(self.inbox)
         except Exception as ex:
-            logging.error(f"ns.SendAndReceive init{ex.args} {datetime.now()}")
+            logging.error("sync init %s", ex.args)
+        if not self.sync_async:
+            self.fresh()
 
-        if self.o_mailbox:
-            self.inbox = self.ns.Folders[self.o_mailbox].Folders["Inbox"]
-        else:
-            self.inbox = self.ns.GetDefaultFolder(6)
+    # Wait for the sync started on open before reading the mailbox
+    def fresh(self):
+        if self.sync.pending:
+            self.sync.wait()
 
-        if self.o_folder != "Inbox" and self.o_folder is not None:
-            for folder in self.inbox.Folders:
-                if folder.Name == self.o_folder:
-                    self.inbox = self.inbox.Folders[self.o_folder]
-                    break
-            print("Folder name not found.")
-            logging.debug(f"Folder name not found. {datetime.now()}")
-        logging.debug(f"__init__ - self.inbox: {self.inbox} {datetime.now()}")
+    # Rebuild a session whose Outlook process went away
+    def reconnect(self):
+        logging.debug("reconnect")
+        self.last_error = None
+        self.connect()
+
+    def _fetch_item(self, o_id, o_store_id):
+        with self.metrics.span("GetItemFromID"):
+            return self.ns.GetItemFromID(o_id, o_store_id)
 
-    def close(self):
-        # Sync all folders in the inbox and outbox
+    def _get_item(self, o_id, o_store_id):
+        return self.retry.call(self._fetch_item, o_id, o_store_id)
+
+    # Run counters next to the spans, written as JSON or .prom text
+    def write_metrics(self, path):
+        self.metrics.counters.update(
+            retries=self.retry.retries,
+            skipped=self.skipped,
+            sender_cache_hits=self.senders.hits,
+            sender_cache_misses=self.senders.misses,
+        )
+        self.metrics.write(path)
+
+    # Keep reading when one item fails for good; a dead session still raises
+    def _guarded(self, what, function, *args, key=None):
         try:
-            self.ns.SendAndReceive(True)
-            self.outlook.Session.SendAndReceive(True)
+            return self.retry.call(function, *args)
         except Exception as ex:
-            logging.error(
-                f"ns.SendAndReceive close {ex.args} {datetime.now()}"
-            )
+            if is_dead(ex):
+                raise
+            self.skipped += 1
+            if key is not None:
+                self._skip(key)
+            logging.error("Skipped %s\n%s", what, ex.args)
+            return None
+
+    # Remember a skipped item; key() reads its (EntryID, StoreID)
+    def _skip(self, key):
+        try:
+            self.skipped_ids.append(key())
+        except Exception as ex:
+            logging.error("Skipped item has no EntryID\n%s", ex.args)
+
+    def close(self, quit=True):
+        # Push what this session sent out of the Outbox before quitting
+        try:
+            if self.sent and self.sync_policy != "none":
+                self.sync.start(policy="full")
+            self.sync.wait()
+        except Exception as ex:
+            logging.error("sync close %s", ex.args)
 
         # close the MAPI object
-        self.outlook.Application.Quit()
+        if quit:
+            self.outlook.Application.Quit()
 
-        logging.debug(f"close - self.inbox: {self.inbox} {datetime.now()}")
+        logging.debug("close - self.inbox: %s", self.inbox)
 
     def clean_string(self, string):
         string = str(
@@ -67,127 +398,492 @@ class Outlook:
 
     # End of auxiliar functions
 
-    # Get email items
-    def get_emails(self, o_filter, folder_path):
-        self.o_filter = o_filter
-        logging.debug(
-            f"get_emails - self.o_filter: {self.o_filter} {datetime.now()}"
-        )
+    # Read the body/html/attachments/sender fields that need the full item
+    def _read_item_fields(self, message, row, needed, message_class=None):
+        if "body" in needed:
+            row["body"] = self.clean_string(message.Body)
+        if "html_body" in needed:
+            row["html_body"] = None
+            # Only appointments carry MeetingStatus, skip the probe for mail
+            if message_class is None or message_class.startswith(
+                "IPM.Appointment"
+            ):
+                try:
+                    if message.MeetingStatus == 1:
+                        row["html_body"] = self.clean_string(message.HTMLBody)
+                except Exception as ex:
+                    logging.error(
+                        "Message does not have MeetingStatus\n%s", ex.args
+                    )
+
+        if "attachments" in needed:
+            attachments_raw = message.Attachments
+            row["attachments"] = [att.FileName for att in attachments_raw]
+        return row
+
+    # Start format email
+    def _exchange_sender(self, row, open_item):
+        # Directory lookups only happen on a cache miss
+        smtp = self.senders.get(row["sender_add"])
+        if smtp is None:
+            try:
+                with self.metrics.span("GetExchangeUser"):
+                    smtp = self.retry.call(
+                        lambda: open_item().Sender.GetExchangeUser()
+                    ).PrimarySmtpAddress
+            except Exception as ex:
+                if is_dead(ex):
+                    raise
+                logging.error("Could not get Exchange usern%s", ex.args)
+                return
+            self.senders.put(row["sender_add"], smtp)
+        row["sender_add"] = smtp
+
+    # End format sender email
+
+    # Rows read property by property from each MailItem
+    def _rows_from_items(self, o_filter, needed, sort=None):
         # Getting folder email items
         self.messages = self.inbox.Items
-        filteredEmails = self.messages.Restrict(self.o_filter)
+        with self.metrics.span("Restrict"):
+            filteredEmails = self.messages.Restrict(o_filter)
         # Creating an object to access items inside the inbox of outlook.
         self.messages = filteredEmails
-        logging.debug(
-            f"Items in folder:\n{[x.Subject for x in self.messages]} {datetime.now()}"
-        )
-
-        # Columns for dataframe
-        df_columns = [
-            "id",
-            "store_id",
-            "receiver",
-            "cc",
-            "subject",
-            "body",
-            "attachments",
-            "attachments_count",
-            "received",
-            "sent",
-            "sender",
-            "sender_add",
-            "unread",
-            "html_body",
-        ]
+        if sort:
+            self.messages.Sort(f"[{sort[0]}]", sort[1])
 
+        properties = self._properties(needed)
         # To iterate through inbox emails using inbox.Items object.
-        df_rows = []
-        for message in self.messages:
-            id = message.EntryID
-            store_id = message.Parent.StoreID
-            receiver = message.To
-            cc = message.CC
-            subject = message.Subject
-            body = self.clean_string(message.Body)
-            html_body = None
-            try:
-                if message.MeetingStatus == 1:
-                    html_body = self.clean_string(message.HTMLBody)
-            except Exception as ex:
-                logging.error(
-                    f"Message does not have MeetingStatus\n{ex.args} {datetime.now()}"
+        store_id = self.inbox.StoreID
+        for message in self._walk(self.messages, sort):
+            with self.metrics.span("item"):
+                row = self._guarded(
+                    "item",
+                    self._item_row,
+                    message,
+                    properties,
+                    needed,
+                    key=lambda: (message.EntryID, store_id),
                 )
+            if row is not None:
+                yield row
 
-            attachments_raw = message.Attachments
-            attachments = [att.FileName for att in attachments_raw]
-            attachments_count = len(attachments)
-            received = message.ReceivedTime.strftime("%m/%d/%y %H:%M:%S")
-            sent = message.SentOn.strftime("%m/%d/%y %H:%M:%S")
-            sender = message.SenderName
-            sender_add = message.SenderEmailAddress
-            # Start format email
-            if message.SenderEmailType == "EX":
-                try:
-                    sender_add = (
-                        message.Sender.GetExchangeUser().PrimarySmtpAddress
-                    )
-                except Exception as ex:
-                    logging.error(
-                        f"Could not get Exchange usern{ex.args} {datetime.now()}"
+    # Rows of known items, opened one by one
+    def _rows_for_ids(self, o_ids, needed):
+        properties = self._properties(needed)
+        for o_id, o_store_id in o_ids:
+            with self.metrics.span("item"):
+                row = self._guarded(
+                    o_id,
+                    lambda: self._item_row(
+                        self._fetch_item(o_id, o_store_id), properties, needed
+                    ),
+                    key=lambda: (o_id, o_store_id),
+                )
+            if row is not None:
+                yield row
+
+    def _properties(self, needed):
+        return [
+            (column, prop)
+            for column, prop in ITEM_PROPERTIES.items()
+            if column in needed
+        ]
+
+    # Sorted Items are only read in order through GetFirst/GetNext
+    def _walk(self, items, sort):
+        if not sort:
+            yield from items
+            return
+        message = items.GetFirst()
+        while message is not None:
+            yield message
+            message = items.GetNext()
+
+    def _item_row(self, message, properties, needed):
+        row = {column: getattr(message, prop) for column, prop in properties}
+        if "store_id" in needed:
+            row["store_id"] = message.Parent.StoreID
+        self._read_item_fields(message, row, needed)
+        if "sender_add" in needed and row["sender_type"] == "EX":
+            self._exchange_sender(row, lambda: message)
+        return row
+
+    # Rows read in bulk through Folder.GetTable
+    def _rows_from_table(self, o_filter, needed, sort=None, limit=None):
+        with self.metrics.span("Restrict"):
+            table = self.inbox.GetTable(o_filter)
+        if sort:
+            table.Sort(sort[0], sort[1])
+        # A small limit is read in one short batch
+        batch_size = min(TABLE_BATCH_SIZE, limit or TABLE_BATCH_SIZE)
+        columns = table.Columns
+        columns.RemoveAll()
+        # EntryID is always read: it is the key to open the full item
+        names = ["id"] + [
+            column
+            for column in ITEM_PROPERTIES
+            if column in needed and column != "id"
+        ]
+        table_columns = [ITEM_PROPERTIES[column] for column in names]
+        if "html_body" in needed:
+            table_columns.append("MessageClass")
+        for column in table_columns:
+            columns.Add(column)
+        # Every row comes from the same folder, so from the same store
+        store_id = self.inbox.StoreID
+        item_fields = needed & ITEM_ONLY_COLUMNS
+
+        while not table.EndOfTable:
+            with self.metrics.span("GetArray"):
+                batch = self.retry.call(table.GetArray, batch_size)
+            for values in batch:
+                row = dict(zip(names, values))
+                if "store_id" in needed:
+                    row["store_id"] = store_id
+                message_class = values[-1] if "html_body" in needed else None
+                with self.metrics.span("item"):
+                    row = self._guarded(
+                        row["id"],
+                        self._complete_row,
+                        row,
+                        store_id,
+                        needed,
+                        item_fields,
+                        message_class,
+                        key=lambda: (row["id"], store_id),
                     )
+                if row is not None:
+                    yield row
+
+    def _complete_row(self, row, store_id, needed, item_fields, message_class):
+        # Open the MailItem only for what the table cannot give
+        message = None
+        if item_fields:
+            message = self._fetch_item(row["id"], store_id)
+            self._read_item_fields(message, row, needed, message_class)
+        if "sender_add" in needed and row["sender_type"] == "EX":
+            self._exchange_sender(
+                row,
+                lambda: message or self._fetch_item(row["id"], store_id),
+            )
+        return row
+
+    # Row as written to df.xlsx
+    def _format_row(self, row, columns=DF_COLUMNS):
+        new_row = []
+        for column in columns:
+            if column == "attachments":
+                value = "|".join(row["attachments"])
+            elif column == "attachments_count":
+                value = len(row["attachments"])
+            elif column in ("received", "sent"):
+                value = row[column].strftime(DATE_FORMAT)
+            else:
+                value = row[column]
+            new_row.append(value)
 
-            # End format sender email
-            unread = message.UnRead
-
-            new_row = [
-                id,
-                store_id,
-                receiver,
-                cc,
-                subject,
-                body,
-                "|".join(attachments),
-                attachments_count,
-                received,
-                sent,
-                sender,
-                sender_add,
-                unread,
-                html_body,
-            ]
-
-            # Check if any empty value
-            verified_row = ["empty" if x == "" else x for x in new_row]
-            df_rows.append(verified_row)
-
-        df = pd.DataFrame(df_rows, columns=df_columns)
-        df.to_excel(f"{folder_path}/df.xlsx", index=False, encoding="utf-8")
-        logging.debug(f"get_emails - COMPLETED {datetime.now()}")
+        # Check if any empty value
+        return ["empty" if x == "" else x for x in new_row]
+
+    # Row for columnar writers: dates and attachment lists stay typed
+    def _typed_row(self, row, columns=DF_COLUMNS):
+        return [
+            (
+                len(row["attachments"])
+                if column == "attachments_count"
+                else row[column]
+            )
+            for column in columns
+        ]
+
+    def _indexed_rows(self, rows, index):
+        folder = self.inbox.FolderPath
+        for row in rows:
+            index.add(row, folder)
+            yield row
+
+    # Drop rows already exported by a previous incremental run
+    def _new_rows(self, rows, watermark):
+        previous = Watermark(watermark.received, watermark.entry_ids)
+        for row in rows:
+            if previous.is_new(row["received"], row["id"]):
+                watermark.advance(row["received"], row["id"])
+                yield row
+
+    # Fields to read from Outlook, including those columns derive from
+    def _needed(self, columns):
+        unknown = set(columns) - set(DF_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        needed = set(columns)
+        if "attachments_count" in needed:
+            needed.add("attachments")
+        if "sender_add" in needed:
+            needed.add("sender_type")
+        return needed
+
+    # Rows of the filtered folder, generated lazily
+    def _select_rows(
+        self,
+        o_filter,
+        needed,
+        read_mode="items",
+        limit=None,
+        sort_by=None,
+        descending=False,
+        watermark=None,
+    ):
+        sort = None
+        if sort_by:
+            if sort_by not in ITEM_PROPERTIES:
+                raise ValueError(f"Cannot sort by: {sort_by}")
+            sort = (ITEM_PROPERTIES[sort_by], descending)
+        self.skipped = 0
+        self.skipped_ids = []
+        if read_mode == "table":
+            rows = self._rows_from_table(o_filter, needed, sort, limit)
+        elif read_mode == "items":
+            rows = self._rows_from_items(o_filter, needed, sort)
+        else:
+            raise ValueError(f"Unknown read mode: {read_mode}")
+        if watermark is not None:
+            rows = self._new_rows(rows, watermark)
+        if limit:
+            # No item past the limit is read
+            rows = itertools.islice(rows, limit)
+        return rows
+
+    # Stream matching emails as MailRecord objects, nothing written to disk
+    def iter_emails(
+        self,
+        o_filter,
+        columns=None,
+        read_mode="table",
+        limit=None,
+        sort_by=None,
+        descending=False,
+    ):
+        columns = set(columns or ITEM_PROPERTIES)
+        unknown = columns - set(MailRecord.COLUMNS) - MAIL_RECORD_LAZY
+        if unknown:
+            raise ValueError(f"Unknown columns: {sorted(unknown)}")
+        # Body, HTML body and attachments load on first access
+        needed = (columns - MAIL_RECORD_LAZY) | {"id", "store_id"}
+        if "sender_add" in needed:
+            needed.add("sender_type")
+        rows = self._select_rows(
+            o_filter, needed, read_mode, limit, sort_by, descending
+        )
+        for row in rows:
+            yield MailRecord(row, self._load_field)
+
+    def _load_field(self, record, field):
+        message = self._get_item(record.id, record.store_id)
+        row = self._read_item_fields(message, {}, {field})
+        return row[field]
+
+    # Get email items
+    def get_emails(
+        self,
+        o_filter,
+        folder_path,
+        read_mode="items",
+        output_format="xlsx",
+        chunk_size=1000,
+        state_path=None,
+        columns=None,
+        limit=None,
+        sort_by=None,
+        descending=False,
+        index_path=None,
+    ):
+        self.o_filter = o_filter
+        columns = list(columns or DF_COLUMNS)
+        needed = self._needed(columns)
+        watermarks = None
+        if state_path and limit:
+            # The watermark only covers what was written: read oldest first
+            if (sort_by and sort_by != "received") or descending:
+                raise ValueError(
+                    "An incremental limit exports oldest first, "
+                    "sort_by received ascending only"
+                )
+            sort_by = "received"
+        if state_path:
+            # Incremental run: only read mail newer than the last export
+            watermarks = WatermarkStore(state_path)
+            watermark = watermarks.get(self.inbox.FolderPath)
+            self.o_filter = watermark.restrict_filter(self.o_filter)
+            needed.update(("id", "received"))
+        index = None
+        if index_path:
+            # Upsert every row read into the local search index
+            index = MailIndex(index_path)
+            needed.update(("id", "store_id"))
+        logging.debug("get_emails - self.o_filter: %s", self.o_filter)
+        rows = self._select_rows(
+            self.o_filter,
+            needed,
+            read_mode,
+            limit,
+            sort_by,
+            descending,
+            watermark if watermarks else None,
+        )
+        if watermarks and watermark.retry:
+            # Items skipped by the last run are behind the watermark
+            rows = itertools.chain(
+                self._rows_for_ids(sorted(watermark.retry), needed), rows
+            )
+        if index is not None:
+            rows = self._indexed_rows(rows, index)
+
+        try:
+            if output_format == "xlsx":
+                # pandas (and openpyxl) load only for xlsx exports
+                import pandas as pd
+
+                df_rows = [self._format_row(row, columns) for row in rows]
+                df = pd.DataFrame(df_rows, columns=columns)
+                df.to_excel(f"{folder_path}/df.xlsx", index=False)
+                self.metrics.count("rows_exported", len(df_rows))
+            else:
+                # Stream rows to disk chunk by chunk
+                with open_writer(
+                    output_format, folder_path, columns, chunk_size
+                ) as writer:
+                    to_row = (
+                        self._typed_row if writer.typed else self._format_row
+                    )
+                    for row in rows:
+                        writer.write(to_row(row, columns))
+                logging.debug(
+                    "get_emails - rows written: %s", writer.rows_written
+                )
+                self.metrics.count("rows_exported", writer.rows_written)
+        finally:
+            if index is not None:
+                # Rows read before a failure stay indexed
+                index.close()
+                logging.debug("get_emails - rows indexed: %s", index.upserted)
+        if watermarks:
+            watermark.retry = set(self.skipped_ids)
+            watermarks.save()
+        self.senders.save()
+        logging.debug("get_emails - sender cache %s", self.senders.stats())
+        logging.debug(
+            "get_emails - COMPLETED, %s skipped, %s retries",
+            self.skipped,
+            self.retry.retries,
+        )
 
     # Get attachments
-    def get_attachments(self, o_id, o_store_id, folder_path, pattern):
-        message = self.ns.GetItemFromID(o_id, o_store_id)
+    def get_attachments(
+        self, o_id, o_store_id, folder_path, pattern, selector=None
+    ):
+        # Attachments are chosen on metadata before anything is saved
+        selector = selector or AttachmentSelector(pattern)
+        message = self._get_item(o_id, o_store_id)
         attachments = message.Attachments
+        saved = True
 
         if len(attachments) > 0:
             os.makedirs(folder_path, exist_ok=True)
             for attachment in attachments:
-                if (
-                    pattern.replace("*", "").lower() in str(attachment).lower()
-                    or pattern == "*"
-                ):
+                if selector.accepts(attachment):
                     try:
-                        attachment.SaveAsFile(
-                            f"{folder_path}/{str(attachment)}"
-                        )
+                        with self.metrics.span("SaveAsFile"):
+                            attachment.SaveAsFile(
+                                f"{folder_path}/{attachment.FileName}"
+                            )
 
                     except Exception as ex:
                         logging.error(
-                            f"Could not download item {str(attachment)}\n{ex.args} {datetime.now()}"
+                            "Could not download item %s\n%s",
+                            attachment,
+                            ex.args,
                         )
-                        os.remove(f"{folder_path}/{str(attachment)}")
+                        self.last_error = ex
+                        saved = False
+                        os.remove(f"{folder_path}/{attachment.FileName}")
+
+        logging.debug("get_attachments - COMPLETED")
+        return saved
+
+    # Items of an id list, or of the folder filtered by o_filter
+    def _bulk_items(self, o_filter, o_ids, on_error):
+        if o_ids is None:
+            yield from self.inbox.Items.Restrict(o_filter)
+            return
+        for o_id, o_store_id in o_ids:
+            try:
+                message = self._get_item(o_id, o_store_id)
+            except Exception as ex:
+                logging.error("Could not get item %s\n%s", o_id, ex.args)
+                on_error(o_id, ex)
+                continue
+            yield message
+
+    # Download the attachments of many emails in one pass
+    def get_attachments_bulk(
+        self,
+        folder_path,
+        pattern="*",
+        o_filter=None,
+        o_ids=None,
+        workers=4,
+        selector=None,
+    ):
+        selector = selector or AttachmentSelector(pattern)
+        os.makedirs(folder_path, exist_ok=True)
+        logging.debug("get_attachments_bulk - o_filter: %s", o_filter)
+
+        with AttachmentSink(folder_path, workers) as sink:
+            for message in self._bulk_items(
+                o_filter, o_ids, lambda o_id, ex: sink.failed(o_id, "", ex)
+            ):
+                self._stage_attachments(message, selector, sink)
 
-        logging.debug(f"get_attachments - COMPLETED {datetime.now()}")
+        logging.debug("get_attachments_bulk - COMPLETED %s", sink.counts)
+        return sink.counts
+
+    # COM work stays here, files are finished by the sink's pool
+    def _stage_attachments(self, message, selector, sink):
+        try:
+            entry_id = self.retry.call(lambda: message.EntryID)
+            attachments = self.retry.call(lambda: list(message.Attachments))
+        except Exception as ex:
+            if is_dead(ex):
+                raise
+            logging.error("Could not read attachments\n%s", ex.args)
+            sink.failed("", "", ex)
+            return
+        for attachment in attachments:
+            # A metadata read failing for good skips this attachment only
+            try:
+                if not self.retry.call(selector.accepts, attachment):
+                    continue
+                file_name = self.retry.call(lambda: attachment.FileName)
+            except Exception as ex:
+                if is_dead(ex):
+                    raise
+                logging.error(
+                    "Could not select attachment of %s\n%s", entry_id, ex.args
+                )
+                sink.failed(entry_id, "", ex)
+                continue
+            staged_path = sink.staging_path(file_name)
+            try:
+                with self.metrics.span("SaveAsFile"):
+                    attachment.SaveAsFile(staged_path)
+            except Exception as ex:
+                logging.error(
+                    "Could not download item %s\n%s", file_name, ex.args
+                )
+                sink.failed(entry_id, file_name, ex)
+                continue
+            sink.submit(entry_id, file_name, staged_path)
 
     # Send new email
     def send_email(
@@ -208,31 +904,110 @@ class Outlook:
 
             if o_from:
                 email.SentOnBehalfOfName = o_from
-                logging.debug(
-                    f"send_email - o_from: {o_from} {datetime.now()}"
-                )
+                logging.debug("send_email - o_from: %s", o_from)
 
             # Add attachments if any
             if o_att_path:
-                logging.debug(
-                    f"send_email - o_att_path: {o_att_path} {datetime.now()}"
-                )
+                logging.debug("send_email - o_att_path: %s", o_att_path)
                 for path in o_att_path:
                     email.Attachments.Add(path)
 
-            email.Send()
+            with self.metrics.span("Send"):
+                email.Send()
+            self.sent += 1
 
-            logging.debug(f"send_email - COMPLETED {datetime.now()}")
+            logging.debug("send_email - COMPLETED")
+            return True
 
         except Exception as ex:
-            logging.error(f"{ex.args} {datetime.now()}")
+            logging.error("%s", ex.args)
+            self.last_error = ex
+            return False
+
+    # Send one email per recipient row, filling {{field}} placeholders
+    def send_bulk(
+        self,
+        recipients_path,
+        o_from,
+        o_subj,
+        o_body,
+        o_html_body,
+        o_att_path,
+        results_path,
+        rate=30,
+    ):
+        recipients = read_records(recipients_path)
+        logging.debug(
+            "send_bulk - %s recipients from %s",
+            len(recipients),
+            recipients_path,
+        )
+        # Shared attachments are added once to a draft that every message
+        # is copied from, instead of being read from disk per recipient
+        template = self.outlook.CreateItem(0)
+        if o_from:
+            template.SentOnBehalfOfName = o_from
+        for path in o_att_path or ():
+            template.Attachments.Add(path)
+        template.Save()
+        limiter = RateLimiter(rate)
+        try:
+            with ResultWriter(results_path, SEND_RESULT_COLUMNS) as results:
+                for line, fields in enumerate(recipients, start=1):
+                    entry = {"line": line, "to": fields.get("to")}
+                    email = None
+                    try:
+                        if not entry["to"]:
+                            raise ValueError("Recipient row without a to")
+                        entry["subject"] = render(o_subj, fields)
+                        body = render(o_body, fields)
+                        html_body = render(o_html_body, fields)
+                        limiter.wait()
+                        email = template.Copy()
+                        email.To = entry["to"]
+                        if fields.get("cc"):
+                            email.CC = fields["cc"]
+                        email.Subject = entry["subject"]
+                        if body:
+                            email.Body = body
+                        else:
+                            email.HTMLBody = html_body
+                        # Per recipient attachments, | separated
+                        for path in (fields.get("attachments") or "").split(
+                            "|"
+                        ):
+                            if path:
+                                email.Attachments.Add(path)
+                        with self.metrics.span("Send"):
+                            email.Send()
+                    except Exception as ex:
+                        logging.error(
+                            "send_bulk line %s failed\n%s", line, ex.args
+                        )
+                        results.write(entry, "error", str(ex))
+                        if email is not None:
+                            self._discard(email)
+                    else:
+                        self.sent += 1
+                        results.write(entry, "ok")
+        finally:
+            template.Delete()
+        logging.debug("send_bulk - COMPLETED %s", results.counts)
+        return results.counts
+
+    # Drop a copy Send refused, so no draft is left behind
+    def _discard(self, email):
+        try:
+            email.Delete()
+        except Exception as ex:
+            logging.error("Could not delete unsent copy\n%s", ex.args)
 
     # Reply to email
     def reply_to_email(
         self, o_id, o_store_id, o_body, o_html_body, o_att_path
     ):
         try:
-            message = self.ns.GetItemFromID(o_id, o_store_id)
+            message = self._get_item(o_id, o_store_id)
             reply = message.Reply()
             importance = "Low"
             if message.Importance == 1:
@@ -258,88 +1033,209 @@ class Outlook:
                 for path in o_att_path:
                     reply.Attachments.Add(path)
 
-            reply.Send()
+            with self.metrics.span("Send"):
+                reply.Send()
+            self.sent += 1
 
-            logging.debug(f"reply_to_email - COMPLETED {datetime.now()}")
+            logging.debug("reply_to_email - COMPLETED")
+            return True
 
         except Exception as ex:
-            logging.error(f"{ex.args} {datetime.now()}")
+            logging.error("%s", ex.args)
+            self.last_error = ex
+            return False
 
-    # Save email as file
-    def save_email(self, o_id, o_store_id, folder_path):
-        message = self.ns.GetItemFromID(o_id, o_store_id)
-        logging.debug(
-            f"save_email - folder_path: {folder_path} {datetime.now()}"
-        )
-        filename = re.sub("\W", "_", message.Subject)
+    # Save email as file, named by email_archive.archive_name
+    def save_email(self, o_id, o_store_id, folder_path, save_format="msg"):
+        message = self._get_item(o_id, o_store_id)
+        logging.debug("save_email - folder_path: %s", folder_path)
         try:
-            message.SaveAs(os.path.join(folder_path, f"{filename}.msg"))
+            self._save_as(
+                message,
+                folder_path,
+                message.ReceivedTime,
+                message.Subject,
+                save_format,
+            )
         except Exception as ex:
-            logging.error(f"Could not save email\n{ex.args} {datetime.now()}")
+            logging.error("Could not save email\n%s", ex.args)
+            self.last_error = ex
+            return False
+
+        logging.debug("save_email - COMPLETED")
+        return True
+
+    # Save every matching email in one session, skipping saved ones
+    def save_emails_bulk(
+        self, folder_path, o_filter=None, o_ids=None, save_format="msg"
+    ):
+        if save_format not in SAVE_FORMATS:
+            raise ValueError(f"Unknown save format: {save_format}")
+        os.makedirs(folder_path, exist_ok=True)
+        logging.debug("save_emails_bulk - o_filter: %s", o_filter)
+        archived = archived_hashes(folder_path, save_format)
+        counts = {"saved": 0, "skipped": 0, "failed": 0}
+        if o_ids is None:
+            # Names come from the table, items are only opened to save
+            rows = self._select_rows(
+                o_filter, {"id", "store_id", "subject", "received"}, "table"
+            )
+            candidates = ((row["id"], row["store_id"], row) for row in rows)
+        else:
+            candidates = (
+                (o_id, o_store_id, None) for o_id, o_store_id in o_ids
+            )
 
-        logging.debug(f"save_email - COMPLETED {datetime.now()}")
+        for o_id, o_store_id, row in candidates:
+            # Already archived items are never opened
+            if entry_hash(o_id) in archived:
+                counts["skipped"] += 1
+                continue
+            saved = self._guarded(
+                o_id,
+                self._save_item,
+                o_id,
+                o_store_id,
+                row,
+                folder_path,
+                save_format,
+            )
+            if saved is None:
+                counts["failed"] += 1
+                continue
+            archived.add(entry_hash(o_id))
+            counts["saved"] += 1
+
+        logging.debug("save_emails_bulk - COMPLETED %s", counts)
+        return counts
+
+    def _save_item(self, o_id, o_store_id, row, folder_path, save_format):
+        message = self._fetch_item(o_id, o_store_id)
+        if row is None:
+            row = {
+                "received": message.ReceivedTime,
+                "subject": message.Subject,
+            }
+        return self._save_as(
+            message, folder_path, row["received"], row["subject"], save_format
+        )
+
+    # SaveAs to a partial name first, so a crash never looks archived
+    def _save_as(self, message, folder_path, received, subject, save_format):
+        save_type, extension = SAVE_FORMATS[save_format]
+        path = os.path.join(
+            folder_path,
+            archive_name(received, subject, message.EntryID, save_format),
+        )
+        partial_path = path[: -len(extension)] + PARTIAL + extension
+        with self.metrics.span("SaveAs"):
+            message.SaveAs(partial_path, save_type)
+        os.replace(partial_path, path)
+        return path
 
     # Move email to folder
     def move_email(self, o_id, o_store_id, o_new_folder):
-        message = self.ns.GetItemFromID(o_id, o_store_id)
-        logging.debug(
-            f"move_email - o_new_folder: {o_new_folder} {datetime.now()}"
-        )
+        message = self._get_item(o_id, o_store_id)
+        logging.debug("move_email - o_new_folder: %s", o_new_folder)
 
         try:
-            if self.o_mailbox:
-                message.Move(
-                    self.ns.Folders[self.o_mailbox]
-                    .Folders["Inbox"]
-                    .Folders[o_new_folder]
-                )
-            else:
-                message.Move(self.ns.GetDefaultFolder(6).Folders[o_new_folder])
-            logging.debug(f"move_email - COMPLETED {datetime.now()}")
+            folder = self.folders.resolve(o_new_folder)
+            moved = message.Move(folder)
+            self._reindex(o_id, o_store_id, moved, folder)
+            logging.debug("move_email - COMPLETED")
+            return True
 
         except Exception as ex:
-            logging.error(f"Could not move email\n{ex.args} {datetime.now()}")
+            logging.error("Could not move email\n%s", ex.args)
+            self.last_error = ex
+            # The cached folder may be gone or a new one created: look again
+            self.folders.clear()
+            return False
 
     # Mark email item as read
     def mark_email(self, o_id, o_store_id):
-        message = self.ns.GetItemFromID(o_id, o_store_id)
+        message = self._get_item(o_id, o_store_id)
         try:
             message.UnRead = False
-            logging.debug(f"mark_email - COMPLETED {datetime.now()}")
+            logging.debug("mark_email - COMPLETED")
+            return True
         except Exception as ex:
-            logging.error(f"Could not mark email\n{ex.args} {datetime.now()}")
+            logging.error("Could not mark email\n%s", ex.args)
+            self.last_error = ex
+            return False
 
     # Delete email item
     def delete_email(self, o_id, o_store_id):
-        message = self.ns.GetItemFromID(o_id, o_store_id)
+        message = self._get_item(o_id, o_store_id)
         try:
             message.Delete()
-            logging.debug(f"delete_email - COMPLETED {datetime.now()}")
+            self._reindex(o_id, o_store_id)
+            logging.debug("delete_email - COMPLETED")
+            return True
         except Exception as ex:
-            logging.error(
-                f"Could not delete email\n{ex.args} {datetime.now()}"
-            )
+            logging.error("Could not delete email\n%s", ex.args)
+            self.last_error = ex
+            return False
 
+    # Re-key a moved message in the index, drop a deleted one
+    def _reindex(self, o_id, o_store_id, moved=None, folder=None):
+        if not self.index_path:
+            return
+        try:
+            with MailIndex(self.index_path) as index:
+                if moved is None:
+                    index.remove(o_id, o_store_id)
+                else:
+                    index.move(
+                        o_id, o_store_id, moved.EntryID, folder.FolderPath
+                    )
+        except sqlite3.Error as ex:
+            # The mailbox changed; a stale index row is not worth failing
+            logging.error("Could not update index\n%s", ex.args)
 
-# MAIN function
-if __name__ == "__main__":
-    # Get user
-    user = os.getlogin()
-    logging.basicConfig(
-        filename=f"C:/Users/{user}/AppData/Local/Temp/email_actions.log",
-        level=logging.DEBUG,
-    )
-    # Get today's date
-    today = datetime.now()
-    # Yesterday date
-    yesterday = (
-        (today - timedelta(days=3))
-        .strftime("%Y-X%m-X%d")
-        .replace("X0", "")
-        .replace("X", "")
-    )
-    today = today.strftime("%Y-X%m-X%d").replace("X0", "").replace("X", "")
+    # Run one manifest entry, raising when the action did not succeed
+    def _run_batch_entry(self, entry, defaults, folder_path):
+        spec = ACTIONS.get(entry["action"])
+        if spec is None or not spec.batch:
+            raise ValueError(f"Unknown batch action: {entry['action']}")
+        params = entry["params"]
+        args = argparse.Namespace(**vars(defaults))
+        args.email_action = entry["action"]
+        args.email_id = entry["id"]
+        args.email_store_id = entry["store_id"]
+        args.folder_path = params.get("folder_path", folder_path)
+        args.att_pattern = params.get("pattern", "*")
+        args.mailbox_new_folder = params.get("new_folder")
+        args.save_format = params.get("save_format", "msg")
+        self.last_error = None
+        if not spec.function(self, args):
+            raise self.last_error or RuntimeError(f"{spec.name} failed")
+
+    # Run every action of a manifest in this session
+    def run_batch(self, manifest_path, results_path, folder_path):
+        entries = plan(read_manifest(manifest_path), batch_actions())
+        logging.debug(
+            "run_batch - %s entries from %s", len(entries), manifest_path
+        )
+        # Option defaults for everything a manifest row does not set
+        defaults = build_parser("").parse_args([])
+        with ResultWriter(results_path) as results:
+            for entry in entries:
+                try:
+                    self._run_batch_entry(entry, defaults, folder_path)
+                except Exception as ex:
+                    logging.error(
+                        "Batch line %s failed\n%s", entry["line"], ex.args
+                    )
+                    results.write(entry, "error", str(ex))
+                else:
+                    results.write(entry, "ok")
+        logging.debug("run_batch - COMPLETED %s", results.counts)
+        return results.counts
 
+
+# Command line arguments, shared by the CLI and email_server clients
+def build_parser(user):
     # Set arguments
     parser = argparse.ArgumentParser()
     parser.add_argument("--mailbox", help="Mailbox", default=None)
@@ -351,8 +1247,34 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--mail_filter",
-        help="Mail filter",
-        default=f"[SentOn] > '{yesterday} 12:00 AM' AND [SentOn] < '{today} 11:59 PM' AND [Unread] = True",
+        help="Jet or @SQL= filter (default: unread, sent in the last 3 days)",
+        default=None,
+    )
+    parser.add_argument(
+        "--since", help="Received on or after YYYY-MM-DD[ HH:MM]"
+    )
+    parser.add_argument("--until", help="Received before YYYY-MM-DD[ HH:MM]")
+    parser.add_argument(
+        "--sender", help="Comma separated sender addresses or names"
+    )
+    parser.add_argument(
+        "--sender_domain", help="Comma separated sender domains"
+    )
+    parser.add_argument("--subject_contains", help="Phrase in the subject")
+    parser.add_argument("--body_contains", help="Phrase in the body")
+    parser.add_argument(
+        "--unread", help="Only unread mail", action="store_true"
+    )
+    parser.add_argument(
+        "--has_attachments",
+        help="Only mail with attachments",
+        action="store_true",
+    )
+    parser.add_argument("--category", help="Comma separated categories")
+    parser.add_argument(
+        "--content_index",
+        help="Match phrases with the Instant Search index (ci_phrasematch)",
+        action="store_true",
     )
     parser.add_argument(
         "--folder_path",
@@ -378,34 +1300,517 @@ if __name__ == "__main__":
         default=None,
     )
     parser.add_argument("--att_path", help="Attachment path", default=None)
+    parser.add_argument(
+        "--read_mode",
+        help="How get_emails reads items: items or table (bulk columns)",
+        choices=["items", "table"],
+        default="items",
+    )
+    parser.add_argument(
+        "--output_format",
+        help="get_emails output: xlsx or a streamed csv/jsonl/parquet/arrow",
+        choices=["xlsx", *STREAM_FORMATS],
+        default="xlsx",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        help="Rows per chunk for streamed outputs",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--limit", help="get_emails: stop after this many rows", type=int
+    )
+    parser.add_argument(
+        "--sort_by",
+        help="get_emails: column to sort by before reading",
+        choices=list(ITEM_PROPERTIES),
+        default=None,
+    )
+    parser.add_argument(
+        "--descending",
+        help="get_emails: sort newest/highest first",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Only export mail newer than the previous get_emails run",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--state_path",
+        help="Watermark file for --incremental and watch",
+        default=None,
+    )
+    parser.add_argument(
+        "--columns",
+        help="Comma separated get_emails columns, all when omitted",
+        default=None,
+    )
+    parser.add_argument(
+        "--sender_cache",
+        help="JSON file caching Exchange sender SMTP addresses between runs",
+        default=None,
+    )
+    parser.add_argument(
+        "--att_regex",
+        help="Regular expression attachment names must match",
+        default=None,
+    )
+    parser.add_argument(
+        "--att_min_size", help="Minimum attachment bytes", type=int
+    )
+    parser.add_argument(
+        "--att_max_size", help="Maximum attachment bytes", type=int
+    )
+    parser.add_argument(
+        "--att_types",
+        help="Comma separated OlAttachmentType values to keep (1 = file)",
+        default=None,
+    )
+    parser.add_argument(
+        "--skip_inline",
+        help="Skip inline/hidden attachments such as signature images",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--id_file",
+        help="CSV with id and store_id columns for bulk actions",
+        default=None,
+    )
+    parser.add_argument(
+        "--workers",
+        help="Threads finishing files in bulk actions",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--manifest", help="CSV/JSONL manifest for batch", default=None
+    )
+    parser.add_argument(
+        "--results_path",
+        help="Per item results of batch and send_bulk",
+        default=None,
+    )
+    parser.add_argument(
+        "--index",
+        help="get_emails: upsert rows into the local search index, "
+        "move_email/delete_email: keep it up to date",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--index_path",
+        help="SQLite index (default: {folder_path}/email_index.sqlite)",
+        default=None,
+    )
+    parser.add_argument(
+        "--query", help="query: FTS5 search over subject/body/attachments"
+    )
+    parser.add_argument(
+        "--targets",
+        help="CSV/JSONL of mailbox,folder[,filter] for get_emails_multi",
+        default=None,
+    )
+    parser.add_argument(
+        "--processes",
+        help="get_emails_multi: targets exported at the same time",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "--sync",
+        help="Mailbox sync on open: none, folder (working folder) or full",
+        choices=SYNC_POLICIES,
+        default="full",
+    )
+    parser.add_argument(
+        "--sync_async",
+        help="Sync in the background, waiting only before reading mail",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--metrics_path",
+        help="Write COM call timings here (.json, or .prom for Prometheus)",
+        default=None,
+    )
+    parser.add_argument(
+        "--recipients",
+        help="CSV/JSONL for send_bulk: to, cc, attachments and fields",
+        default=None,
+    )
+    parser.add_argument(
+        "--send_rate",
+        help="send_bulk messages per minute (0 = no limit)",
+        type=float,
+        default=30,
+    )
+    parser.add_argument(
+        "--save_format",
+        help="save_email(s_bulk): msg, mhtml (MIME) or html",
+        choices=list(SAVE_FORMATS),
+        default="msg",
+    )
+    parser.add_argument(
+        "--watch_actions",
+        help="watch: comma separated export, index, attachments, mark, move",
+        default="export",
+    )
+    parser.add_argument(
+        "--watch_seconds",
+        help="watch: stop after this many seconds (default: until Ctrl+C)",
+        type=float,
+        default=None,
+    )
+    parser.add_argument(
+        "--batch_size",
+        help="watch: new mail handled together",
+        type=int,
+        default=50,
+    )
+    parser.add_argument(
+        "--batch_wait",
+        help="watch: seconds a partial batch waits for more mail",
+        type=float,
+        default=5.0,
+    )
 
-    # Get argument values
-    args = parser.parse_args()
-    o_mailbox = args.mailbox
-    o_folder = args.mailbox_folder
-    o_new_folder = args.mailbox_new_folder
-    o_filter = args.mail_filter
-    folder_path = args.folder_path
-    action = args.email_action
-    o_id = args.email_id
-    o_store_id = args.email_store_id
-    pattern = args.att_pattern
-    o_from = args.from_address
-    o_to = args.to_address
-    o_cc = args.cc_address
-    o_subj = args.email_subject
-    o_body = args.email_body
-    o_html_body = args.email_html_body
-    o_att_path = args.att_path
-
-    if o_att_path:
-        if "," in o_att_path:
-            o_att_path = o_att_path.split(",")
+    return parser
+
+
+# Unread mail sent from three days ago to the end of today; an open ended
+# window has no end, for a watch that runs past midnight
+def default_filter(open_ended=False):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    end = None if open_ended else today + timedelta(days=1)
+    return (
+        MailFilter()
+        .sent_between(today - timedelta(days=3), end)
+        .unread()
+        .to_dasl()
+    )
+
+
+def parse_args(argv=None, user=None):
+    parser = build_parser(user or os.getlogin())
+    args = parser.parse_args(argv)
+    for name in ("sender", "sender_domain", "category"):
+        value = getattr(args, name)
+        if value:
+            setattr(args, name, [v.strip() for v in value.split(",") if v])
+    typed = from_args(args)
+    if typed:
+        if args.mail_filter:
+            if not args.mail_filter.startswith("@SQL="):
+                parser.error("typed filters only combine with @SQL= filters")
+            typed.clauses.insert(0, args.mail_filter[5:])
+        args.mail_filter = typed.to_dasl()
+    elif args.mail_filter is None:
+        args.mail_filter = default_filter(args.email_action == "watch")
+    if args.att_path:
+        if "," in args.att_path:
+            args.att_path = args.att_path.split(",")
         else:
-            o_att_path = [o_att_path]
+            args.att_path = [args.att_path]
+    if args.att_types:
+        args.att_types = [int(t) for t in args.att_types.split(",") if t]
+    if args.columns:
+        args.columns = [c.strip() for c in args.columns.split(",") if c]
+    if args.incremental and not args.state_path:
+        args.state_path = f"{args.folder_path}/email_actions_state.json"
+    elif args.email_action == "watch":
+        # Watch always resumes from its own watermark
+        if not args.state_path:
+            args.state_path = f"{args.folder_path}/email_watch_state.json"
+    elif not args.incremental:
+        args.state_path = None
+    args.watch_actions = [
+        a.strip() for a in args.watch_actions.split(",") if a.strip()
+    ]
+    if not args.index_path:
+        args.index_path = f"{args.folder_path}/email_index.sqlite"
+    return args
 
-    # Start script
-    attempts = 1
+
+class Action:
+    """
+    An email_action. session actions run as function(outlook, args) on an
+    open Outlook; the others as function(args). fresh ones wait for a
+    pending sync first; batch ones may appear in a manifest.
+    """
+
+    def __init__(self, name, function, session=True, fresh=True, batch=False):
+        self.name = name
+        self.function = function
+        self.session = session
+        self.fresh = fresh
+        self.batch = batch
+
+
+# Every email_action, shared by the CLI, email_server and run_batch
+ACTIONS = {}
+
+
+def action(name, session=True, fresh=True, batch=False):
+    """Register the decorated function as the email_action name."""
+
+    def register(function):
+        ACTIONS[name] = Action(name, function, session, fresh, batch)
+        return function
+
+    return register
+
+
+def find_action(name):
+    try:
+        return ACTIONS[name]
+    except KeyError:
+        raise ValueError(f"Unknown email action: {name}")
+
+
+# Actions a manifest can request, in the order they run for an item
+def batch_actions():
+    return [name for name, spec in ACTIONS.items() if spec.batch]
+
+
+def _selector(args):
+    return AttachmentSelector(
+        args.att_pattern,
+        args.att_regex,
+        args.att_min_size,
+        args.att_max_size,
+        args.att_types,
+        args.skip_inline,
+    )
+
+
+# Run the action requested in args on an open Outlook session
+def run_action(outlook, args):
+    spec = find_action(args.email_action)
+    # Reading actions see the mailbox once a pending sync is done
+    if spec.fresh:
+        outlook.fresh()
+    return spec.function(outlook, args)
+
+
+@action("get_emails")
+def _get_emails(outlook, args):
+    outlook.get_emails(
+        args.mail_filter,
+        args.folder_path,
+        args.read_mode,
+        args.output_format,
+        args.chunk_size,
+        args.state_path,
+        args.columns,
+        args.limit,
+        args.sort_by,
+        args.descending,
+        args.index_path if args.index else None,
+    )
+
+
+@action("get_attachments", batch=True)
+def _get_attachments(outlook, args):
+    return outlook.get_attachments(
+        args.email_id,
+        args.email_store_id,
+        args.folder_path,
+        args.att_pattern,
+        _selector(args),
+    )
+
+
+@action("get_attachments_bulk")
+def _get_attachments_bulk(outlook, args):
+    outlook.get_attachments_bulk(
+        args.folder_path,
+        args.att_pattern,
+        args.mail_filter,
+        read_id_file(args.id_file) if args.id_file else None,
+        args.workers,
+        _selector(args),
+    )
+
+
+# Sending only adds mail and does not need a synced mailbox
+@action("send_email", fresh=False)
+def _send_email(outlook, args):
+    return outlook.send_email(
+        args.from_address,
+        args.to_address,
+        args.cc_address,
+        args.email_subject,
+        args.email_body,
+        args.email_html_body,
+        args.att_path,
+    )
+
+
+@action("send_bulk", fresh=False)
+def _send_bulk(outlook, args):
+    outlook.send_bulk(
+        args.recipients,
+        args.from_address,
+        args.email_subject,
+        args.email_body,
+        args.email_html_body,
+        args.att_path,
+        args.results_path or f"{args.folder_path}/send_results.csv",
+        args.send_rate,
+    )
+
+
+@action("reply_to_email")
+def _reply_to_email(outlook, args):
+    return outlook.reply_to_email(
+        args.email_id,
+        args.email_store_id,
+        args.email_body,
+        args.email_html_body,
+        args.att_path,
+    )
+
+
+@action("save_email", batch=True)
+def _save_email(outlook, args):
+    return outlook.save_email(
+        args.email_id, args.email_store_id, args.folder_path, args.save_format
+    )
+
+
+@action("save_emails_bulk")
+def _save_emails_bulk(outlook, args):
+    counts = outlook.save_emails_bulk(
+        args.folder_path,
+        args.mail_filter,
+        read_id_file(args.id_file) if args.id_file else None,
+        args.save_format,
+    )
+    if counts["failed"]:
+        raise RuntimeError(
+            f"{counts['failed']} emails could not be saved, see the log"
+        )
+
+
+@action("mark_email", batch=True)
+def _mark_email(outlook, args):
+    return outlook.mark_email(args.email_id, args.email_store_id)
+
+
+@action("move_email", batch=True)
+def _move_email(outlook, args):
+    if not args.mailbox_new_folder:
+        raise ValueError("move_email needs a new_folder")
+    return outlook.move_email(
+        args.email_id, args.email_store_id, args.mailbox_new_folder
+    )
+
+
+@action("delete_email", batch=True)
+def _delete_email(outlook, args):
+    return outlook.delete_email(args.email_id, args.email_store_id)
+
+
+@action("batch")
+def _batch(outlook, args):
+    outlook.run_batch(
+        args.manifest,
+        args.results_path or f"{args.folder_path}/batch_results.csv",
+        args.folder_path,
+    )
+
+
+@action("watch")
+def _watch(outlook, args):
+    from email_watch import Watcher
+
+    Watcher(
+        outlook,
+        args.folder_path,
+        args.state_path,
+        args.mail_filter,
+        args.watch_actions,
+        # Rows are appended as they arrive, so xlsx becomes csv
+        (
+            args.output_format
+            if args.output_format in STREAM_FORMATS
+            else "csv"
+        ),
+        args.columns,
+        args.batch_size,
+        args.batch_wait,
+        selector=_selector(args),
+        new_folder=args.mailbox_new_folder,
+        index_path=args.index_path,
+        workers=args.workers,
+    ).run(args.watch_seconds)
+
+
+# Fan get_emails out over the targets file, one worker process each
+@action("get_emails_multi", session=False)
+def run_targets(args):
+    from email_fanout import export_targets, read_targets
+
+    results = export_targets(
+        read_targets(args.targets),
+        args.folder_path,
+        {
+            "o_filter": args.mail_filter,
+            "read_mode": args.read_mode,
+            "chunk_size": args.chunk_size,
+            "columns": args.columns,
+            "limit": args.limit,
+            "sort_by": args.sort_by,
+            "descending": args.descending,
+        },
+        args.output_format,
+        args.processes,
+        args.results_path,
+        sync=args.sync,
+    )
+    failed = [entry for entry in results if entry["status"] != "ok"]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(results)} targets failed")
+    return results
+
+
+# Search the local index, results to query_results.csv
+@action("query", session=False)
+def run_query(args):
+    with MailIndex(args.index_path) as index:
+        results = index.search(
+            args.query,
+            args.sender,
+            parse_date(args.since) if args.since else None,
+            parse_date(args.until) if args.until else None,
+            args.limit or 50,
+        )
+    with open(
+        f"{args.folder_path}/query_results.csv",
+        "w",
+        newline="",
+        encoding="utf-8",
+    ) as f:
+        writer = csv.DictWriter(f, INDEX_RESULT_COLUMNS + ["rank"])
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"{len(results)} messages")
+    return results
+
+
+# Status files read by the calling RPA flow
+def write_status(folder_path, ex=None):
+    if ex is None:
+        with open(f"{folder_path}/get_mail.txt", "w", encoding="utf-8") as f:
+            f.write("Done")
+            print("Done!")
+    else:
+        with open(f"{folder_path}/error.txt", "w", encoding="utf-8") as f:
+            logging.error("%s", ex.args)
+            f.write(str(ex))
+
+
+def prepare_folder(folder_path):
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
@@ -413,53 +1818,89 @@ if __name__ == "__main__":
     if os.path.exists(f"{folder_path}/error.txt"):
         os.remove(f"{folder_path}/error.txt")
 
-    # Attempt to run script only 3 times
-    while attempts < 4:
-        # Init object
-        outlook = Outlook(o_mailbox, o_folder)
+
+def main(argv=None):
+    # Get user
+    user = os.getlogin()
+    logging.basicConfig(
+        filename=f"C:/Users/{user}/AppData/Local/Temp/email_actions.log",
+        level=logging.DEBUG,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    args = parse_args(argv, user)
+    folder_path = args.folder_path
+
+    # Start script
+    attempts = 1
+    prepare_folder(folder_path)
+
+    try:
+        spec = find_action(args.email_action)
+    except ValueError as ex:
+        write_status(folder_path, ex)
+        return
+    # Answered without Outlook, no session is opened
+    if not spec.session:
         try:
-            # Choose action
-            if action == "get_emails":
-                outlook.get_emails(o_filter, folder_path)
-            elif action == "get_attachments":
-                outlook.get_attachments(o_id, o_store_id, folder_path, pattern)
-            elif action == "send_email":
-                outlook.send_email(
-                    o_from, o_to, o_cc, o_subj, o_body, o_html_body, o_att_path
-                )
-            elif action == "reply_to_email":
-                outlook.reply_to_email(
-                    o_id, o_store_id, o_body, o_html_body, o_att_path
-                )
-            elif action == "save_email":
-                outlook.save_email(o_id, o_store_id, folder_path)
-            elif action == "mark_email":
-                outlook.mark_email(o_id, o_store_id)
-            elif action == "move_email":
-                outlook.move_email(o_id, o_store_id, o_new_folder)
-            elif action == "delete_email":
-                outlook.delete_email(o_id, o_store_id)
-
-        # Catch exception
+            spec.function(args)
         except Exception as ex:
-            logging.error(f"Could perform action\n{ex.args} {datetime.now()}")
-            with open(f"{folder_path}/error.txt", "w", encoding="utf-8") as f:
-                logging.error(f"{ex.args} {datetime.now()}")
-                f.write(str(ex))
+            write_status(folder_path, ex)
+        else:
+            write_status(folder_path)
+        return
+    retry = RetryPolicy()
+    outlook = None
+
+    # Busy calls are retried inside the session; the session itself is
+    # only rebuilt when Outlook went away, at most 3 times
+    try:
+        while attempts < 4:
+            try:
+                if outlook is None:
+                    outlook = Outlook(
+                        args.mailbox,
+                        args.mailbox_folder,
+                        sender_cache=SenderCache(path=args.sender_cache),
+                        retry=retry,
+                        sync=args.sync,
+                        sync_async=args.sync_async,
+                        index_path=args.index_path if args.index else None,
+                    )
+                else:
+                    outlook.reconnect()
+                run_action(outlook, args)
+                # Actions returning False keep their error in last_error
+                if is_dead(outlook.last_error):
+                    raise outlook.last_error
+
+            # Catch exception
+            except Exception as ex:
+                logging.error("Could perform action\n%s", ex.args)
+                write_status(folder_path, ex)
+                if outlook is not None and not is_dead(ex):
+                    break
                 attempts += 1
+                retry.wait(attempts)
 
-        # Action if completed successfully
-        else:
-            with open(
-                f"{folder_path}/get_mail.txt", "w", encoding="utf-8"
-            ) as f:
-                f.write("Done")
-                print("Done!")
+            # Action if completed successfully
+            else:
+                write_status(folder_path)
                 break
 
-        # Close Outlook instance
-        finally:
-            outlook.close()
+            logging.debug("PROCESS LOOP FINISHED\n")
 
-        logging.debug(f"PROCESS LOOP FINISHED {datetime.now()}\n")
-    logging.debug(f"PROCESS FINISHED {datetime.now()}\n\n\n")
+    # Close Outlook instance
+    finally:
+        if outlook is not None:
+            if args.metrics_path:
+                outlook.write_metrics(args.metrics_path)
+            try:
+                outlook.close()
+            except Exception as ex:
+                logging.error("close %s", ex.args)
+    logging.debug("PROCESS FINISHED\n\n\n")
+
+
+# MAIN function
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+File names and formats for mail saved with MailItem.SaveAs.
+Names are date, subject and a 64-bit hash of the EntryID, so two messages
+never share a file and a re-run can tell which ones are already saved
+without opening them.
+"""
+import hashlib
+import os
+import re
+
+# OlSaveAsType value and extension of each archive format
+SAVE_FORMATS = {
+    "msg": (9, ".msg"),  # olMSGUnicode
+    "mhtml": (10, ".mht"),  # olMHTML, the MIME format Outlook writes
+    "html": (5, ".html"),  # olHTML
+}
+
+# Marks a file SaveAs has not finished, never counted as archived
+PARTIAL = ".partial"
+
+ARCHIVE_NAME = re.compile(r"_([0-9a-f]{16})(\.msg|\.mht|\.html)$")
+
+
+def entry_hash(entry_id):
+    return hashlib.sha1(entry_id.encode("ascii")).hexdigest()[:16]
+
+
+def archive_name(received, subject, entry_id, save_format="msg"):
+    """<received>_<subject>_<hash16>.<ext>, safe on any file system."""
+    subject = re.sub(r"\W+", "_", subject or "").strip("_")[:60]
+    return (
+        f"{received:%Y%m%d_%H%M%S}_{subject or 'no_subject'}_"
+        f"{entry_hash(entry_id)}{SAVE_FORMATS[save_format][1]}"
+    )
+
+
+def archived_hashes(folder_path, save_format="msg"):
+    """EntryID hashes of the messages already saved in folder_path."""
+    if not os.path.isdir(folder_path):
+        return set()
+    extension = SAVE_FORMATS[save_format][1]
+    hashes = set()
+    for name in os.listdir(folder_path):
+        match = ARCHIVE_NAME.search(name)
+        if match and match.group(2) == extension and PARTIAL not in name:
+            hashes.add(match.group(1))
+    return hashes
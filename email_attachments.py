@@ -0,0 +1,241 @@
+"""
+Attachment handling for bulk downloads.
+COM calls (SaveAsFile) stay on the caller's thread; hashing, dedupe and
+moving files into place run on a thread pool.
+"""
+import csv
+import fnmatch
+import hashlib
+import logging
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_COLUMNS = ["id", "file_name", "saved_as", "sha256", "size", "status"]
+
+
+# OlAttachmentType values
+OL_BY_VALUE = 1
+OL_BY_REFERENCE = 4
+OL_EMBEDDED_ITEM = 5
+OL_OLE = 6
+
+# Set on inline images such as signature logos
+PR_ATTACHMENT_HIDDEN = "http://schemas.microsoft.com/mapi/proptag/0x7FFE000B"
+# The id an HTML body shows an attachment by, as src="cid:<id>"
+PR_ATTACH_CONTENT_ID = "http://schemas.microsoft.com/mapi/proptag/0x3712001F"
+
+
+class AttachmentSelector:
+    """
+    Chooses attachments from their metadata only (FileName, Size, Type,
+    hidden flag), so rejected ones are never pulled from the store.
+    Patterns are globs matched against the whole file name; a pattern
+    without wildcards keeps the old substring match.
+    """
+
+    def __init__(
+        self,
+        patterns=("*",),
+        regex=None,
+        min_size=None,
+        max_size=None,
+        types=None,
+        skip_inline=False,
+    ):
+        if isinstance(patterns, str):
+            patterns = [p.strip() for p in patterns.split(",") if p.strip()]
+        self.match_all = not patterns or "*" in patterns
+        self._names = [
+            re.compile(
+                (
+                    fnmatch.translate(pattern)
+                    if any(c in pattern for c in "*?[")
+                    else ".*" + re.escape(pattern)
+                ),
+                re.IGNORECASE | re.DOTALL,
+            )
+            for pattern in patterns
+        ]
+        self._regex = re.compile(regex, re.IGNORECASE) if regex else None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.types = set(types) if types else None
+        self.skip_inline = skip_inline
+        # (EntryID, lowered HTMLBody) of the last message read for inline
+        self._body = None
+
+    def matches_name(self, name):
+        if not self.match_all and not any(
+            pattern.match(name) for pattern in self._names
+        ):
+            return False
+        if self._regex and not self._regex.search(name):
+            return False
+        return True
+
+    def accepts(self, attachment):
+        # Cheapest properties first
+        if not self.matches_name(attachment.FileName):
+            return False
+        if self.min_size is not None or self.max_size is not None:
+            size = attachment.Size
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        if self.types is not None and attachment.Type not in self.types:
+            return False
+        if self.skip_inline and is_inline(attachment, self._html_body):
+            return False
+        return True
+
+    def _html_body(self, message):
+        # Attachments come message by message, so one cached body is enough
+        entry_id = message.EntryID
+        if self._body is None or self._body[0] != entry_id:
+            self._body = (entry_id, _html_body(message))
+        return self._body[1]
+
+
+# Hidden, or shown by the HTML body; embedded mail and OLE are real files
+def is_inline(attachment, html_body=None):
+    accessor = attachment.PropertyAccessor
+    if _get_property(accessor, PR_ATTACHMENT_HIDDEN):
+        return True
+    content_id = _get_property(accessor, PR_ATTACH_CONTENT_ID)
+    if not content_id:
+        return False
+    # The body is only read for attachments that carry a Content-ID
+    body = (html_body or _html_body)(attachment.Parent)
+    return f"cid:{content_id}".lower() in body
+
+
+def _html_body(message):
+    return (message.HTMLBody or "").lower()
+
+
+def _get_property(accessor, schema_name):
+    try:
+        return accessor.GetProperty(schema_name)
+    except Exception:
+        return None
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AttachmentSink:
+    """
+    Receives attachments saved to a staging folder and finishes them on a
+    thread pool: identical content is kept once, names are made unique and
+    every outcome is listed in attachments.csv.
+    """
+
+    def __init__(self, folder_path, workers=4, append=False):
+        self.folder_path = folder_path
+        self.staging = os.path.join(folder_path, ".staging")
+        os.makedirs(self.staging, exist_ok=True)
+        self.counts = {"saved": 0, "duplicate": 0, "failed": 0, "bytes": 0}
+        self.hashes = {}
+        self._names = set(os.listdir(folder_path))
+        self._lock = threading.Lock()
+        self._staged = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._futures = []
+        manifest_path = os.path.join(folder_path, "attachments.csv")
+        # append keeps the outcomes of earlier runs in the manifest
+        new = not (append and os.path.exists(manifest_path))
+        self._file = open(
+            manifest_path,
+            "w" if new else "a",
+            newline="",
+            encoding="utf-8",
+        )
+        self._manifest = csv.writer(self._file)
+        if new:
+            self._manifest.writerow(MANIFEST_COLUMNS)
+
+    def staging_path(self, file_name):
+        # Only touched from the COM thread
+        self._staged += 1
+        return os.path.join(self.staging, f"{self._staged}_{file_name}")
+
+    def submit(self, entry_id, file_name, staged_path):
+        self._futures.append(
+            self._pool.submit(self._finish, entry_id, file_name, staged_path)
+        )
+
+    def failed(self, entry_id, file_name, ex):
+        with self._lock:
+            self.counts["failed"] += 1
+            self._manifest.writerow(
+                [entry_id, file_name, "", "", "", f"failed: {ex}"]
+            )
+
+    def _unique_name(self, file_name):
+        stem, ext = os.path.splitext(file_name)
+        name = file_name
+        n = 1
+        while name in self._names:
+            n += 1
+            name = f"{stem} ({n}){ext}"
+        self._names.add(name)
+        return name
+
+    def _finish(self, entry_id, file_name, staged_path):
+        try:
+            size = os.path.getsize(staged_path)
+            digest = file_hash(staged_path)
+            with self._lock:
+                first = self.hashes.get(digest)
+                if first is None:
+                    saved_as = self._unique_name(file_name)
+                    self.hashes[digest] = saved_as
+                    self.counts["saved"] += 1
+                    self.counts["bytes"] += size
+                else:
+                    saved_as = first
+                    self.counts["duplicate"] += 1
+                self._manifest.writerow(
+                    [
+                        entry_id,
+                        file_name,
+                        saved_as,
+                        digest,
+                        size,
+                        "saved" if first is None else "duplicate",
+                    ]
+                )
+            if first is None:
+                os.replace(
+                    staged_path, os.path.join(self.folder_path, saved_as)
+                )
+            else:
+                os.remove(staged_path)
+        except Exception as ex:
+            logging.error(
+                "Could not finish attachment %s\n%s", file_name, ex.args
+            )
+            self.failed(entry_id, file_name, ex)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        self._file.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+        return self.counts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,137 @@
+"""
+Manifest handling for batch runs of email_actions.
+A manifest lists one action per row (id, store_id, action and its params)
+as CSV or JSON Lines; results are written per row as they complete.
+"""
+import csv
+import json
+import os
+import re
+import time
+
+RESULT_COLUMNS = ["line", "id", "store_id", "action", "status", "error"]
+SEND_RESULT_COLUMNS = ["line", "to", "subject", "status", "error"]
+
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+def read_manifest(path):
+    """Return manifest rows as dicts with line, id, store_id, action, params."""
+    entries = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".json")):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        for line, record in enumerate(records, start=1):
+            params = dict(record.pop("params", None) or {})
+            entry = {
+                "line": line,
+                "id": record.pop("id", None),
+                "store_id": record.pop("store_id", None) or None,
+                "action": record.pop("action", None),
+            }
+            # Any other column is a parameter of the action
+            params.update(
+                (key, value)
+                for key, value in record.items()
+                if value not in (None, "")
+            )
+            entry["params"] = params
+            entries.append(entry)
+    return entries
+
+
+def read_records(path):
+    """Rows of a CSV or JSON Lines file as dicts."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".json")):
+            return [json.loads(line) for line in f if line.strip()]
+        return list(csv.DictReader(f))
+
+
+def render(template, fields):
+    """Fill {{name}} placeholders; a missing field raises KeyError."""
+    if not template:
+        return template
+    return PLACEHOLDER.sub(lambda m: str(fields[m.group(1)]), template)
+
+
+class RateLimiter:
+    """Spaces calls evenly to at most per_minute calls a minute."""
+
+    def __init__(self, per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = self._clock()
+        if self._next is not None and self._next > now:
+            self._sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
+
+
+def read_id_file(path):
+    """(id, store_id) pairs from a CSV with id and optional store_id."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [
+            (record["id"], record.get("store_id") or None)
+            for record in csv.DictReader(f)
+            if record.get("id")
+        ]
+
+
+def plan(entries, actions):
+    """
+    Order entries by store, action and target folder so a session handles
+    each group in one go; actions lists the action names in the order they
+    run for an item. The sort is stable: rows for the same item keep their
+    manifest order within a group.
+    """
+
+    def key(entry):
+        action = entry["action"]
+        rank = actions.index(action) if action in actions else len(actions)
+        return (
+            entry["store_id"] or "",
+            rank,
+            entry["params"].get("new_folder", ""),
+        )
+
+    return sorted(entries, key=key)
+
+
+class ResultWriter:
+    """Per item outcome, flushed row by row."""
+
+    def __init__(self, path, columns=RESULT_COLUMNS):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.path = path
+        self.columns = columns
+        self.counts = {"ok": 0, "error": 0}
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, entry, status, error=""):
+        self.counts[status] = self.counts.get(status, 0) + 1
+        self._writer.writerow(
+            [entry.get(column) for column in self.columns[:-2]]
+            + [status, error]
+        )
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,174 @@
+"""
+Small on-disk state kept between runs of email_actions.
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+def naive(value):
+    # pywin32 tags Outlook's local times with a tzinfo; compare them naive
+    return value.replace(tzinfo=None, microsecond=0)
+
+
+def save_json(path, data):
+    # Write then rename, so a crash never leaves a truncated state file
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class Watermark:
+    """
+    Newest ReceivedTime exported for a folder and the ids seen at it, with
+    the (EntryID, StoreID) of items the last run skipped, to read again.
+    """
+
+    def __init__(self, received=None, entry_ids=(), retry=()):
+        self.received = received
+        self.entry_ids = set(entry_ids)
+        self.retry = set(retry)
+
+    def is_new(self, received, entry_id):
+        if self.received is None:
+            return True
+        received = naive(received)
+        if received != self.received:
+            return received > self.received
+        return entry_id not in self.entry_ids
+
+    def advance(self, received, entry_id):
+        received = naive(received)
+        if self.received is None or received > self.received:
+            self.received = received
+            self.entry_ids = {entry_id}
+        elif received == self.received:
+            self.entry_ids.add(entry_id)
+
+    def restrict_filter(self, o_filter):
+        """Narrow o_filter to items received at or after the watermark."""
+        if self.received is None:
+            return o_filter
+        if o_filter and o_filter.startswith("@SQL="):
+            # DASL compares datereceived in UTC
+            since = self.received.astimezone(timezone.utc)
+            clause = (
+                '"urn:schemas:httpmail:datereceived" >= '
+                f"'{since.strftime('%Y-%m-%d %H:%M')}'"
+            )
+            return f"@SQL=({o_filter[5:]}) AND {clause}"
+        # Jet compares to the minute, is_new drops the overlap. Year first:
+        # Jet reads m/d or d/m dates with the machine's locale
+        since = self.received.strftime("%Y-%m-%d %I:%M %p")
+        clause = f"[ReceivedTime] >= '{since}'"
+        if o_filter:
+            return f"({o_filter}) AND {clause}"
+        return clause
+
+    def to_dict(self):
+        return {
+            "received": self.received.isoformat() if self.received else None,
+            "entry_ids": sorted(self.entry_ids),
+            "retry": sorted(self.retry),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        received = data.get("received")
+        return cls(
+            datetime.fromisoformat(received) if received else None,
+            data.get("entry_ids", ()),
+            (tuple(key) for key in data.get("retry", ())),
+        )
+
+
+class WatermarkStore:
+    """Watermarks of every mailbox folder, persisted as one JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.watermarks = {
+            key: Watermark.from_dict(value)
+            for key, value in load_json(path).items()
+        }
+
+    def get(self, key):
+        return self.watermarks.setdefault(key, Watermark())
+
+    def save(self):
+        save_json(
+            self.path,
+            {key: value.to_dict() for key, value in self.watermarks.items()},
+        )
+
+
+class SenderCache:
+    """
+    Exchange address -> SMTP address, least recently used entries evicted
+    first. With a path, entries younger than ttl seconds are shared
+    between runs through a JSON file.
+    """
+
+    def __init__(self, max_size=5000, path=None, ttl=7 * 86400):
+        self.max_size = max_size
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self._dirty = False
+        if path:
+            now = time.time()
+            for key, (smtp, resolved) in load_json(path).items():
+                if now - resolved < ttl:
+                    self.entries[key] = (smtp, resolved)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and time.time() - entry[1] >= self.ttl:
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, smtp):
+        self.entries[key] = (smtp, time.time())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self._dirty = True
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def save(self):
+        if self.path and self._dirty:
+            save_json(
+                self.path,
+                {key: list(value) for key, value in self.entries.items()},
+            )
+            self._dirty = False
@@ -0,0 +1,229 @@
+"""
+Chunked export writers used by Outlook.get_emails.
+Rows are buffered up to chunk_size and then appended to disk, so memory
+stays bounded and an interrupted run leaves every completed chunk behind.
+"""
+import csv
+import json
+import os
+from datetime import datetime
+
+# Formats handled here; xlsx stays on the pandas path in email_actions
+STREAM_FORMATS = ("csv", "jsonl", "parquet", "arrow")
+
+# received/sent as written to csv, jsonl and xlsx
+DATE_FORMAT = "%m/%d/%y %H:%M:%S"
+
+
+class ExportWriter:
+    extension = None
+    # True when rows keep datetimes and attachment lists (Outlook._typed_row)
+    typed = False
+
+    def __init__(self, folder_path, columns, chunk_size=1000, name="df"):
+        self.path = os.path.join(folder_path, f"{name}.{self.extension}")
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        self._chunk = []
+
+    def write(self, row):
+        self._chunk.append(row)
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._chunk:
+            self._write_chunk(self._chunk)
+            self.rows_written += len(self._chunk)
+            self._chunk = []
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._close()
+
+    def _write_chunk(self, rows):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CsvExportWriter(ExportWriter):
+    extension = "csv"
+
+    def __init__(self, folder_path, columns, chunk_size=1000, name="df"):
+        super().__init__(folder_path, columns, chunk_size, name)
+        self._file = open(self.path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+        self._file.flush()
+
+    def _write_chunk(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class JsonlExportWriter(ExportWriter):
+    extension = "jsonl"
+
+    def __init__(self, folder_path, columns, chunk_size=1000, name="df"):
+        super().__init__(folder_path, columns, chunk_size, name)
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def _write_chunk(self, rows):
+        self._file.writelines(
+            json.dumps(dict(zip(self.columns, row)), default=str) + "\n"
+            for row in rows
+        )
+        self._file.flush()
+
+    def _close(self):
+        self._file.close()
+
+
+class ColumnarExportWriter(ExportWriter):
+    """
+    Typed Arrow columns: repeated names and addresses are dictionary
+    encoded, dates are timestamps and attachments a list of file names.
+    """
+
+    typed = True
+
+    # Columns with few distinct values over many rows
+    DICTIONARY_COLUMNS = ("receiver", "cc", "sender", "sender_add", "store_id")
+    TIMESTAMP_COLUMNS = ("received", "sent")
+    TYPES = {"attachments_count": "int64", "unread": "bool_"}
+
+    def __init__(self, folder_path, columns, chunk_size=1000, name="df"):
+        super().__init__(folder_path, columns, chunk_size, name)
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError(
+                f"pyarrow is required for {self.extension} export"
+            )
+        self._pa = pa
+        self.schema = pa.schema(
+            [(name, self._column_type(name)) for name in self.columns]
+        )
+        # One growing dictionary per column, so every chunk only adds to it
+        self._dictionaries = {
+            name: {}
+            for name in self.columns
+            if name in self.DICTIONARY_COLUMNS
+        }
+
+    def _column_type(self, name):
+        pa = self._pa
+        if name in self.DICTIONARY_COLUMNS:
+            return pa.dictionary(pa.int32(), pa.string())
+        if name in self.TIMESTAMP_COLUMNS:
+            return pa.timestamp("s")
+        if name == "attachments":
+            return pa.list_(pa.string())
+        return getattr(pa, self.TYPES.get(name, "string"))()
+
+    def _value(self, name, value):
+        # Rows formatted for csv/jsonl, as merged by email_fanout
+        if name in self.TIMESTAMP_COLUMNS:
+            if isinstance(value, str):
+                return datetime.strptime(value, DATE_FORMAT)
+            return value.replace(tzinfo=None)
+        if name == "attachments" and isinstance(value, str):
+            return [] if value in ("", "empty") else value.split("|")
+        return value
+
+    def _array(self, name, values):
+        pa = self._pa
+        values = [self._value(name, value) for value in values]
+        dictionary = self._dictionaries.get(name)
+        if dictionary is None:
+            return pa.array(values, self.schema.field(name).type)
+        indices = [
+            (
+                None
+                if value is None
+                else dictionary.setdefault(value, len(dictionary))
+            )
+            for value in values
+        ]
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, pa.int32()),
+            pa.array(list(dictionary), pa.string()),
+        )
+
+    def _write_chunk(self, rows):
+        columns = zip(*rows)
+        batch = self._pa.record_batch(
+            [
+                self._array(name, values)
+                for name, values in zip(self.columns, columns)
+            ],
+            schema=self.schema,
+        )
+        self._writer.write_batch(batch)
+
+    def _close(self):
+        self._writer.close()
+
+
+class ParquetExportWriter(ColumnarExportWriter):
+    """One row group per chunk. The footer is written on close()."""
+
+    extension = "parquet"
+
+    def __init__(self, folder_path, columns, chunk_size=1000, name="df"):
+        super().__init__(folder_path, columns, chunk_size, name)
+        import pyarrow.parquet as pq
+
+        self._writer = pq.ParquetWriter(
+            self.path, self.schema, compression="zstd"
+        )
+
+
+class ArrowExportWriter(ColumnarExportWriter):
+    """Arrow IPC file, one record batch per chunk; memory-mappable."""
+
+    extension = "arrow"
+
+    def __init__(self, folder_path, columns, chunk_size=1000, name="df"):
+        super().__init__(folder_path, columns, chunk_size, name)
+        pa = self._pa
+        self._writer = pa.ipc.new_file(
+            self.path,
+            self.schema,
+            # IPC files take one dictionary per field, extended by deltas
+            options=pa.ipc.IpcWriteOptions(
+                compression="zstd", emit_dictionary_deltas=True
+            ),
+        )
+
+
+WRITERS = {
+    "csv": CsvExportWriter,
+    "jsonl": JsonlExportWriter,
+    "parquet": ParquetExportWriter,
+    "arrow": ArrowExportWriter,
+}
+
+
+def open_writer(
+    output_format, folder_path, columns, chunk_size=1000, name="df"
+):
+    try:
+        writer_class = WRITERS[output_format]
+    except KeyError:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return writer_class(folder_path, columns, chunk_size, name)
@@ -0,0 +1,169 @@
+"""
+get_emails over many mailbox/folder targets in parallel.
+Each target is exported by a worker process with its own COM apartment
+and Outlook session; the parts are then merged into one export with
+mailbox and folder columns.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from email_actions import DF_COLUMNS, Outlook, pythoncom
+from email_batch import ResultWriter, read_records
+from email_export import open_writer
+
+TARGET_COLUMNS = ["mailbox", "folder"]
+TARGET_RESULT_COLUMNS = [
+    "line",
+    "mailbox",
+    "folder",
+    "rows",
+    "seconds",
+    "status",
+    "error",
+]
+
+
+def read_targets(path):
+    """Targets from a CSV/JSONL with mailbox, folder and optional filter."""
+    targets = []
+    for line, record in enumerate(read_records(path), start=1):
+        targets.append(
+            {
+                "line": line,
+                "mailbox": record.get("mailbox") or None,
+                "folder": record.get("folder") or None,
+                "filter": record.get("filter") or None,
+            }
+        )
+    return targets
+
+
+def export_target(target, part_path, options, backend=None):
+    """Worker: export one target to part_path/df.jsonl."""
+    entry = dict(target, rows=0, seconds=0.0)
+    start = time.perf_counter()
+    if pythoncom is not None:
+        pythoncom.CoInitialize()
+    outlook = None
+    try:
+        os.makedirs(part_path, exist_ok=True)
+        # The parent synced once for every worker
+        outlook = Outlook(
+            target["mailbox"], target["folder"], backend=backend, sync="none"
+        )
+        get_options = dict(options)
+        if target.get("filter"):
+            get_options["o_filter"] = target["filter"]
+        outlook.get_emails(
+            folder_path=part_path, output_format="jsonl", **get_options
+        )
+        with open(os.path.join(part_path, "df.jsonl"), encoding="utf-8") as f:
+            entry["rows"] = sum(1 for _ in f)
+        entry["status"] = "ok"
+    except Exception as ex:
+        logging.error("Target %s failed\n%s", target["line"], ex.args)
+        entry["status"] = "error"
+        entry["error"] = str(ex)
+    finally:
+        if outlook is not None:
+            # Workers share the Outlook process: never Quit it from here
+            outlook.close(quit=False)
+        if pythoncom is not None:
+            pythoncom.CoUninitialize()
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def _part_rows(part_path, target, columns):
+    path = os.path.join(part_path, "df.jsonl")
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            yield [target["mailbox"], target["folder"]] + [
+                record[column] for column in columns
+            ]
+
+
+def merge_parts(parts, folder_path, output_format, columns, chunk_size=1000):
+    """Write every part, in target order, as one df.<output_format>."""
+    merged_columns = TARGET_COLUMNS + list(columns)
+    rows = (
+        row
+        for target, part_path in parts
+        for row in _part_rows(part_path, target, columns)
+    )
+    if output_format == "xlsx":
+        import pandas as pd
+
+        df = pd.DataFrame(list(rows), columns=merged_columns)
+        df.to_excel(f"{folder_path}/df.xlsx", index=False)
+        return len(df)
+    with open_writer(
+        output_format, folder_path, merged_columns, chunk_size
+    ) as writer:
+        for row in rows:
+            writer.write(row)
+    return writer.rows_written
+
+
+def export_targets(
+    targets,
+    folder_path,
+    options,
+    output_format="xlsx",
+    processes=4,
+    results_path=None,
+    backend=None,
+    sync="none",
+):
+    """
+    Run get_emails for every target with at most processes workers.
+    options are get_emails keyword arguments (o_filter, read_mode,
+    columns...). The sync policy runs once here, before any worker starts.
+    Returns the per target results.
+    """
+    if sync != "none":
+        Outlook(None, None, backend=backend, sync=sync).close(quit=False)
+    parts_root = os.path.join(folder_path, ".parts")
+    os.makedirs(parts_root, exist_ok=True)
+    parts = [
+        (target, os.path.join(parts_root, str(target["line"])))
+        for target in targets
+    ]
+    results_path = results_path or f"{folder_path}/targets_results.csv"
+    finished = []
+    try:
+        with ResultWriter(
+            results_path, TARGET_RESULT_COLUMNS
+        ) as results, ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [
+                pool.submit(export_target, target, part_path, options, backend)
+                for target, part_path in parts
+            ]
+            for future in as_completed(futures):
+                entry = future.result()
+                results.write(entry, entry["status"], entry.get("error", ""))
+                finished.append(entry)
+        # A target that failed halfway contributes none of its rows
+        succeeded = {
+            entry["line"] for entry in finished if entry["status"] == "ok"
+        }
+        rows = merge_parts(
+            [part for part in parts if part[0]["line"] in succeeded],
+            folder_path,
+            output_format,
+            options.get("columns") or DF_COLUMNS,
+            options.get("chunk_size", 1000),
+        )
+    finally:
+        shutil.rmtree(parts_root, ignore_errors=True)
+    logging.debug(
+        "export_targets - %s targets, %s rows merged", len(targets), rows
+    )
+    return sorted(finished, key=lambda entry: entry["line"])
@@ -0,0 +1,157 @@
+"""
+Typed mail filters compiled to DASL (@SQL=) queries for Items.Restrict.
+Every predicate is evaluated by the store, so only matching items cross
+COM. With content_index the text predicates use the Instant Search
+indexer (ci_phrasematch) instead of a LIKE scan.
+"""
+from datetime import datetime, timezone
+
+# DASL names of the properties filters can use
+SUBJECT = "urn:schemas:httpmail:subject"
+BODY = "urn:schemas:httpmail:textdescription"
+SENDER_NAME = "urn:schemas:httpmail:fromname"
+SENDER_EMAIL = "urn:schemas:httpmail:fromemail"
+# SMTP address of the sender, also set for Exchange senders
+SENDER_SMTP = "http://schemas.microsoft.com/mapi/proptag/0x5D01001F"
+RECEIVED = "urn:schemas:httpmail:datereceived"
+SENT = "urn:schemas:httpmail:date"
+READ = "urn:schemas:httpmail:read"
+HAS_ATTACHMENT = "urn:schemas:httpmail:hasattachment"
+CATEGORIES = "urn:schemas-microsoft-com:office:office#Keywords"
+
+DATE_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d", "%m/%d/%Y %H:%M", "%m/%d/%Y")
+
+
+def parse_date(value):
+    """datetime from a date string, or the value when already a datetime."""
+    if isinstance(value, datetime):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Cannot parse date: {value!r}")
+
+
+def quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def utc(value):
+    # DASL compares dates in UTC; local times are converted first
+    return quote(
+        parse_date(value).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M")
+    )
+
+
+def like(value):
+    # % and _ are wildcards in LIKE; there is no escape in DASL
+    return quote(f"%{value}%")
+
+
+class MailFilter:
+    """
+    Predicates combined with AND. Each method returns the filter, so they
+    can be chained::
+
+        MailFilter().received_between("2024-01-01", None).unread().to_dasl()
+    """
+
+    def __init__(self, content_index=False):
+        self.content_index = content_index
+        self.clauses = []
+
+    def __bool__(self):
+        return bool(self.clauses)
+
+    def where(self, clause):
+        """Add a raw DASL clause."""
+        self.clauses.append(clause)
+        return self
+
+    def _between(self, prop, start, end):
+        if start is not None:
+            self.where(f'"{prop}" >= {utc(start)}')
+        if end is not None:
+            self.where(f'"{prop}" < {utc(end)}')
+        return self
+
+    def received_between(self, start=None, end=None):
+        return self._between(RECEIVED, start, end)
+
+    def sent_between(self, start=None, end=None):
+        return self._between(SENT, start, end)
+
+    def _contains(self, prop, text):
+        if self.content_index:
+            return f'"{prop}" ci_phrasematch {quote(text)}'
+        return f'"{prop}" like {like(text)}'
+
+    def subject_contains(self, text):
+        return self.where(self._contains(SUBJECT, text))
+
+    def body_contains(self, text):
+        return self.where(self._contains(BODY, text))
+
+    def sender(self, *senders):
+        """Any of the senders, by SMTP address or by display name."""
+        clauses = []
+        for sender in senders:
+            if "@" in sender:
+                clauses.append(f'"{SENDER_EMAIL}" = {quote(sender)}')
+                clauses.append(f'"{SENDER_SMTP}" = {quote(sender)}')
+            else:
+                clauses.append(self._contains(SENDER_NAME, sender))
+        return self.where(" OR ".join(clauses))
+
+    def sender_domain(self, *domains):
+        clauses = []
+        for domain in domains:
+            pattern = quote(f"%@{domain.lstrip('@')}")
+            clauses.append(f'"{SENDER_EMAIL}" like {pattern}')
+            clauses.append(f'"{SENDER_SMTP}" like {pattern}')
+        return self.where(" OR ".join(clauses))
+
+    def unread(self, value=True):
+        return self.where(f'"{READ}" = {0 if value else 1}')
+
+    def has_attachments(self, value=True):
+        return self.where(f'"{HAS_ATTACHMENT}" = {1 if value else 0}')
+
+    def category(self, *categories):
+        return self.where(
+            " OR ".join(f'"{CATEGORIES}" = {quote(c)}' for c in categories)
+        )
+
+    def to_dasl(self):
+        if not self.clauses:
+            return None
+        if len(self.clauses) == 1:
+            return f"@SQL={self.clauses[0]}"
+        return "@SQL=" + " AND ".join(f"({c})" for c in self.clauses)
+
+    def __str__(self):
+        return self.to_dasl() or ""
+
+
+def from_args(args):
+    """MailFilter from the typed filter options of the CLI."""
+    mail_filter = MailFilter(args.content_index)
+    if args.since or args.until:
+        mail_filter.received_between(args.since, args.until)
+    if args.sender:
+        mail_filter.sender(*args.sender)
+    if args.sender_domain:
+        mail_filter.sender_domain(*args.sender_domain)
+    if args.subject_contains:
+        mail_filter.subject_contains(args.subject_contains)
+    if args.body_contains:
+        mail_filter.body_contains(args.body_contains)
+    if args.unread:
+        mail_filter.unread()
+    if args.has_attachments:
+        mail_filter.has_attachments()
+    if args.category:
+        mail_filter.category(*args.category)
+    return mail_filter
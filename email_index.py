@@ -0,0 +1,224 @@
+"""
+Local SQLite index of exported mail.
+get_emails upserts its rows keyed by (id, store_id); an FTS5 table over
+subject, body and attachment names answers searches without Outlook.
+"""
+import sqlite3
+from datetime import datetime
+
+# Indexed columns, as read by Outlook.get_emails
+INDEX_COLUMNS = [
+    "receiver",
+    "cc",
+    "subject",
+    "body",
+    "received",
+    "sent",
+    "sender",
+    "sender_add",
+    "unread",
+    "attachments",
+    "attachments_count",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT NOT NULL,
+    store_id TEXT NOT NULL DEFAULT '',
+    folder TEXT,
+    receiver TEXT,
+    cc TEXT,
+    subject TEXT,
+    body TEXT,
+    received TEXT,
+    sent TEXT,
+    sender TEXT,
+    sender_add TEXT,
+    unread INTEGER,
+    attachments TEXT,
+    attachments_count INTEGER,
+    indexed TEXT,
+    PRIMARY KEY (id, store_id)
+);
+CREATE INDEX IF NOT EXISTS messages_received ON messages (received);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender_add);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, body, attachments, content='messages', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, subject, body, attachments)
+    VALUES (new.rowid, new.subject, new.body, new.attachments);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, body, attachments)
+    VALUES ('delete', old.rowid, old.subject, old.body, old.attachments);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, subject, body, attachments)
+    VALUES ('delete', old.rowid, old.subject, old.body, old.attachments);
+    INSERT INTO messages_fts (rowid, subject, body, attachments)
+    VALUES (new.rowid, new.subject, new.body, new.attachments);
+END;
+"""
+
+RESULT_COLUMNS = [
+    "id",
+    "store_id",
+    "folder",
+    "received",
+    "sender",
+    "sender_add",
+    "subject",
+    "attachments",
+]
+
+
+def _value(column, value):
+    if isinstance(value, datetime):
+        # ISO text sorts and compares in time order
+        return value.replace(tzinfo=None, microsecond=0).isoformat(sep=" ")
+    if column == "attachments" and isinstance(value, (list, tuple)):
+        return "|".join(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def phrase_query(query):
+    """Every whitespace separated term of query as a quoted FTS5 phrase."""
+    return " ".join(
+        '"' + term.replace('"', '""') + '"' for term in query.split()
+    )
+
+
+# Messages of an EntryID; any store when the caller does not know it
+def _where(o_id, o_store_id):
+    if o_store_id is None:
+        return "id = ?", (o_id,)
+    return "id = ? AND store_id = ?", (o_id, o_store_id)
+
+
+class MailIndex:
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.upserted = 0
+        self._pending = []
+        self._db = sqlite3.connect(path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+
+    def add(self, row, folder=None):
+        """Queue a get_emails row; written every batch_size rows."""
+        self._pending.append((row, folder))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        now = datetime.now().isoformat(sep=" ", timespec="seconds")
+        with self._db:
+            for row, folder in self._pending:
+                # Only columns read this run are updated on a known message
+                columns = [c for c in INDEX_COLUMNS if c in row]
+                names = ["id", "store_id", "folder", "indexed"] + columns
+                values = [
+                    row["id"],
+                    row.get("store_id") or "",
+                    folder,
+                    now,
+                ] + [_value(c, row[c]) for c in columns]
+                updates = ", ".join(
+                    f"{name} = excluded.{name}" for name in names[2:]
+                )
+                self._db.execute(
+                    f"INSERT INTO messages ({', '.join(names)}) "
+                    f"VALUES ({', '.join('?' * len(names))}) "
+                    f"ON CONFLICT (id, store_id) DO UPDATE SET {updates}",
+                    values,
+                )
+        self.upserted += len(self._pending)
+        self._pending = []
+
+    def remove(self, o_id, o_store_id=None):
+        where, params = _where(o_id, o_store_id)
+        with self._db:
+            self._db.execute(f"DELETE FROM messages WHERE {where}", params)
+
+    def move(self, o_id, o_store_id, new_id, folder):
+        """Re-key a message Outlook moved: a move hands out a new EntryID."""
+        where, params = _where(o_id, o_store_id)
+        with self._db:
+            self._db.execute(
+                f"UPDATE OR REPLACE messages SET id = ?, folder = ? "
+                f"WHERE {where}",
+                (new_id, folder, *params),
+            )
+
+    def search(
+        self, query=None, senders=None, since=None, until=None, limit=50
+    ):
+        """
+        Messages matching an FTS5 query (best match first) and the
+        metadata filters; without a query, newest first. A query FTS5
+        cannot parse, such as PO-4471 or an email address, is searched
+        as quoted phrases instead.
+        """
+        select = ", ".join(f"m.{column}" for column in RESULT_COLUMNS)
+        clauses = []
+        params = []
+        if query:
+            sql = (
+                f"SELECT {select}, bm25(messages_fts) AS rank "
+                "FROM messages_fts JOIN messages m "
+                "ON m.rowid = messages_fts.rowid"
+            )
+            clauses.append("messages_fts MATCH ?")
+            params.append(query)
+            order = "rank"
+        else:
+            sql = f"SELECT {select}, NULL AS rank FROM messages m"
+            order = "m.received DESC"
+        if senders:
+            clauses.append(
+                "("
+                + " OR ".join(
+                    "m.sender_add LIKE ? OR m.sender LIKE ?" for _ in senders
+                )
+                + ")"
+            )
+            for sender in senders:
+                params.extend((f"%{sender}%", f"%{sender}%"))
+        if since:
+            clauses.append("m.received >= ?")
+            params.append(_value("received", since))
+        if until:
+            clauses.append("m.received < ?")
+            params.append(_value("received", until))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+        try:
+            rows = self._db.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            if not query:
+                raise
+            # The query is always the first parameter
+            params[0] = phrase_query(query)
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
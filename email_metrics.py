@@ -0,0 +1,109 @@
+"""
+Timing spans and counters for a run of email_actions.
+Every span name gets a latency histogram; the summary is written as JSON
+or, for a .prom path, in the Prometheus text format.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; a COM round-trip is usually 0.1-10 ms
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5, 2.5, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        index = 0
+        for bound in self.buckets:
+            if seconds <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "buckets": {str(bound): n for bound, n in self.cumulative()},
+        }
+
+
+class Metrics:
+    def __init__(self, prefix="email_actions"):
+        self.prefix = prefix
+        self.spans = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, name, seconds):
+        histogram = self.spans.get(name)
+        if histogram is None:
+            histogram = self.spans[name] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "elapsed": round(time.time() - self.started, 6),
+            "spans": {
+                name: histogram.to_dict()
+                for name, histogram in sorted(self.spans.items())
+            },
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def to_prometheus(self):
+        name = f"{self.prefix}_span_seconds"
+        lines = [f"# TYPE {name} histogram"]
+        for span, histogram in sorted(self.spans.items()):
+            for bound, total in histogram.cumulative():
+                lines.append(
+                    f'{name}_bucket{{span="{span}",le="{bound}"}} {total}'
+                )
+            lines.append(f'{name}_sum{{span="{span}"}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{span="{span}"}} {histogram.count}')
+        total = f"{self.prefix}_events_total"
+        lines.append(f"# TYPE {total} counter")
+        for counter, value in sorted(self.counters.items()):
+            lines.append(f'{total}{{name="{counter}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), f, indent=1)
@@ -0,0 +1,107 @@
+"""
+Retry policy for COM calls into Outlook.
+Errors are classified from their HRESULT: a busy Outlook is retried with
+exponential backoff and jitter, a dead session is left to the caller to
+reconnect and anything else is raised straight away.
+"""
+import logging
+import random
+import time
+
+# Outlook is busy (modal dialog, sync running): the call can be repeated
+RPC_E_CALL_REJECTED = -2147418111
+RPC_E_SERVERCALL_RETRYLATER = -2147417846
+RPC_E_SERVERFAULT = -2147417851
+# The Outlook process went away: the session must be rebuilt
+RPC_S_SERVER_UNAVAILABLE = -2147023174
+RPC_S_CALL_FAILED = -2147023170
+RPC_E_DISCONNECTED = -2147417848
+CO_E_OBJNOTCONNECTED = -2147220995
+# Raised for errors inside the call; the real code is in excepinfo
+DISP_E_EXCEPTION = -2147352567
+
+TRANSIENT = {
+    RPC_E_CALL_REJECTED,
+    RPC_E_SERVERCALL_RETRYLATER,
+    RPC_E_SERVERFAULT,
+}
+DEAD = {
+    RPC_S_SERVER_UNAVAILABLE,
+    RPC_S_CALL_FAILED,
+    RPC_E_DISCONNECTED,
+    CO_E_OBJNOTCONNECTED,
+}
+
+
+def hresult(ex):
+    """HRESULT of a pywintypes.com_error, None for other exceptions."""
+    args = getattr(ex, "args", ())
+    if not args or not isinstance(args[0], int):
+        return None
+    code = args[0]
+    if code == DISP_E_EXCEPTION and len(args) > 2 and args[2]:
+        excepinfo = args[2]
+        if len(excepinfo) > 5 and excepinfo[5]:
+            return excepinfo[5]
+    return code
+
+
+def classify(ex):
+    """One of "transient", "dead" or "permanent"."""
+    code = hresult(ex)
+    if code in TRANSIENT:
+        return "transient"
+    if code in DEAD:
+        return "dead"
+    return "permanent"
+
+
+def is_dead(ex):
+    return ex is not None and classify(ex) == "dead"
+
+
+class RetryPolicy:
+    """
+    Repeats a call while it fails with a transient error, sleeping a random
+    time up to base * 2 ** attempt (capped) between tries.
+    """
+
+    def __init__(
+        self,
+        attempts=5,
+        base=0.25,
+        cap=8.0,
+        sleep=time.sleep,
+        rand=random.random,
+    ):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.retries = 0
+        self._sleep = sleep
+        self._rand = rand
+
+    def delay(self, attempt):
+        # Full jitter: retries from several processes do not line up
+        return self._rand() * min(self.cap, self.base * 2**attempt)
+
+    def wait(self, attempt):
+        self._sleep(self.delay(attempt))
+
+    def call(self, function, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return function(*args, **kwargs)
+            except Exception as ex:
+                attempt += 1
+                if classify(ex) != "transient" or attempt >= self.attempts:
+                    raise
+                self.retries += 1
+                logging.debug(
+                    "Retry %s of %s: %s",
+                    attempt,
+                    getattr(function, "__name__", function),
+                    ex.args,
+                )
+                self.wait(attempt)
@@ -0,0 +1,213 @@
+"""
+Resident Outlook session for email_actions.
+The server keeps Outlook open and runs actions received as JSON over a
+local socket (a named pipe on Windows). The client takes the same
+arguments as email_actions.py. Server and clients authenticate with the
+secret in the EMAIL_ACTIONS_KEY environment variable.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from email_actions import (
+    Outlook,
+    find_action,
+    parse_args,
+    prepare_folder,
+    run_action,
+    write_status,
+)
+from email_cache import SenderCache
+from email_retry import is_dead
+
+if sys.platform == "win32":
+    DEFAULT_ADDRESS = r"\\.\pipe\email_actions"
+else:
+    DEFAULT_ADDRESS = "localhost:47231"
+
+
+def parse_address(address):
+    # host:port for sockets, anything else is a pipe/socket path
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return (host, int(port))
+    return address
+
+
+def default_authkey():
+    """The shared secret of server and clients, from EMAIL_ACTIONS_KEY."""
+    key = os.environ.get("EMAIL_ACTIONS_KEY")
+    if not key:
+        raise RuntimeError(
+            "Set EMAIL_ACTIONS_KEY to a secret shared by server and clients"
+        )
+    return key.encode()
+
+
+class ActionServer:
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, backend=None):
+        self.backend = backend
+        self.sessions = {}
+        self.listener = Listener(
+            parse_address(address), authkey=authkey or default_authkey()
+        )
+        self.address = self.listener.address
+        self.running = False
+
+    # Requests may be raw JSON: options missing from them take the defaults
+    @staticmethod
+    def session_key(args):
+        return (
+            getattr(args, "mailbox", None),
+            getattr(args, "mailbox_folder", None),
+            getattr(args, "sync", "full"),
+            getattr(args, "sync_async", False),
+            getattr(args, "sender_cache", None),
+        )
+
+    # One open Outlook per mailbox, folder and session options
+    def session(self, args):
+        key = self.session_key(args)
+        if key not in self.sessions:
+            o_mailbox, o_folder, sync, sync_async, sender_cache = key
+            self.sessions[key] = Outlook(
+                o_mailbox,
+                o_folder,
+                self.backend,
+                sender_cache=SenderCache(path=sender_cache),
+                sync=sync,
+                sync_async=sync_async,
+            )
+        return self.sessions[key]
+
+    def handle(self, request):
+        action = request.get("email_action")
+        if action == "ping":
+            return {"status": "ok"}
+        if action == "shutdown":
+            self.running = False
+            return {"status": "ok"}
+
+        args = argparse.Namespace(**request)
+        try:
+            spec = find_action(action)
+            if not spec.session:
+                spec.function(args)
+                return {"status": "ok"}
+            outlook = self.session(args)
+            outlook.index_path = (
+                args.index_path if getattr(args, "index", False) else None
+            )
+            try:
+                run_action(outlook, args)
+            finally:
+                # Totals of the session so far, like a run of email_actions
+                if getattr(args, "metrics_path", None):
+                    outlook.write_metrics(args.metrics_path)
+            if is_dead(outlook.last_error):
+                raise outlook.last_error
+        except Exception as ex:
+            logging.error("Could perform action %s\n%s", action, ex.args)
+            if is_dead(ex):
+                # Outlook went away: the next request opens a new session
+                self.sessions.pop(self.session_key(args), None)
+            return {"status": "error", "error": str(ex)}
+        return {"status": "ok"}
+
+    # One connection; a bad or vanished client never stops the server
+    def answer(self, conn):
+        try:
+            data = conn.recv_bytes()
+        except (EOFError, OSError) as ex:
+            logging.error("Client went away %s", ex.args)
+            return
+        try:
+            request = json.loads(data)
+            if not isinstance(request, dict):
+                raise ValueError("A request is a JSON object")
+            response = self.handle(request)
+        except Exception as ex:
+            logging.error("Bad request %s", ex.args)
+            response = {"status": "error", "error": str(ex)}
+        try:
+            conn.send_bytes(json.dumps(response).encode("utf-8"))
+        except (EOFError, OSError) as ex:
+            logging.error("Could not answer client %s", ex.args)
+
+    def serve_forever(self):
+        self.running = True
+        logging.debug("Serving on %s", self.address)
+        try:
+            while self.running:
+                try:
+                    conn = self.listener.accept()
+                except Exception as ex:
+                    logging.error("Rejected client %s", ex.args)
+                    continue
+                with conn:
+                    self.answer(conn)
+        finally:
+            self.close()
+
+    def close(self):
+        self.listener.close()
+        for outlook in self.sessions.values():
+            outlook.close()
+        self.sessions = {}
+        logging.debug("Server closed")
+
+
+def send_request(request, address=DEFAULT_ADDRESS, authkey=None):
+    with Client(
+        parse_address(address), authkey=authkey or default_authkey()
+    ) as conn:
+        conn.send_bytes(json.dumps(request).encode("utf-8"))
+        return json.loads(conn.recv_bytes())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--serve", help="Run the resident server", action="store_true"
+    )
+    parser.add_argument(
+        "--address", help="host:port or pipe name", default=DEFAULT_ADDRESS
+    )
+    options, rest = parser.parse_known_args(argv)
+
+    user = os.getlogin()
+    if options.serve:
+        logging.basicConfig(
+            filename=f"C:/Users/{user}/AppData/Local/Temp/email_server.log",
+            level=logging.DEBUG,
+            format="%(asctime)s %(levelname)s %(message)s",
+        )
+        try:
+            server = ActionServer(options.address)
+        except RuntimeError as ex:
+            raise SystemExit(str(ex))
+        server.serve_forever()
+        return
+
+    # Thin client: same arguments and status files as email_actions.py
+    args = parse_args(rest, user)
+    prepare_folder(args.folder_path)
+    try:
+        response = send_request(vars(args), options.address)
+    # No server, a wrong key or a server gone mid-request: the RPA flow
+    # still needs a status file
+    except (RuntimeError, OSError, EOFError, AuthenticationError) as ex:
+        write_status(args.folder_path, ex)
+        return
+    if response["status"] == "ok":
+        write_status(args.folder_path)
+    else:
+        write_status(args.folder_path, RuntimeError(response["error"]))
+
+
+if __name__ == "__main__":
+    main()
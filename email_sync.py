@@ -0,0 +1,106 @@
+"""
+Mailbox synchronisation for an Outlook session.
+Sync runs through the namespace SyncObjects, which start in the background
+and report SyncEnd as an event; a session can start a sync when it opens
+and only wait for it before an action that reads the mailbox.
+"""
+import logging
+import time
+
+# none: trust the local cache, folder: the working folder only,
+# full: every send/receive group of the profile
+SYNC_POLICIES = ("none", "folder", "full")
+
+
+class SyncEvents:
+    """SyncObject event sink; win32com calls the On<Event> methods."""
+
+    done = False
+    error = None
+
+    def OnSyncEnd(self):
+        self.done = True
+
+    def OnError(self, code, description):
+        self.error = (code, description)
+        self.done = True
+
+
+class Synchronizer:
+    def __init__(self, backend, ns, policy="full", timeout=120, metrics=None):
+        if policy not in SYNC_POLICIES:
+            raise ValueError(f"Unknown sync policy: {policy}")
+        self.backend = backend
+        self.ns = ns
+        self.policy = policy
+        self.timeout = timeout
+        self.metrics = metrics
+        self._pending = []
+        self._started = None
+        # Folders flagged for this sync only, unflagged once it ends
+        self._flagged = []
+
+    def _sync_objects(self, policy, folder):
+        sync_objects = self.ns.SyncObjects
+        if policy == "folder":
+            # The Application Folders group syncs the folders flagged here;
+            # the flag is saved in the profile, so it is put back in wait()
+            if not folder.InAppFolderSyncObject:
+                folder.InAppFolderSyncObject = True
+                self._flagged.append(folder)
+            return [sync_objects.AppFolders]
+        return [sync_objects.Item(i) for i in range(1, sync_objects.Count + 1)]
+
+    def start(self, folder=None, policy=None):
+        """Start a background sync; policy defaults to the session's."""
+        policy = policy or self.policy
+        if policy == "none":
+            return
+        for sync_object in self._sync_objects(policy, folder):
+            # Keep the sink referenced, or its connection is dropped
+            self._pending.append(
+                self.backend.with_events(sync_object, SyncEvents)
+            )
+            sync_object.Start()
+        if self._started is None:
+            self._started = time.perf_counter()
+        logging.debug(
+            "sync started: %s, %s pending", policy, len(self._pending)
+        )
+
+    @property
+    def pending(self):
+        return bool(self._pending)
+
+    def wait(self, timeout=None):
+        """Block until the started syncs end. False when they timed out."""
+        if not self._pending:
+            return True
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            self.backend.pump()
+            for sink in self._pending:
+                if sink.error:
+                    logging.error("sync error %s", sink.error)
+            self._pending = [sink for sink in self._pending if not sink.done]
+            if not self._pending:
+                break
+            if time.monotonic() >= deadline:
+                logging.error("sync still running after %ss", timeout)
+                break
+            time.sleep(0.05)
+        if self.metrics is not None and self._started is not None:
+            self.metrics.observe("Sync", time.perf_counter() - self._started)
+        self._started = None
+        if not self._pending:
+            self._unflag()
+        return not self._pending
+
+    def _unflag(self):
+        for folder in self._flagged:
+            try:
+                folder.InAppFolderSyncObject = False
+            except Exception as ex:
+                logging.error("Could not unflag sync folder %s", ex.args)
+        self._flagged = []
@@ -0,0 +1,271 @@
+"""
+Watch mode: process new mail as it arrives instead of polling.
+Items.ItemAdd events of the working folder push EntryIDs into a bounded
+queue that is drained in micro-batches. Once subscribed, a reconciliation
+sweep from the saved watermark runs, so mail received while nothing was
+watching, or during the sweep, is not missed.
+"""
+import logging
+import queue
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from email_actions import DF_COLUMNS
+from email_attachments import AttachmentSelector, AttachmentSink
+from email_cache import WatermarkStore
+from email_export import open_writer
+from email_index import MailIndex
+from email_retry import is_dead
+
+WATCH_ACTIONS = ("export", "index", "attachments", "mark", "move")
+
+
+class ItemAddEvents:
+    """Items.ItemAdd sink; win32com calls OnItemAdd with the new item."""
+
+    watcher = None
+
+    def OnItemAdd(self, item):
+        self.watcher.arrived(item)
+
+
+class Watcher:
+    def __init__(
+        self,
+        outlook,
+        folder_path,
+        state_path,
+        o_filter=None,
+        actions=("export",),
+        output_format="csv",
+        columns=None,
+        batch_size=50,
+        max_wait=5.0,
+        queue_size=1000,
+        selector=None,
+        new_folder=None,
+        index_path=None,
+        workers=4,
+    ):
+        unknown = set(actions) - set(WATCH_ACTIONS)
+        if unknown:
+            raise ValueError(f"Unknown watch actions: {sorted(unknown)}")
+        if "move" in actions and not new_folder:
+            raise ValueError("watch move needs a new folder")
+        self.outlook = outlook
+        self.folder_path = folder_path
+        self.o_filter = o_filter
+        self.actions = actions
+        self.output_format = output_format
+        self.columns = list(columns or DF_COLUMNS)
+        self.needed = outlook._needed(self.columns) | {"id", "received"}
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.selector = selector or AttachmentSelector()
+        self.new_folder = new_folder
+        self.index_path = index_path
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        # Set when the queue was full; the next sweep catches up
+        self.overflow = False
+        self.processed = 0
+        # Items whose attachments, mark or move failed; they are not retried
+        self.failed = 0
+        self.running = False
+        self.watermarks = WatermarkStore(state_path)
+        self.watermark = self.watermarks.get(outlook.inbox.FolderPath)
+        # Recent ids, so an item seen by the sweep and an event counts once
+        self._seen = OrderedDict()
+        self._writer = None
+        self._index = None
+        self._sink = None
+        self._items = None
+        self._events = None
+
+    def arrived(self, item):
+        # Runs inside the event: keep it short, the batch does the work
+        try:
+            self.queue.put_nowait(item.EntryID)
+        except queue.Full:
+            self.overflow = True
+
+    def subscribe(self):
+        # Both references must live as long as the subscription
+        self._items = self.outlook.inbox.Items
+        self._events = self.outlook.backend.with_events(
+            self._items, ItemAddEvents
+        )
+        self._events.watcher = self
+
+    def sweep(self):
+        """Process everything received since the watermark."""
+        rows = self.outlook._select_rows(
+            self.watermark.restrict_filter(self.o_filter),
+            self.needed,
+            "table",
+        )
+        batch = []
+        for row in rows:
+            if not self.watermark.is_new(row["received"], row["id"]):
+                continue
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.process(batch)
+                batch = []
+        self.process(batch)
+
+    def _drain(self, limit):
+        entry_ids = []
+        while len(entry_ids) < limit:
+            try:
+                entry_ids.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return entry_ids
+
+    def process_ids(self, entry_ids):
+        """Process the arrived items the filter selects."""
+        store_id = self.outlook.inbox.StoreID
+        rows = self.outlook._rows_for_ids(
+            [(o_id, store_id) for o_id in self._matching(entry_ids)],
+            self.needed,
+        )
+        self.process(list(rows))
+
+    # ItemAdd fires for every new item, matching the filter or not; only
+    # mail from the watermark on is read to tell which
+    def _matching(self, entry_ids):
+        if not self.o_filter:
+            return entry_ids
+        matching = {
+            row["id"]
+            for row in self.outlook._select_rows(
+                self.watermark.restrict_filter(self.o_filter), {"id"}, "table"
+            )
+        }
+        return [o_id for o_id in entry_ids if o_id in matching]
+
+    def process(self, rows):
+        rows = [row for row in rows if row["id"] not in self._seen]
+        if not rows:
+            return
+        with self.outlook.metrics.span("watch_batch"):
+            self._process(rows)
+        for row in rows:
+            self._seen[row["id"]] = None
+            self.watermark.advance(row["received"], row["id"])
+        while len(self._seen) > 10000:
+            self._seen.popitem(last=False)
+        self.watermarks.save()
+        self.processed += len(rows)
+        self.outlook.metrics.count("watched", len(rows))
+        logging.debug("watch - batch of %s processed", len(rows))
+
+    def _process(self, rows):
+        outlook = self.outlook
+        if "export" in self.actions:
+            to_row = (
+                outlook._typed_row
+                if self._writer.typed
+                else outlook._format_row
+            )
+            for row in rows:
+                self._writer.write(to_row(row, self.columns))
+            self._writer.flush()
+        if "index" in self.actions:
+            for row in rows:
+                self._index.add(row, outlook.inbox.FolderPath)
+            self._index.flush()
+        for row in rows:
+            # One item moved or deleted meanwhile must not stop the batch
+            try:
+                self._act(row["id"], row.get("store_id"))
+            except Exception as ex:
+                if is_dead(ex):
+                    raise
+                self.failed += 1
+                outlook.metrics.count("watch_failed")
+                logging.error("watch - item %s failed\n%s", row["id"], ex.args)
+
+    def _act(self, o_id, o_store_id):
+        outlook = self.outlook
+        if "attachments" in self.actions:
+            outlook._stage_attachments(
+                outlook._get_item(o_id, o_store_id),
+                self.selector,
+                self._sink,
+            )
+        if "mark" in self.actions and not outlook.mark_email(o_id, o_store_id):
+            raise outlook.last_error or RuntimeError("mark_email failed")
+        # Moving changes the EntryID, so it comes last
+        if "move" in self.actions and not outlook.move_email(
+            o_id, o_store_id, self.new_folder
+        ):
+            raise outlook.last_error or RuntimeError("move_email failed")
+
+    def _open(self):
+        if "export" in self.actions:
+            self._writer = open_writer(
+                self.output_format,
+                self.folder_path,
+                self.columns,
+                self.batch_size,
+                # One file per run: rows of earlier runs are never rewritten
+                f"df_watch_{datetime.now():%Y%m%d_%H%M%S_%f}",
+            )
+        if "index" in self.actions:
+            self._index = MailIndex(self.index_path)
+        if "attachments" in self.actions:
+            self._sink = AttachmentSink(
+                self.folder_path, self.workers, append=True
+            )
+
+    def _close(self):
+        for resource in (self._writer, self._index, self._sink):
+            if resource is not None:
+                resource.close()
+        self.watermarks.save()
+
+    def stop(self):
+        self.running = False
+
+    def run(self, duration=None, poll=0.1):
+        """Sweep, then handle events until stop() or duration seconds."""
+        self._open()
+        self.running = True
+        deadline = None if duration is None else time.monotonic() + duration
+        pending = []
+        waiting_since = None
+        try:
+            # Subscribed first: mail arriving during the sweep still gets an
+            # event, and _seen drops what both of them found
+            self.subscribe()
+            self.sweep()
+            while self.running:
+                self.outlook.backend.pump()
+                pending += self._drain(self.batch_size - len(pending))
+                if pending and waiting_since is None:
+                    waiting_since = time.monotonic()
+                if pending and (
+                    len(pending) >= self.batch_size
+                    or time.monotonic() - waiting_since >= self.max_wait
+                ):
+                    self.process_ids(pending)
+                    pending = []
+                    waiting_since = None
+                if self.overflow:
+                    self.overflow = False
+                    self.sweep()
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                time.sleep(poll)
+            if pending:
+                self.process_ids(pending)
+        except KeyboardInterrupt:
+            # Pending events are left to the next run's sweep
+            logging.debug("watch - interrupted")
+        finally:
+            self._close()
+            self.running = False
+        return self.processed
@@ -0,0 +1,1303 @@
+"""
+In-memory stand-in for the Outlook MAPI object model.
+Lets email_actions run on machines without Outlook (Linux CI, load tests).
+"""
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from email_actions import MailBackend
+
+# HRESULTs raised by the fake, same values Outlook reports through com_error
+E_FAIL = -2147467259
+MAPI_E_NOT_FOUND = -2147221233
+
+# OlDefaultFolders values understood by GetDefaultFolder
+DEFAULT_FOLDERS = {
+    3: "Deleted Items",
+    4: "Outbox",
+    5: "Sent Items",
+    6: "Inbox",
+}
+
+# OlAttachmentType values
+OL_BY_VALUE = 1
+OL_EMBEDDED_ITEM = 5
+OL_OLE = 6
+
+PR_ATTACHMENT_HIDDEN = "http://schemas.microsoft.com/mapi/proptag/0x7FFE000B"
+PR_ATTACH_CONTENT_ID = "http://schemas.microsoft.com/mapi/proptag/0x3712001F"
+
+_WORDS = (
+    "invoice order shipment payment delivery account report status "
+    "meeting update request approval contract vendor pipe steel plant "
+    "schedule quote balance statement review please attached find the "
+    "of and to for with regarding thanks regards team monthly weekly"
+).split()
+
+_DOMAINS = (
+    "example.com",
+    "vendor-a.com",
+    "vendor-b.net",
+    "logistics.example.org",
+    "bank.example.com",
+)
+
+_ATTACHMENTS = (
+    ("invoice_{n}.pdf", 180_000, OL_BY_VALUE),
+    ("statement_{n}.pdf", 90_000, OL_BY_VALUE),
+    ("report_{n}.xlsx", 40_000, OL_BY_VALUE),
+    ("terms.pdf", 250_000, OL_BY_VALUE),
+    ("image001.png", 6_000, OL_BY_VALUE),
+    ("scan_{n}.tif", 900_000, OL_BY_VALUE),
+)
+
+
+class FakeComError(Exception):
+    """Mirrors pywintypes.com_error: args are (hresult, text, excepinfo, argerr)."""
+
+    def __init__(self, hresult, text, excepinfo=None, argerr=None):
+        super().__init__(hresult, text, excepinfo, argerr)
+        self.hresult = hresult
+
+
+class FakeMailStore:
+    """
+    Synthetic MAPI store shared by every fake COM object.
+    Each property read or method call counts as one COM round-trip: it is
+    recorded in ``calls`` and delayed by ``latency`` seconds.
+    """
+
+    def __init__(
+        self,
+        default_mailbox="user@example.com",
+        latency=0.0,
+        exchange_latency=None,
+    ):
+        self.latency = latency
+        self.exchange_latency = (
+            latency if exchange_latency is None else exchange_latency
+        )
+        self.calls = Counter()
+        self.mailboxes = {}
+        self.items = {}
+        self.folders = {}
+        self.sent = []
+        self.quit_count = 0
+        # Call name -> HRESULTs raised by its next calls, see fail()
+        self.faults = {}
+        # Events raised by the fake objects, delivered by pump_events()
+        self.events = []
+        self._next_id = 0
+        self.default_mailbox = default_mailbox
+        self.add_mailbox(default_mailbox)
+
+    # Bookkeeping
+    def tick(self, name, latency=None):
+        self.calls[name] += 1
+        faults = self.faults.get(name)
+        if faults:
+            raise FakeComError(faults.pop(0), f"Injected {name} failure")
+        delay = self.latency if latency is None else latency
+        if delay:
+            time.sleep(delay)
+
+    def fail(self, name, hresult, times=1):
+        """Make the next ``times`` calls of ``name`` raise ``hresult``."""
+        self.faults.setdefault(name, []).extend([hresult] * times)
+
+    def pump_events(self):
+        events, self.events = self.events, []
+        for event in events:
+            event()
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    def new_entry_id(self):
+        self._next_id += 1
+        return f"00000000{self._next_id:040X}"
+
+    # Mailbox layout
+    def add_mailbox(self, name):
+        store_id = f"0000000038A1BB10{len(self.mailboxes):032X}"
+        root = FakeFolder(self, name, None, store_id)
+        for folder_name in DEFAULT_FOLDERS.values():
+            root.add_folder(folder_name)
+        self.mailboxes[name] = root
+        return root
+
+    def folder(self, path, mailbox=None):
+        folder = self.mailboxes[mailbox or self.default_mailbox]
+        for name in re.split(r"[/\\]", path.strip("/\\")):
+            folder = folder.child(name)
+        return folder
+
+    def add_folder(self, path, mailbox=None):
+        folder = self.mailboxes[mailbox or self.default_mailbox]
+        for name in re.split(r"[/\\]", path.strip("/\\")):
+            found = folder.find(name)
+            folder = found if found else folder.add_folder(name)
+        return folder
+
+    def add_message(
+        self, folder="Inbox", mailbox=None, attachments=(), **props
+    ):
+        target = self.folder(folder, mailbox)
+        item = FakeMailItem(self, target, props)
+        for attachment in attachments:
+            item._attachments.append(FakeAttachment(self, item, **attachment))
+        target._store_item(item)
+        return item
+
+    def populate(
+        self,
+        count,
+        folder="Inbox",
+        mailbox=None,
+        seed=0,
+        body_size=1000,
+        attachment_ratio=0.3,
+        exchange_ratio=0.3,
+        senders=300,
+        days=30,
+        now=None,
+    ):
+        """Fill a folder with ``count`` deterministic synthetic messages."""
+        rng = random.Random(seed)
+        now = now or datetime.now().replace(microsecond=0)
+        target = self.folder(folder, mailbox)
+
+        sender_pool = []
+        for n in range(senders):
+            smtp = f"sender{n}@{_DOMAINS[n % len(_DOMAINS)]}"
+            if rng.random() < exchange_ratio:
+                address = (
+                    "/O=EXCHANGELABS/OU=EXCHANGE ADMINISTRATIVE GROUP "
+                    f"(FYDIBOHF23SPDLT)/CN=RECIPIENTS/CN={n:08x}-SENDER{n}"
+                )
+                sender_pool.append((f"Sender {n}", address, "EX", smtp))
+            else:
+                sender_pool.append((f"Sender {n}", smtp, "SMTP", smtp))
+
+        # Bodies are shared between items so large mailboxes stay cheap
+        bodies = []
+        for _ in range(32):
+            words = []
+            length = 0
+            while length < body_size:
+                word = rng.choice(_WORDS)
+                if len(words) % 12 == 11:
+                    word += ".\r\n"
+                words.append(word)
+                length += len(word) + 1
+            bodies.append(" ".join(words)[:body_size])
+
+        for n in range(count):
+            name, address, kind, smtp = rng.choice(sender_pool)
+            received = now - timedelta(seconds=rng.randint(0, days * 86400))
+            body = rng.choice(bodies)
+            props = {
+                "Subject": f"{rng.choice(_WORDS).title()} "
+                f"{rng.choice(_WORDS)} {rng.randint(1000, 9999)}",
+                "Body": body,
+                "HTMLBody": f"<html><body><p>{body}</p></body></html>",
+                "To": _mailbox_name(target),
+                "CC": "" if rng.random() < 0.7 else "team@example.com",
+                "SenderName": name,
+                "SenderEmailAddress": address,
+                "SenderEmailType": kind,
+                "_smtp": smtp,
+                "ReceivedTime": received,
+                "SentOn": received - timedelta(seconds=rng.randint(1, 300)),
+                "UnRead": rng.random() < 0.5,
+            }
+            item = FakeMailItem(self, target, props)
+            if rng.random() < attachment_ratio:
+                for _ in range(rng.randint(1, 3)):
+                    pattern, size, att_type = rng.choice(_ATTACHMENTS)
+                    filename = pattern.format(n=rng.randint(1, 50))
+                    item._attachments.append(
+                        FakeAttachment(
+                            self,
+                            item,
+                            filename,
+                            size=size,
+                            type=att_type,
+                            hidden=filename.startswith("image"),
+                        )
+                    )
+            target._store_item(item)
+        return target
+
+
+def _mailbox_name(folder):
+    root = folder
+    while root._parent is not None:
+        root = root._parent
+    return root._name
+
+
+class _FakeComObject:
+    """
+    Base for fake COM objects. Capitalised attributes behave like dispatch
+    properties: every read or write ticks the store.
+    """
+
+    def __init__(self, store, props=None):
+        object.__setattr__(self, "_store", store)
+        object.__setattr__(self, "_props", dict(props or {}))
+
+    def __getattr__(self, name):
+        if name.startswith("_") or "_props" not in self.__dict__:
+            raise AttributeError(name)
+        self._store.tick(name)
+        try:
+            return self._props[name]
+        except KeyError:
+            raise AttributeError(f"<unknown>.{name}") from None
+
+    def __setattr__(self, name, value):
+        if name[:1].isupper():
+            self._store.tick(name)
+            self._props[name] = value
+        else:
+            object.__setattr__(self, name, value)
+
+
+class FakeCollection:
+    """Read-only COM collection: iterable, len(), 1-based Item()."""
+
+    def __init__(self, store, elements):
+        self._store = store
+        self._elements = list(elements)
+
+    @property
+    def Count(self):
+        self._store.tick("Count")
+        return len(self._elements)
+
+    def __len__(self):
+        return len(self._elements)
+
+    def __iter__(self):
+        for element in self._elements:
+            self._store.tick("_NewEnum")
+            yield element
+
+    def Item(self, index):
+        self._store.tick("Item")
+        try:
+            return self._elements[index - 1]
+        except (IndexError, TypeError):
+            raise FakeComError(E_FAIL, "Array index out of bounds.") from None
+
+    def __getitem__(self, index):
+        return self.Item(index + 1)
+
+
+class FakeFolders(FakeCollection):
+    def __init__(self, store, folder, children=None):
+        super().__init__(
+            store, folder._children if children is None else children
+        )
+        self._folder = folder
+
+    def Item(self, key):
+        if isinstance(key, str):
+            self._store.tick("Item")
+            found = None
+            for child in self._elements:
+                if child._name.lower() == key.lower():
+                    found = child
+                    break
+            if found is None:
+                raise FakeComError(
+                    MAPI_E_NOT_FOUND,
+                    "The attempted operation failed. "
+                    "An object could not be found.",
+                )
+            return found
+        return super().Item(key)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.Item(key)
+        return super().__getitem__(key)
+
+    def Add(self, name, folder_type=None):
+        self._store.tick("Add")
+        if self._folder is None:
+            raise FakeComError(E_FAIL, "Cannot create a top level folder.")
+        return self._folder.add_folder(name)
+
+
+class FakeFolder(_FakeComObject):
+    def __init__(self, store, name, parent, store_id):
+        super().__init__(
+            store,
+            {
+                "Name": name,
+                "EntryID": store.new_entry_id(),
+                "StoreID": store_id,
+                "DefaultItemType": 0,
+                "InAppFolderSyncObject": False,
+            },
+        )
+        self._name = name
+        self._parent = parent
+        self._children = []
+        self._messages = {}
+        # ItemAdd sinks of every Items collection of this folder
+        self._item_sinks = []
+        store.folders[self._props["EntryID"]] = self
+
+    def find(self, name):
+        for child in self._children:
+            if child._name.lower() == name.lower():
+                return child
+        return None
+
+    def child(self, name):
+        found = self.find(name)
+        if found is None:
+            raise KeyError(name)
+        return found
+
+    def add_folder(self, name):
+        folder = FakeFolder(self._store, name, self, self._props["StoreID"])
+        self._children.append(folder)
+        return folder
+
+    def _store_item(self, item):
+        self._messages[item._props["EntryID"]] = item
+        item._folder = self
+        self._store.items[item._props["EntryID"]] = item
+        if self._item_sinks:
+            self._store.events.append(lambda: self._item_added(item))
+
+    def _item_added(self, item):
+        for sink in self._item_sinks:
+            sink.OnItemAdd(item)
+
+    def _drop_item(self, item):
+        self._messages.pop(item._props["EntryID"], None)
+        self._store.items.pop(item._props["EntryID"], None)
+
+    @property
+    def Parent(self):
+        self._store.tick("Parent")
+        return self._parent
+
+    @property
+    def FolderPath(self):
+        self._store.tick("FolderPath")
+        names = []
+        folder = self
+        while folder is not None:
+            names.append(folder._name)
+            folder = folder._parent
+        return "\\\\" + "\\".join(reversed(names))
+
+    @property
+    def Folders(self):
+        self._store.tick("Folders")
+        return FakeFolders(self._store, self)
+
+    @property
+    def Items(self):
+        self._store.tick("Items")
+        return FakeItems(self._store, self, self._messages.values())
+
+    def GetTable(self, o_filter="", table_contents=0):
+        self._store.tick("GetTable")
+        items = list(self._messages.values())
+        if o_filter:
+            predicate = compile_filter(o_filter)
+            items = [item for item in items if predicate(item)]
+        return FakeTable(self._store, items)
+
+    def __str__(self):
+        return self._name
+
+
+class FakeItems(FakeCollection):
+    def __init__(self, store, folder, items):
+        super().__init__(store, items)
+        self._folder = folder
+        self._cursor = 0
+        self._sinks = folder._item_sinks
+
+    def Restrict(self, o_filter):
+        self._store.tick("Restrict")
+        predicate = compile_filter(o_filter)
+        return FakeItems(
+            self._store,
+            self._folder,
+            [item for item in self._elements if predicate(item)],
+        )
+
+    def Sort(self, prop, descending=False):
+        self._store.tick("Sort")
+        key = prop.strip("[]")
+        self._elements.sort(
+            key=lambda item: _sort_key(item._props.get(key)),
+            reverse=bool(descending),
+        )
+
+    def GetFirst(self):
+        self._store.tick("GetFirst")
+        self._cursor = 0
+        return self._current()
+
+    def GetNext(self):
+        self._store.tick("GetNext")
+        self._cursor += 1
+        return self._current()
+
+    def GetLast(self):
+        self._store.tick("GetLast")
+        self._cursor = len(self._elements) - 1
+        return self._current()
+
+    def _current(self):
+        if 0 <= self._cursor < len(self._elements):
+            return self._elements[self._cursor]
+        return None
+
+    def Add(self, item_type="IPM.Note"):
+        self._store.tick("Add")
+        item = FakeMailItem(self._store, self._folder, {})
+        self._folder._store_item(item)
+        self._elements.append(item)
+        return item
+
+
+class FakeColumns(FakeCollection):
+    def Add(self, name):
+        self._store.tick("Add")
+        if name.lower() in _TABLE_UNSUPPORTED:
+            raise FakeComError(
+                E_FAIL, f'The property "{name}" is not supported in a Table.'
+            )
+        self._elements.append(name)
+
+    def RemoveAll(self):
+        self._store.tick("RemoveAll")
+        self._elements.clear()
+
+
+class FakeRow:
+    def __init__(self, store, names, values):
+        self._store = store
+        self._names = names
+        self._values = values
+
+    def Item(self, key):
+        self._store.tick("Item")
+        if isinstance(key, str):
+            key = [n.lower() for n in self._names].index(key.lower()) + 1
+        return self._values[key - 1]
+
+    __call__ = Item
+
+    def GetValues(self):
+        self._store.tick("GetValues")
+        return self._values
+
+
+class FakeTable:
+    """Folder.GetTable result: rows are read as plain values, no items."""
+
+    def __init__(self, store, items):
+        self._store = store
+        self._items = items
+        self._columns = FakeColumns(store, _TABLE_DEFAULT_COLUMNS)
+        self._cursor = 0
+
+    @property
+    def Columns(self):
+        self._store.tick("Columns")
+        return self._columns
+
+    @property
+    def EndOfTable(self):
+        self._store.tick("EndOfTable")
+        return self._cursor >= len(self._items)
+
+    def GetRowCount(self):
+        self._store.tick("GetRowCount")
+        return len(self._items)
+
+    def MoveToStart(self):
+        self._store.tick("MoveToStart")
+        self._cursor = 0
+
+    def _values(self, item):
+        return tuple(
+            _column_value(item, name) for name in self._columns._elements
+        )
+
+    def GetNextRow(self):
+        self._store.tick("GetNextRow")
+        if self._cursor >= len(self._items):
+            return None
+        item = self._items[self._cursor]
+        self._cursor += 1
+        return FakeRow(
+            self._store, list(self._columns._elements), self._values(item)
+        )
+
+    def GetArray(self, max_rows):
+        self._store.tick("GetArray")
+        batch = self._items[self._cursor : self._cursor + max_rows]
+        self._cursor += len(batch)
+        return tuple(self._values(item) for item in batch)
+
+    def Sort(self, prop, descending=False):
+        self._store.tick("Sort")
+        key = prop.strip("[]")
+        self._items.sort(
+            key=lambda item: _sort_key(_column_value(item, key)),
+            reverse=bool(descending),
+        )
+
+    def Restrict(self, o_filter):
+        self._store.tick("Restrict")
+        predicate = compile_filter(o_filter)
+        table = FakeTable(
+            self._store,
+            [item for item in self._items if predicate(item)],
+        )
+        table._columns = FakeColumns(self._store, self._columns._elements)
+        return table
+
+
+# Properties a Table refuses in Columns.Add, as Outlook does
+_TABLE_UNSUPPORTED = {
+    "body",
+    "htmlbody",
+    "rtfbody",
+    "attachments",
+    "sender",
+    "parent",
+}
+
+_TABLE_DEFAULT_COLUMNS = (
+    "EntryID",
+    "Subject",
+    "CreationTime",
+    "LastModificationTime",
+    "MessageClass",
+)
+
+
+def _column_value(item, name):
+    if name in ("CreationTime", "LastModificationTime"):
+        return item._props["ReceivedTime"]
+    return _prop_value(item._props, name)
+
+
+class FakeAttachment(_FakeComObject):
+    def __init__(
+        self,
+        store,
+        item,
+        filename,
+        size=None,
+        data=None,
+        type=OL_BY_VALUE,
+        hidden=False,
+        content_id=None,
+        display_name=None,
+    ):
+        if data is None:
+            size = 1024 if size is None else size
+        else:
+            size = len(data)
+        super().__init__(
+            store,
+            {
+                "FileName": filename,
+                "DisplayName": display_name or filename,
+                "Size": size,
+                "Type": type,
+            },
+        )
+        self._item = item
+        self._data = data
+        self._hidden = hidden
+        self._content_id = content_id or (f"{filename}@01D9" if hidden else "")
+
+    def data(self):
+        if self._data is not None:
+            return self._data
+        # Same name and size always yields the same bytes
+        seed = f"{self._props['FileName']}:{self._props['Size']}".encode()
+        repeats = self._props["Size"] // len(seed) + 1
+        return (seed * repeats)[: self._props["Size"]]
+
+    @property
+    def Parent(self):
+        self._store.tick("Parent")
+        return self._item
+
+    @property
+    def PropertyAccessor(self):
+        self._store.tick("PropertyAccessor")
+        return FakePropertyAccessor(
+            self._store,
+            {
+                PR_ATTACHMENT_HIDDEN: self._hidden,
+                PR_ATTACH_CONTENT_ID: self._content_id,
+            },
+        )
+
+    def SaveAsFile(self, path):
+        self._store.tick("SaveAsFile")
+        with open(path, "wb") as f:
+            f.write(self.data())
+
+    # str() of a COM Attachment is its DisplayName, not the file name
+    def __str__(self):
+        return self._props["DisplayName"]
+
+
+class FakePropertyAccessor:
+    def __init__(self, store, values):
+        self._store = store
+        self._values = values
+
+    def GetProperty(self, schema_name):
+        self._store.tick("GetProperty")
+        try:
+            return self._values[schema_name]
+        except KeyError:
+            raise FakeComError(
+                MAPI_E_NOT_FOUND, f"The property {schema_name} is unknown."
+            ) from None
+
+
+class FakeAttachments(FakeCollection):
+    def __init__(self, store, item):
+        super().__init__(store, item._attachments)
+        self._item = item
+
+    def Add(self, source, type=OL_BY_VALUE, position=None, display_name=None):
+        self._store.tick("Add")
+        with open(source, "rb") as f:
+            data = f.read()
+        attachment = FakeAttachment(
+            self._store,
+            self._item,
+            display_name or os.path.basename(source),
+            data=data,
+            type=type,
+        )
+        self._item._attachments.append(attachment)
+        return attachment
+
+    def Remove(self, index):
+        self._store.tick("Remove")
+        del self._item._attachments[index - 1]
+
+
+class FakeExchangeUser(_FakeComObject):
+    pass
+
+
+class FakeAddressEntry(_FakeComObject):
+    def GetExchangeUser(self):
+        self._store.tick(
+            "GetExchangeUser", latency=self._store.exchange_latency
+        )
+        if self._props["AddressEntryUserType"] != 0:
+            return None
+        return FakeExchangeUser(
+            self._store,
+            {
+                "PrimarySmtpAddress": self._props["_smtp"],
+                "Name": self._props["Name"],
+            },
+        )
+
+    def __str__(self):
+        return self._props["Name"]
+
+
+class FakeMailItem(_FakeComObject):
+    def __init__(self, store, folder, props):
+        now = datetime.now().replace(microsecond=0)
+        defaults = {
+            "EntryID": store.new_entry_id(),
+            "Class": 43,
+            "MessageClass": "IPM.Note",
+            "Subject": "",
+            "Body": "",
+            "HTMLBody": "",
+            "To": "",
+            "CC": "",
+            "BCC": "",
+            "SenderName": "",
+            "SenderEmailAddress": "",
+            "SenderEmailType": "SMTP",
+            "SentOnBehalfOfName": "",
+            "ReceivedTime": now,
+            "SentOn": now,
+            "UnRead": True,
+            "Importance": 1,
+            "Sent": False,
+            "Categories": "",
+        }
+        defaults.update(props)
+        super().__init__(store, defaults)
+        self._folder = folder
+        self._attachments = []
+
+    @property
+    def Parent(self):
+        self._store.tick("Parent")
+        return self._folder
+
+    @property
+    def Attachments(self):
+        self._store.tick("Attachments")
+        return FakeAttachments(self._store, self)
+
+    @property
+    def Sender(self):
+        self._store.tick("Sender")
+        kind = self._props["SenderEmailType"]
+        return FakeAddressEntry(
+            self._store,
+            {
+                "Name": self._props["SenderName"],
+                "Address": self._props["SenderEmailAddress"],
+                "AddressEntryUserType": 0 if kind == "EX" else 30,
+                "_smtp": self._props.get(
+                    "_smtp", self._props["SenderEmailAddress"]
+                ),
+            },
+        )
+
+    def _check_alive(self):
+        if self._props["EntryID"] not in self._store.items and self._folder:
+            raise FakeComError(
+                MAPI_E_NOT_FOUND, "The item has been moved or deleted."
+            )
+
+    def Move(self, folder):
+        self._store.tick("Move")
+        self._check_alive()
+        self._folder._drop_item(self)
+        # Exchange hands out a new EntryID when an item changes folder
+        self._props["EntryID"] = self._store.new_entry_id()
+        folder._store_item(self)
+        return self
+
+    def Delete(self):
+        self._store.tick("Delete")
+        self._check_alive()
+        if self._folder is None:
+            return
+        root = self._folder
+        while root._parent is not None:
+            root = root._parent
+        deleted = root.child(DEFAULT_FOLDERS[3])
+        if self._folder is deleted:
+            self._folder._drop_item(self)
+            return
+        self._folder._drop_item(self)
+        self._props["EntryID"] = self._store.new_entry_id()
+        deleted._store_item(self)
+
+    def Save(self):
+        self._store.tick("Save")
+
+    def Copy(self):
+        self._store.tick("Copy")
+        copy = FakeMailItem(
+            self._store,
+            self._folder,
+            {k: v for k, v in self._props.items() if k != "EntryID"},
+        )
+        for attachment in self._attachments:
+            copy._attachments.append(
+                FakeAttachment(
+                    self._store,
+                    copy,
+                    attachment._props["FileName"],
+                    size=attachment._props["Size"],
+                    data=attachment._data,
+                    type=attachment._props["Type"],
+                    hidden=attachment._hidden,
+                )
+            )
+        if self._folder is not None:
+            self._folder._store_item(copy)
+        return copy
+
+    def SaveAs(self, path, save_type=3):
+        self._store.tick("SaveAs")
+        self._check_alive()
+        if save_type == 5:
+            payload = self._props["HTMLBody"] or self._props["Body"]
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    k: str(v)
+                    for k, v in self._props.items()
+                    if not k.startswith("_")
+                },
+                f,
+            )
+
+    def Reply(self):
+        self._store.tick("Reply")
+        return FakeMailItem(
+            self._store,
+            None,
+            {
+                "To": self._props["SenderEmailAddress"],
+                "Subject": f"RE: {self._props['Subject']}",
+            },
+        )
+
+    def Send(self):
+        self._store.tick("Send")
+        if not self._props["To"]:
+            raise FakeComError(
+                E_FAIL, "Outlook does not recognize one or more names."
+            )
+        now = datetime.now().replace(microsecond=0)
+        self._props["Sent"] = True
+        self._props["SentOn"] = now
+        self._props["UnRead"] = False
+        if self._folder is not None:
+            self._folder._drop_item(self)
+            self._props["EntryID"] = self._store.new_entry_id()
+        sent = self._store.folder(DEFAULT_FOLDERS[5])
+        sent._store_item(self)
+        self._store.sent.append(self)
+
+    def __str__(self):
+        return self._props["Subject"]
+
+
+class FakeNamespace(_FakeComObject):
+    def __init__(self, store):
+        super().__init__(store, {"CurrentProfileName": "Outlook"})
+        self._sync_objects = FakeSyncObjects(store)
+
+    @property
+    def SyncObjects(self):
+        self._store.tick("SyncObjects")
+        return self._sync_objects
+
+    @property
+    def Folders(self):
+        self._store.tick("Folders")
+        return FakeFolders(
+            self._store, None, list(self._store.mailboxes.values())
+        )
+
+    def GetDefaultFolder(self, folder_type):
+        self._store.tick("GetDefaultFolder")
+        try:
+            return self._store.folder(DEFAULT_FOLDERS[folder_type])
+        except KeyError:
+            raise FakeComError(
+                E_FAIL, f"Unsupported default folder {folder_type}"
+            ) from None
+
+    def GetItemFromID(self, entry_id, store_id=None):
+        self._store.tick("GetItemFromID")
+        item = self._store.items.get(entry_id)
+        if item is None or (
+            store_id and item._folder._props["StoreID"] != store_id
+        ):
+            raise FakeComError(
+                MAPI_E_NOT_FOUND,
+                "The attempted operation failed. "
+                "An object could not be found.",
+            )
+        return item
+
+    def GetFolderFromID(self, entry_id, store_id=None):
+        self._store.tick("GetFolderFromID")
+        folder = self._store.folders.get(entry_id)
+        if folder is None:
+            raise FakeComError(
+                MAPI_E_NOT_FOUND,
+                "The attempted operation failed. "
+                "An object could not be found.",
+            )
+        return folder
+
+    def SendAndReceive(self, show_progress_dialog=False):
+        self._store.tick("SendAndReceive")
+
+
+class FakeSyncObject(_FakeComObject):
+    """Send/receive group; SyncEnd is raised on the next pump."""
+
+    def __init__(self, store, name):
+        super().__init__(store, {"Name": name})
+        self._sinks = []
+
+    def Start(self):
+        self._store.tick("SyncStart")
+        self._store.events.append(self._end)
+
+    def _end(self):
+        for sink in self._sinks:
+            sink.OnSyncEnd()
+
+
+class FakeSyncObjects(FakeCollection):
+    def __init__(self, store):
+        super().__init__(store, [FakeSyncObject(store, "All Accounts")])
+        self._app_folders = FakeSyncObject(store, "Application Folders")
+
+    @property
+    def AppFolders(self):
+        self._store.tick("AppFolders")
+        return self._app_folders
+
+
+class FakeApplication(_FakeComObject):
+    def __init__(self, store):
+        super().__init__(store, {"Name": "Outlook", "Version": "16.0"})
+        self._namespace = FakeNamespace(store)
+
+    def GetNamespace(self, name):
+        self._store.tick("GetNamespace")
+        return self._namespace
+
+    @property
+    def Session(self):
+        self._store.tick("Session")
+        return self._namespace
+
+    @property
+    def Application(self):
+        self._store.tick("Application")
+        return self
+
+    def CreateItem(self, item_type):
+        self._store.tick("CreateItem")
+        return FakeMailItem(self._store, None, {})
+
+    def Quit(self):
+        self._store.tick("Quit")
+        self._store.quit_count += 1
+
+
+class FakeBackend(MailBackend):
+    """Backend serving Outlook from a FakeMailStore."""
+
+    def __init__(self, store=None):
+        self.store = store or FakeMailStore()
+
+    def dispatch(self):
+        return FakeApplication(self.store)
+
+    def with_events(self, com_object, handler_class):
+        sink = handler_class()
+        com_object._sinks.append(sink)
+        return sink
+
+    def pump(self):
+        self.store.pump_events()
+
+
+# Restrict filter evaluation
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<prop>\[[^\]]+\])
+      | (?P<dquote>"[^"]*")
+      | (?P<squote>'(?:[^']|'')*')
+      | (?P<op><=|>=|<>|=|<|>)
+      | (?P<paren>[()])
+      | (?P<word>[\w.:@%-]+)
+    )""",
+    re.VERBOSE,
+)
+
+_DATE_FORMATS = (
+    "%Y-%m-%d %I:%M %p",
+    "%m/%d/%Y %I:%M %p",
+    "%m/%d/%y %I:%M %p",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%m/%d/%Y %H:%M",
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%m/%d/%y",
+)
+
+
+def _parse_date(value):
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    raise FakeComError(E_FAIL, f"Cannot parse condition value '{value}'.")
+
+
+def _sort_key(value):
+    if value is None:
+        return (0, "")
+    if isinstance(value, str):
+        return (1, value.lower())
+    return (1, value)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise FakeComError(E_FAIL, f"Cannot parse condition: {text!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    return tokens
+
+
+# DASL property names -> value of a fake item
+_DASL_PROPERTIES = {
+    "urn:schemas:httpmail:subject": lambda item: item._props["Subject"],
+    "urn:schemas:httpmail:textdescription": lambda item: item._props["Body"],
+    "urn:schemas:httpmail:fromname": lambda item: item._props["SenderName"],
+    "urn:schemas:httpmail:fromemail": (
+        lambda item: item._props["SenderEmailAddress"]
+    ),
+    "http://schemas.microsoft.com/mapi/proptag/0x5D01001F": (
+        lambda item: item._props.get(
+            "_smtp", item._props["SenderEmailAddress"]
+        )
+    ),
+    "urn:schemas:httpmail:datereceived": (
+        lambda item: item._props["ReceivedTime"]
+    ),
+    "urn:schemas:httpmail:date": lambda item: item._props["SentOn"],
+    "urn:schemas:httpmail:read": lambda item: int(not item._props["UnRead"]),
+    "urn:schemas:httpmail:hasattachment": (
+        lambda item: int(bool(item._attachments))
+    ),
+    "urn:schemas-microsoft-com:office:office#Keywords": (
+        lambda item: [
+            c.strip() for c in item._props["Categories"].split(",") if c
+        ]
+    ),
+    "urn:schemas:httpmail:displayto": lambda item: item._props["To"],
+    "urn:schemas:httpmail:displaycc": lambda item: item._props["CC"],
+}
+_DASL_DATES = {
+    "urn:schemas:httpmail:datereceived",
+    "urn:schemas:httpmail:date",
+}
+_DASL_OPERATORS = ("like", "ci_phrasematch", "ci_startswith")
+
+
+class _FilterParser:
+    """
+    Recursive-descent parser for Restrict filters: Jet ([Prop] = value) or,
+    with dasl, the @SQL= syntax ("urn:..." like '%value%').
+    """
+
+    def __init__(self, text, dasl=False):
+        self.text = text
+        self.dasl = dasl
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def keyword(self, word):
+        kind, value = self.peek()
+        if kind == "word" and value.upper() == word:
+            self.pos += 1
+            return True
+        return False
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise FakeComError(
+                E_FAIL, f"Cannot parse condition: {self.text!r}"
+            )
+        return predicate
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.keyword("OR"):
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda props: any(term(props) for term in terms)
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.keyword("AND"):
+            terms.append(self.parse_not())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda props: all(term(props) for term in terms)
+
+    def parse_not(self):
+        if self.keyword("NOT"):
+            term = self.parse_not()
+            return lambda props: not term(props)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.peek()
+        if kind == "paren" and value == "(":
+            self.take()
+            term = self.parse_or()
+            if self.take() != ("paren", ")"):
+                raise FakeComError(
+                    E_FAIL, f"Unbalanced parentheses: {self.text!r}"
+                )
+            return term
+        return self.parse_comparison()
+
+    def parse_property(self):
+        kind, value = self.take()
+        if kind != "prop":
+            raise FakeComError(E_FAIL, f"Expected a property in {self.text!r}")
+        return value[1:-1]
+
+    def parse_value(self):
+        kind, value = self.take()
+        if kind == "squote":
+            return value[1:-1].replace("''", "'")
+        if kind == "dquote":
+            return value[1:-1]
+        if kind == "word":
+            if value.lower() == "true":
+                return True
+            if value.lower() == "false":
+                return False
+            try:
+                return int(value)
+            except ValueError:
+                return value
+        raise FakeComError(E_FAIL, f"Expected a value in {self.text!r}")
+
+    def parse_dasl_property(self):
+        kind, value = self.take()
+        if kind != "dquote" or value[1:-1] not in _DASL_PROPERTIES:
+            raise FakeComError(
+                E_FAIL, f"Unknown DASL property {value} in {self.text!r}"
+            )
+        return value[1:-1]
+
+    def parse_comparison(self):
+        if self.dasl:
+            urn = self.parse_dasl_property()
+            getter = _DASL_PROPERTIES[urn]
+        else:
+            prop = self.parse_property()
+            getter = lambda item: _prop_value(item._props, prop)
+        kind, op = self.take()
+        if kind == "word" and self.dasl and op.lower() in _DASL_OPERATORS:
+            op = op.lower()
+        elif kind != "op":
+            raise FakeComError(
+                E_FAIL, f"Expected an operator in {self.text!r}"
+            )
+        expected = self.parse_value()
+        if self.dasl and urn in _DASL_DATES:
+            # DASL dates are UTC, items hold local times
+            expected = (
+                _parse_date(expected)
+                .replace(tzinfo=timezone.utc)
+                .astimezone()
+                .replace(tzinfo=None)
+            )
+        return lambda item: _compare(getter(item), op, expected)
+
+
+def _prop_value(props, name):
+    # Property names in filters are case-insensitive
+    if name in props:
+        return props[name]
+    lowered = name.lower()
+    for key, value in props.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+def _compare(actual, op, expected):
+    if isinstance(actual, list):
+        # Multi-valued properties match when any value does
+        if op == "<>":
+            return all(_compare(value, op, expected) for value in actual)
+        return any(_compare(value, op, expected) for value in actual)
+    if op in _DASL_OPERATORS:
+        if not isinstance(actual, str):
+            return False
+        if op == "like":
+            pattern = "".join(
+                ".*" if c == "%" else "." if c == "_" else re.escape(c)
+                for c in str(expected)
+            )
+            return bool(re.fullmatch(pattern, actual, re.I | re.S))
+        pattern = r"\b" + re.escape(str(expected))
+        if op == "ci_phrasematch":
+            pattern += r"\b"
+        return bool(re.search(pattern, actual, re.I))
+    if isinstance(actual, datetime) and isinstance(expected, str):
+        expected = _parse_date(expected)
+    elif isinstance(actual, bool) and not isinstance(expected, bool):
+        expected = bool(expected)
+    elif isinstance(actual, str) and isinstance(expected, str):
+        actual, expected = actual.lower(), expected.lower()
+    elif actual is None:
+        return op == "<>"
+    try:
+        if op == "=":
+            return actual == expected
+        if op == "<>":
+            return actual != expected
+        if op == "<":
+            return actual < expected
+        if op == "<=":
+            return actual <= expected
+        if op == ">":
+            return actual > expected
+        return actual >= expected
+    except TypeError:
+        return False
+
+
+def compile_filter(o_filter):
+    """Turn a Restrict filter string into a predicate over fake items."""
+    if o_filter[:5].upper() == "@SQL=":
+        return _FilterParser(o_filter[5:], dasl=True).parse()
+    return _FilterParser(o_filter).parse()
@@ -0,0 +1,49 @@
+import unittest
+
+# Importing the code to be tested
+from bench_email_actions import bench_cold_start, compare, run_case
+
+
+class TestBench(unittest.TestCase):
+    # Test that every metric of a small case is measured
+    def test_run_case(self):
+        result = run_case("get_emails", 200, "mixed")
+        self.assertGreater(result["rows"], 0)
+        self.assertGreater(result["rows_per_sec"], 0)
+        self.assertGreater(result["calls_per_item"], 0)
+        result = run_case("get_attachments", 200, "exchange")
+        self.assertGreater(result["mb_per_sec"], 0)
+        result = run_case("batch", 100, "smtp")
+        self.assertEqual(result["errors"], 0)
+        self.assertEqual(result["actions"], 100)
+
+    # Test that a light action starts without loading pandas
+    def test_cold_start(self):
+        result = bench_cold_start(1)
+        self.assertFalse(result["pandas_loaded"])
+        self.assertGreater(result["startup_seconds"], 0)
+
+    # Test the regression gate in both metric directions
+    def test_compare(self):
+        baseline = {
+            "get_emails/1k/mixed": {"rows_per_sec": 1000, "peak_rss_mb": 100},
+            "batch/1k/mixed": {"actions_per_sec": 500},
+        }
+        results = {
+            "get_emails/1k/mixed": {"rows_per_sec": 850, "peak_rss_mb": 130},
+            "batch/1k/mixed": {"actions_per_sec": 350},
+            "get_emails/10k/mixed": {"rows_per_sec": 1},
+        }
+        self.assertEqual(
+            compare(baseline, results, 0.2),
+            [
+                ("get_emails/1k/mixed", "peak_rss_mb", 100, 130),
+                ("batch/1k/mixed", "actions_per_sec", 500, 350),
+            ],
+        )
+        self.assertEqual(compare(baseline, results, 0.5), [])
+
+
+# Execute tests
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,11 @@
 import unittest
 import os
-import re
 import time
 import win32com.client as wc
 
 # Importing the code to be tested
 from email_actions import Outlook
+from email_archive import archive_name
 
 
 class TestOutlook(unittest.TestCase):
@@ -160,8 +160,8 @@ class TestOutlook(unittest.TestCase):
                 break
 
         # Check that the file was created
-        subj = re.sub("\W", "_", subject)
-        filename = os.path.join(self.temp_path, f"{subj}.msg")
+        name = archive_name(message.ReceivedTime, subject, message.EntryID)
+        filename = os.path.join(self.temp_path, name)
         time.sleep(self.wait)
         self.assertTrue(os.path.isfile(filename))
 
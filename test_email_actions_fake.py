@@ -0,0 +1,673 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+import pandas as pd
+
+# Importing the code to be tested
+from email_actions import (
+    ACTIONS,
+    DF_COLUMNS,
+    Outlook,
+    batch_actions,
+    parse_args,
+    run_action,
+    run_query,
+)
+from email_attachments import AttachmentSelector
+from email_index import MailIndex
+from email_retry import (
+    RPC_E_CALL_REJECTED,
+    RPC_S_SERVER_UNAVAILABLE,
+    RetryPolicy,
+)
+from fake_outlook import E_FAIL, FakeBackend, FakeMailStore
+
+
+class TestOutlookFake(unittest.TestCase):
+    # SetUp, executes before every function to test
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+        self.store = FakeMailStore()
+        self.store.populate(300, seed=1)
+        self.new_folder = "Desarrollos"
+        self.store.add_folder(f"Inbox/{self.new_folder}")
+        self.o = Outlook(None, None, backend=FakeBackend(self.store))
+
+    # TearDown, executes after every function to test
+    def tearDown(self) -> None:
+        self.o.close()
+        shutil.rmtree(self.temp_path)
+
+    def first_with_attachments(self):
+        for message in self.o.inbox.Items:
+            if len(message.Attachments) > 0:
+                return message
+
+    # Test the __init__() method
+    def test_init(self):
+        self.assertEqual(self.o.inbox.Name, "Inbox")
+        # One full sync on open, waited for
+        self.assertEqual(self.store.calls["SyncStart"], 1)
+        self.assertFalse(self.o.sync.pending)
+
+    def test_sync_policy(self):
+        self.store.reset_calls()
+        o = Outlook(None, None, backend=FakeBackend(self.store), sync="none")
+        o.get_emails("[Unread]=True", self.temp_path, columns=["id"])
+        o.close()
+        self.assertEqual(self.store.calls["SyncStart"], 0)
+
+        o = Outlook(
+            None,
+            "Desarrollos",
+            backend=FakeBackend(self.store),
+            sync="folder",
+            sync_async=True,
+        )
+        self.assertTrue(o.inbox.InAppFolderSyncObject)
+        # Started in the background, waited for before reading
+        self.assertTrue(o.sync.pending)
+        o.fresh()
+        self.assertFalse(o.sync.pending)
+        # The profile keeps no folder flagged by a finished sync
+        self.assertFalse(o.inbox.InAppFolderSyncObject)
+        o.inbox.InAppFolderSyncObject = True
+        o.sync.start(o.inbox)
+        o.sync.wait()
+        # A flag the user set is left alone
+        self.assertTrue(o.inbox.InAppFolderSyncObject)
+        self.assertEqual(self.store.calls["AppFolders"], 2)
+
+    def test_sync_on_close(self):
+        self.o.close()
+        self.assertEqual(self.store.calls["SyncStart"], 1)
+        self.o.send_email(
+            None, "someone@example.com", None, "Hi", "Body", None, None
+        )
+        # Only a session that sent mail flushes the Outbox on close
+        self.o.close()
+        self.assertEqual(self.store.calls["SyncStart"], 2)
+
+    # Test the get_emails() method
+    def test_get_emails(self):
+        self.o.get_emails("[Unread]=True", self.temp_path)
+        df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+        unread = self.store.folder("Inbox").Items.Restrict("[Unread]=True")
+        self.assertEqual(len(df), len(unread))
+        self.assertTrue(df["sender_add"].str.contains("@").all())
+
+    def test_get_emails_date_filter(self):
+        self.store.add_message(
+            Subject="Old one",
+            ReceivedTime=datetime(2020, 1, 5, 10, 0),
+            SentOn=datetime(2020, 1, 5, 9, 59),
+        )
+        self.o.get_emails(
+            "[SentOn] > '2020-1-4 12:00 AM' AND [SentOn] < '2020-1-6 11:59 PM'",
+            self.temp_path,
+        )
+        df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+        self.assertEqual(list(df["subject"]), ["Old one"])
+
+    def test_get_emails_table(self):
+        self.store.reset_calls()
+        self.o.get_emails("[Unread]=True", self.temp_path)
+        items_calls = self.store.total_calls()
+        expected = pd.read_excel(f"{self.temp_path}/df.xlsx")
+
+        self.store.reset_calls()
+        self.o.get_emails("[Unread]=True", self.temp_path, "table")
+        table_calls = self.store.total_calls()
+        df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+
+        pd.testing.assert_frame_equal(df, expected)
+        self.assertLess(table_calls * 2, items_calls)
+
+    def test_get_emails_streamed(self):
+        self.o.get_emails("[Unread]=True", self.temp_path)
+        expected = pd.read_excel(f"{self.temp_path}/df.xlsx")
+        self.o.get_emails(
+            "[Unread]=True", self.temp_path, output_format="csv", chunk_size=50
+        )
+        df = pd.read_csv(f"{self.temp_path}/df.csv")
+        self.assertEqual(list(df.columns), list(expected.columns))
+        self.assertEqual(list(df["id"]), list(expected["id"]))
+
+    def test_get_emails_columns(self):
+        columns = ["id", "subject", "sender_add"]
+        for read_mode in ("items", "table"):
+            self.store.reset_calls()
+            self.o.get_emails(
+                "[Unread]=True", self.temp_path, read_mode, columns=columns
+            )
+            df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+            self.assertEqual(list(df.columns), columns)
+            self.assertTrue(df["sender_add"].str.contains("@").all())
+            for prop in ("Body", "Attachments", "SentOn"):
+                self.assertEqual(self.store.calls[prop], 0)
+
+    def test_get_emails_sender_cache(self):
+        self.o.get_emails("[Unread]=True", self.temp_path, "table")
+        lookups = self.store.calls["GetExchangeUser"]
+        stats = self.o.senders.stats()
+        self.assertEqual(lookups, stats["misses"])
+        self.assertEqual(lookups, stats["size"])
+        # Second export: every Exchange sender comes from the cache
+        self.store.reset_calls()
+        self.o.get_emails(
+            "[Unread]=True", self.temp_path, "table", columns=["sender_add"]
+        )
+        self.assertEqual(self.store.calls["GetExchangeUser"], 0)
+        self.assertEqual(self.store.calls["GetItemFromID"], 0)
+
+    def test_get_emails_incremental(self):
+        state_path = f"{self.temp_path}/state.json"
+        self.o.get_emails(
+            "[Unread]=True", self.temp_path, state_path=state_path
+        )
+        first = pd.read_excel(f"{self.temp_path}/df.xlsx")
+        self.assertGreater(len(first), 0)
+
+        # Nothing new: an empty export
+        self.o.get_emails(
+            "[Unread]=True", self.temp_path, state_path=state_path
+        )
+        self.assertEqual(len(pd.read_excel(f"{self.temp_path}/df.xlsx")), 0)
+
+        self.store.add_message(Subject="Fresh", UnRead=True)
+        self.o.get_emails(
+            "[Unread]=True", self.temp_path, state_path=state_path
+        )
+        df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+        self.assertEqual(list(df["subject"]), ["Fresh"])
+
+    def test_get_emails_incremental_limit(self):
+        state_path = f"{self.temp_path}/state.json"
+        unread = len(self.o.inbox.Items.Restrict("[Unread]=True"))
+        exported = []
+        for _ in range(unread // 10 + 2):
+            self.o.get_emails(
+                "[Unread]=True",
+                self.temp_path,
+                "table",
+                "csv",
+                state_path=state_path,
+                columns=["id"],
+                limit=10,
+            )
+            exported += list(pd.read_csv(f"{self.temp_path}/df.csv")["id"])
+        # Every run continues where the previous one stopped
+        self.assertEqual(len(exported), unread)
+        self.assertEqual(len(set(exported)), unread)
+        with self.assertRaises(ValueError):
+            self.o.get_emails(
+                "[Unread]=True",
+                self.temp_path,
+                state_path=state_path,
+                limit=10,
+                descending=True,
+            )
+
+    def test_get_emails_incremental_skipped(self):
+        state_path = f"{self.temp_path}/state.json"
+        unread = len(self.o.inbox.Items.Restrict("[Unread]=True"))
+        for read_mode in ("items", "table"):
+            if os.path.exists(state_path):
+                os.remove(state_path)
+            # An item failing for good is read again by the next run
+            self.store.fail("Body", E_FAIL)
+            self.o.get_emails(
+                "[Unread]=True",
+                self.temp_path,
+                read_mode,
+                "csv",
+                state_path=state_path,
+            )
+            first = pd.read_csv(f"{self.temp_path}/df.csv")
+            self.assertEqual(len(first), unread - 1)
+            self.o.get_emails(
+                "[Unread]=True",
+                self.temp_path,
+                read_mode,
+                "csv",
+                state_path=state_path,
+            )
+            second = pd.read_csv(f"{self.temp_path}/df.csv")
+            self.assertEqual(len(second), 1)
+            self.assertNotIn(second["id"][0], list(first["id"]))
+            self.o.get_emails(
+                "[Unread]=True",
+                self.temp_path,
+                read_mode,
+                "csv",
+                state_path=state_path,
+            )
+            self.assertEqual(len(pd.read_csv(f"{self.temp_path}/df.csv")), 0)
+
+    def test_get_emails_retry(self):
+        o = Outlook(
+            None,
+            None,
+            backend=FakeBackend(self.store),
+            retry=RetryPolicy(sleep=lambda seconds: None),
+        )
+        unread = self.store.folder("Inbox").Items.Restrict("[Unread]=True")
+        for read_mode in ("items", "table"):
+            # Busy calls are repeated, an item that fails for good is left out
+            self.store.fail("ReceivedTime", RPC_E_CALL_REJECTED, 2)
+            self.store.fail("GetArray", RPC_E_CALL_REJECTED)
+            self.store.fail("Body", E_FAIL)
+            o.get_emails("[Unread]=True", self.temp_path, read_mode)
+            df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+            self.assertEqual(len(df), len(unread) - 1)
+            self.assertEqual(o.skipped, 1)
+        # A dead session stops the export
+        self.store.fail("Subject", RPC_S_SERVER_UNAVAILABLE)
+        with self.assertRaises(Exception):
+            o.get_emails("[Unread]=True", self.temp_path)
+
+    def test_get_emails_metrics(self):
+        self.o.get_emails("[Unread]=True", self.temp_path, "table")
+        rows = len(pd.read_excel(f"{self.temp_path}/df.xlsx"))
+        spans = self.o.metrics.spans
+        self.assertEqual(spans["Restrict"].count, 1)
+        self.assertEqual(spans["item"].count, rows)
+        self.assertEqual(spans["GetItemFromID"].count, rows)
+        self.o.write_metrics(f"{self.temp_path}/metrics.prom")
+        with open(f"{self.temp_path}/metrics.prom", encoding="utf-8") as f:
+            self.assertIn(f'{{name="rows_exported"}} {rows}', f.read())
+
+    def test_get_emails_limit(self):
+        newest = sorted(
+            self.store.folder("Inbox").Items.Restrict("[Unread]=True"),
+            key=lambda x: x.ReceivedTime,
+            reverse=True,
+        )[:10]
+        for read_mode in ("items", "table"):
+            self.store.reset_calls()
+            self.o.get_emails(
+                "[Unread]=True",
+                self.temp_path,
+                read_mode,
+                columns=["id", "subject"],
+                limit=10,
+                sort_by="received",
+                descending=True,
+            )
+            df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+            self.assertEqual(list(df["id"]), [x.EntryID for x in newest])
+            # Reading stops at the limit
+            self.assertLessEqual(self.store.calls["Subject"], 10)
+
+    def test_get_emails_parquet(self):
+        self.o.get_emails("[Unread]=True", self.temp_path, "table", "parquet")
+        df = pd.read_parquet(f"{self.temp_path}/df.parquet")
+        self.assertEqual(list(df.columns), DF_COLUMNS)
+        self.assertEqual(str(df["sender_add"].dtype), "category")
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df["received"]))
+        self.assertTrue(
+            (df["attachments"].map(len) == df["attachments_count"]).all()
+        )
+
+    def test_get_emails_index(self):
+        index_path = f"{self.temp_path}/index.sqlite"
+        self.o.get_emails(
+            "[Unread]=True", self.temp_path, "table", index_path=index_path
+        )
+        df = pd.read_excel(f"{self.temp_path}/df.xlsx")
+        word = df["subject"][0].split()[1]
+        with MailIndex(index_path) as index:
+            self.assertEqual(len(index), len(df))
+            found = {row["id"] for row in index.search(word, limit=500)}
+        self.assertEqual(
+            found,
+            set(df[df["subject"].str.contains(rf"\b{word}\b")]["id"])
+            | set(df[df["body"].str.contains(rf"\b{word}\b")]["id"]),
+        )
+        # The query action writes what the index found
+        args = parse_args(
+            [
+                "--email_action",
+                "query",
+                "--query",
+                word,
+                "--index_path",
+                index_path,
+                "--limit",
+                "500",
+                "--folder_path",
+                self.temp_path,
+            ],
+            "test",
+        )
+        run_query(args)
+        results = pd.read_csv(f"{self.temp_path}/query_results.csv")
+        self.assertEqual(set(results["id"]), found)
+
+    # Test the iter_emails() generator
+    def test_iter_emails(self):
+        self.store.reset_calls()
+        records = self.o.iter_emails("[Unread]=True", ["id", "subject"])
+        record = next(records)
+        # Nothing past the first record has been read
+        self.assertEqual(self.store.calls["GetArray"], 1)
+        self.assertEqual(self.store.calls["GetItemFromID"], 0)
+        message = self.o.ns.GetItemFromID(record.id)
+        self.assertEqual(record.subject, message.Subject)
+        self.assertIsNone(record.sender)
+        self.assertEqual(
+            record.attachments, [att.FileName for att in message.Attachments]
+        )
+        self.assertEqual(
+            len(list(records)) + 1,
+            len(self.store.folder("Inbox").Items.Restrict("[Unread]=True")),
+        )
+        with self.assertRaises(AttributeError):
+            record.extra = 1
+
+    # Test the get_attachments() method
+    def test_get_attachments(self):
+        message = self.first_with_attachments()
+        names = [att.FileName for att in message.Attachments]
+        self.o.get_attachments(
+            message.EntryID, message.Parent.StoreID, self.temp_path, "*"
+        )
+        for name in names:
+            self.assertTrue(os.path.isfile(f"{self.temp_path}/{name}"))
+        # Saved under the file name, not the display name
+        message = self.store.add_message(
+            attachments=[{"filename": "q3.pdf", "display_name": "Q3 report"}]
+        )
+        self.o.get_attachments(
+            message.EntryID, message.Parent.StoreID, self.temp_path, "*"
+        )
+        self.assertTrue(os.path.isfile(f"{self.temp_path}/q3.pdf"))
+
+    def test_get_attachments_bulk(self):
+        counts = self.o.get_attachments_bulk(
+            self.temp_path, "*.pdf", "[Unread]=True"
+        )
+        unread = self.store.folder("Inbox").Items.Restrict("[Unread]=True")
+        pdfs = {
+            (att.FileName, att.Size)
+            for message in unread
+            for att in message.Attachments
+            if ".pdf" in att.FileName
+        }
+        # Same name and size means same bytes in the fake store
+        self.assertEqual(counts["saved"], len(pdfs))
+        self.assertGreater(counts["duplicate"], 0)
+        first = counts
+        files = set(os.listdir(self.temp_path)) - {"attachments.csv"}
+        self.assertEqual(len(files), len(pdfs))
+
+        # A metadata read failing for good is recorded, the run goes on
+        self.store.fail("Size", E_FAIL)
+        counts = self.o.get_attachments_bulk(
+            f"{self.temp_path}/sized",
+            o_filter="[Unread]=True",
+            selector=AttachmentSelector("*.pdf", min_size=1),
+        )
+        self.assertEqual(counts["failed"], 1)
+        self.assertEqual(
+            counts["saved"] + counts["duplicate"],
+            first["saved"] + first["duplicate"] - 1,
+        )
+
+    def test_get_attachments_bulk_ids(self):
+        message = self.first_with_attachments()
+        counts = self.o.get_attachments_bulk(
+            self.temp_path,
+            o_ids=[(message.EntryID, None), ("missing", None)],
+        )
+        self.assertEqual(counts["failed"], 1)
+        self.assertEqual(
+            counts["saved"] + counts["duplicate"], len(message.Attachments)
+        )
+
+    # Test send email() method
+    def test_send_email(self):
+        self.o.send_email(
+            o_from=None,
+            o_to="someone@example.com",
+            o_cc=None,
+            o_subj="Test email",
+            o_body="This is a test email.",
+            o_html_body=None,
+            o_att_path=None,
+        )
+        self.assertEqual([x.Subject for x in self.store.sent], ["Test email"])
+
+    # Test send_bulk() method
+    def test_send_bulk(self):
+        attachment = f"{self.temp_path}/terms.pdf"
+        with open(attachment, "wb") as f:
+            f.write(b"%PDF terms")
+        recipients = f"{self.temp_path}/recipients.csv"
+        with open(recipients, "w", encoding="utf-8") as f:
+            f.write("to,name\n")
+            f.write("ana@example.com,Ana\n")
+            f.write(",Nobody\n")
+            f.write("luis@example.com,Luis\n")
+        results = f"{self.temp_path}/send_results.csv"
+        self.store.reset_calls()
+        counts = self.o.send_bulk(
+            recipients,
+            None,
+            "Hello {{name}}",
+            "Dear {{name}}, see the terms.",
+            None,
+            [attachment],
+            results,
+            rate=0,
+        )
+        self.assertEqual(counts, {"ok": 2, "error": 1})
+        self.assertEqual(
+            [x.Subject for x in self.store.sent], ["Hello Ana", "Hello Luis"]
+        )
+        self.assertEqual(len(self.store.sent[1].Attachments), 1)
+        # The shared file is attached once, to the template
+        self.assertEqual(self.store.calls["Add"], 1)
+        self.assertEqual(list(pd.read_csv(results)["status"]).count("ok"), 2)
+
+        # A copy Send refused is deleted, not left behind as a draft
+        self.store.reset_calls()
+        self.store.fail("Send", E_FAIL)
+        counts = self.o.send_bulk(
+            recipients, None, "Hi", "Body", None, None, results, rate=0
+        )
+        self.assertEqual(counts, {"ok": 1, "error": 2})
+        # The template and the refused copy
+        self.assertEqual(self.store.calls["Delete"], 2)
+
+    # Test save_emails_bulk() method
+    def test_save_emails_bulk(self):
+        received = datetime(2026, 3, 2, 9, 30)
+        for _ in range(2):
+            self.store.add_message(
+                Subject="RE: Invoice", ReceivedTime=received
+            )
+        o_filter = "[Subject] = 'RE: Invoice'"
+        counts = self.o.save_emails_bulk(self.temp_path, o_filter)
+        self.assertEqual(counts, {"saved": 2, "skipped": 0, "failed": 0})
+        names = sorted(os.listdir(self.temp_path))
+        self.assertEqual(len(names), 2)
+        self.assertTrue(names[0].startswith("20260302_093000_RE_Invoice_"))
+        self.assertRegex(names[0], r"_[0-9a-f]{16}\.msg$")
+
+        # A re-run opens nothing that is already saved
+        self.store.reset_calls()
+        counts = self.o.save_emails_bulk(self.temp_path, o_filter)
+        self.assertEqual(counts["skipped"], 2)
+        self.assertEqual(self.store.calls["SaveAs"], 0)
+        self.assertEqual(self.store.calls["GetItemFromID"], 0)
+
+        counts = self.o.save_emails_bulk(
+            self.temp_path, o_filter, None, "html"
+        )
+        self.assertEqual(counts["saved"], 2)
+        self.assertEqual(len(os.listdir(self.temp_path)), 4)
+
+        # The action fails when any email could not be saved
+        self.store.fail("SaveAs", E_FAIL)
+        args = parse_args(
+            [
+                "--email_action",
+                "save_emails_bulk",
+                "--mail_filter",
+                o_filter,
+                "--save_format",
+                "mhtml",
+                "--folder_path",
+                self.temp_path,
+            ],
+            "test",
+        )
+        with self.assertRaises(RuntimeError):
+            run_action(self.o, args)
+        self.assertEqual(len(os.listdir(self.temp_path)), 5)
+
+    # Test mark_email() method
+    def test_mark_email(self):
+        message = self.o.inbox.Items.Restrict("[Unread]=True").GetFirst()
+        self.o.mark_email(message.EntryID, message.Parent.StoreID)
+        self.assertFalse(message.UnRead)
+
+    # Test move_email() method
+    def test_move_email(self):
+        message = self.o.inbox.Items.GetFirst()
+        self.o.move_email(
+            message.EntryID, message.Parent.StoreID, self.new_folder
+        )
+        moved = self.store.folder(f"Inbox/{self.new_folder}").Items
+        self.assertEqual(len(moved), 1)
+        self.assertEqual(len(self.o.inbox.Items), 299)
+
+    def test_move_email_nested(self):
+        self.store.add_folder("Inbox/Vendors/2026")
+        messages = list(self.o.inbox.Items)[:5]
+        self.o.move_email(messages[0].EntryID, None, "Inbox/Vendors/2026")
+        self.store.reset_calls()
+        for message in messages[1:]:
+            self.o.move_email(message.EntryID, None, "Vendors/2026")
+        # Resolved folders are reused: no Folders walk after the first move
+        self.assertEqual(self.store.calls["Folders"], 0)
+        moved = self.store.folder("Inbox/Vendors/2026").Items
+        self.assertEqual(len(moved), 5)
+
+    # Test that folders created after a failed lookup are found
+    def test_move_email_new_folder(self):
+        message = self.o.inbox.Items.GetFirst()
+        self.assertFalse(self.o.move_email(message.EntryID, None, "Later"))
+        self.store.add_folder("Inbox/Later")
+        self.assertTrue(self.o.move_email(message.EntryID, None, "Later"))
+        # A miss is remembered for missing_ttl seconds only
+        with self.assertRaises(LookupError):
+            self.o.folders.resolve("Soon")
+        self.store.add_folder("Inbox/Soon")
+        with self.assertRaises(LookupError):
+            self.o.folders.resolve("Soon")
+        later = time.monotonic() + self.o.folders.missing_ttl + 1
+        with mock.patch("email_actions.time.monotonic", return_value=later):
+            self.assertEqual(self.o.folders.resolve("Soon").Name, "Soon")
+
+    def test_init_nested_folder(self):
+        self.store.add_folder("Inbox/Vendors/2026")
+        self.store.add_message(folder="Inbox/Vendors/2026", Subject="Deep")
+        o = Outlook(None, "Vendors/2026", backend=FakeBackend(self.store))
+        self.assertEqual(o.inbox.Name, "2026")
+        o = Outlook(None, "Nowhere", backend=FakeBackend(self.store))
+        self.assertEqual(o.inbox.Name, "Inbox")
+
+    # Test delete_email() method
+    def test_delete_email(self):
+        message = self.o.inbox.Items.GetFirst()
+        entry_id = message.EntryID
+        self.o.delete_email(entry_id, message.Parent.StoreID)
+        with self.assertRaises(Exception):
+            self.o.ns.GetItemFromID(entry_id)
+
+    # Test that moves and deletes keep the search index up to date
+    def test_move_delete_index(self):
+        self.o.index_path = f"{self.temp_path}/index.sqlite"
+        self.o.get_emails(
+            None,
+            self.temp_path,
+            "table",
+            "csv",
+            columns=["id", "subject"],
+            index_path=self.o.index_path,
+        )
+        first, second = list(self.o.inbox.Items)[:2]
+        old_id, deleted_id = first.EntryID, second.EntryID
+        self.o.move_email(old_id, None, self.new_folder)
+        self.o.delete_email(deleted_id, None)
+        with MailIndex(self.o.index_path) as index:
+            self.assertEqual(len(index), 299)
+            rows = {row["id"]: row for row in index.search(limit=500)}
+        self.assertNotIn(old_id, rows)
+        self.assertNotIn(deleted_id, rows)
+        self.assertTrue(
+            rows[first.EntryID]["folder"].endswith(self.new_folder)
+        )
+
+    # Test run_batch() method
+    def test_run_batch(self):
+        messages = list(self.o.inbox.Items)[:3]
+        manifest = f"{self.temp_path}/manifest.csv"
+        with open(manifest, "w", encoding="utf-8") as f:
+            f.write("id,store_id,action,new_folder\n")
+            f.write(f"{messages[0].EntryID},,mark_email,\n")
+            f.write(f"{messages[1].EntryID},,move_email,{self.new_folder}\n")
+            f.write("missing,,delete_email,\n")
+            f.write(f"{messages[2].EntryID},,delete_email,\n")
+        results = f"{self.temp_path}/results.csv"
+        counts = self.o.run_batch(manifest, results, self.temp_path)
+        self.assertEqual(counts, {"ok": 3, "error": 1})
+        df = pd.read_csv(results)
+        self.assertEqual(list(df["status"]).count("error"), 1)
+        self.assertFalse(messages[0].UnRead)
+        self.assertEqual(len(self.o.inbox.Items), 298)
+
+    # Test run_action() dispatch through the action registry
+    def test_run_action(self):
+        message = self.o.inbox.Items.Restrict("[Unread]=True").GetFirst()
+        args = parse_args(
+            ["--email_action", "mark_email", "--email_id", message.EntryID],
+            "test",
+        )
+        self.assertTrue(run_action(self.o, args))
+        self.assertFalse(message.UnRead)
+        # Batch actions in the order they run for an item
+        self.assertEqual(
+            batch_actions(),
+            [
+                "get_attachments",
+                "save_email",
+                "mark_email",
+                "move_email",
+                "delete_email",
+            ],
+        )
+        self.assertFalse(ACTIONS["send_email"].fresh)
+        args.email_action = "unknown"
+        with self.assertRaises(ValueError):
+            run_action(self.o, args)
+
+    # Test the per call latency of the fake store
+    def test_latency(self):
+        store = FakeMailStore(latency=0.001)
+        store.populate(20)
+        o = Outlook(None, None, backend=FakeBackend(store))
+        store.reset_calls()
+        o.get_emails("[Unread]=True", self.temp_path)
+        self.assertGreater(store.total_calls(), 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+# Importing the code to be tested
+from email_attachments import AttachmentSelector, AttachmentSink, is_inline
+from fake_outlook import OL_BY_VALUE, OL_EMBEDDED_ITEM, OL_OLE, FakeMailStore
+
+
+class TestAttachmentSelector(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = FakeMailStore()
+        attachments = [
+            {"filename": "report.pdf", "size": 1000},
+            {"filename": "report.pdf.exe", "size": 1000},
+            {"filename": "huge.pdf", "size": 50_000_000},
+            {"filename": "image001.png", "size": 4000, "hidden": True},
+            {"filename": "chart.bin", "size": 10, "type": OL_OLE},
+        ]
+        message = self.store.add_message(attachments=attachments)
+        self.attachments = list(message.Attachments)
+
+    def selected(self, selector):
+        return [a.FileName for a in self.attachments if selector.accepts(a)]
+
+    def test_glob_is_anchored(self):
+        self.assertEqual(
+            self.selected(AttachmentSelector("*.pdf")),
+            ["report.pdf", "huge.pdf"],
+        )
+
+    def test_plain_pattern_is_substring(self):
+        self.assertEqual(
+            self.selected(AttachmentSelector(".pdf")),
+            ["report.pdf", "report.pdf.exe", "huge.pdf"],
+        )
+
+    def test_size_type_inline(self):
+        selector = AttachmentSelector(
+            "*", max_size=10_000_000, types=[OL_BY_VALUE], skip_inline=True
+        )
+        self.assertEqual(
+            self.selected(selector), ["report.pdf", "report.pdf.exe"]
+        )
+        # Metadata only: nothing was saved to decide
+        self.assertEqual(self.store.calls["SaveAsFile"], 0)
+
+    # Test that only hidden or body-referenced attachments are inline
+    def test_is_inline(self):
+        message = self.store.add_message(
+            HTMLBody='<p>Logo</p><img src="CID:logo@01D9">',
+            attachments=[
+                {"filename": "logo.png", "content_id": "logo@01D9"},
+                {"filename": "photo.png", "content_id": "photo@01D9"},
+                {"filename": "forward.msg", "type": OL_EMBEDDED_ITEM},
+                {"filename": "chart.bin", "type": OL_OLE},
+            ],
+        )
+        self.assertEqual(
+            [is_inline(a) for a in message.Attachments],
+            [True, False, False, False],
+        )
+        self.assertTrue(is_inline(self.attachments[3]))
+
+    # Test that the body is read once per message, not per attachment
+    def test_inline_body_once(self):
+        cids = "".join(f'<img src="cid:logo{n}@01D9">' for n in range(5))
+        messages = [
+            self.store.add_message(
+                HTMLBody=cids,
+                attachments=[
+                    {"filename": f"logo{n}.png", "content_id": f"logo{n}@01D9"}
+                    for n in range(5)
+                ]
+                + [{"filename": "report.pdf", "content_id": "report@01D9"}],
+            )
+            for _ in range(2)
+        ]
+        selector = AttachmentSelector("*", skip_inline=True)
+        before = self.store.calls["HTMLBody"]
+        selected = [
+            a.FileName
+            for message in messages
+            for a in message.Attachments
+            if selector.accepts(a)
+        ]
+        self.assertEqual(selected, ["report.pdf", "report.pdf"])
+        self.assertEqual(self.store.calls["HTMLBody"] - before, 2)
+
+    def test_regex(self):
+        selector = AttachmentSelector("*", regex=r"^report\.pdf$")
+        self.assertEqual(self.selected(selector), ["report.pdf"])
+
+
+class TestAttachmentSink(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def stage(self, sink, entry_id, name, data):
+        path = sink.staging_path(name)
+        with open(path, "wb") as f:
+            f.write(data)
+        sink.submit(entry_id, name, path)
+
+    def test_dedupe_and_names(self):
+        with AttachmentSink(self.temp_path, workers=2) as sink:
+            self.stage(sink, "A", "terms.pdf", b"same")
+            self.stage(sink, "B", "terms.pdf", b"same")
+            self.stage(sink, "C", "terms.pdf", b"other")
+        self.assertEqual(sink.counts["saved"], 2)
+        self.assertEqual(sink.counts["duplicate"], 1)
+        self.assertEqual(
+            sorted(os.listdir(self.temp_path)),
+            ["attachments.csv", "terms (2).pdf", "terms.pdf"],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
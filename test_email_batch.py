@@ -0,0 +1,85 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+# Importing the code to be tested
+from email_batch import RateLimiter, plan, read_manifest, render
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def write(self, name, text):
+        path = os.path.join(self.temp_path, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_csv_params(self):
+        path = self.write(
+            "manifest.csv",
+            "id,store_id,action,new_folder\n"
+            "A,S1,move_email,Done\n"
+            "B,,mark_email,\n",
+        )
+        entries = read_manifest(path)
+        self.assertEqual(entries[0]["params"], {"new_folder": "Done"})
+        self.assertEqual(entries[1]["params"], {})
+        self.assertIsNone(entries[1]["store_id"])
+
+    def test_jsonl_plan(self):
+        path = self.write(
+            "manifest.jsonl",
+            '{"id": "A", "store_id": "S2", "action": "move_email", '
+            '"params": {"new_folder": "X"}}\n'
+            '{"id": "A", "store_id": "S2", "action": "mark_email"}\n'
+            '{"id": "B", "store_id": "S1", "action": "delete_email"}\n'
+            '{"id": "C", "store_id": "S2", "action": "move_email", '
+            '"params": {"new_folder": "W"}}\n',
+        )
+        actions = ["mark_email", "move_email", "delete_email"]
+        entries = plan(read_manifest(path), actions)
+        ordered = [(e["id"], e["action"]) for e in entries]
+        self.assertEqual(
+            ordered,
+            [
+                ("B", "delete_email"),
+                ("A", "mark_email"),
+                ("C", "move_email"),
+                ("A", "move_email"),
+            ],
+        )
+
+
+class TestMailMerge(unittest.TestCase):
+    def test_render(self):
+        fields = {"name": "Ana", "total": 12}
+        self.assertEqual(
+            render("Hi {{name}}, {{ total }} due", fields), "Hi Ana, 12 due"
+        )
+        # Braces that are not placeholders are left alone
+        self.assertEqual(render("p {color: red}", fields), "p {color: red}")
+        with self.assertRaises(KeyError):
+            render("{{missing}}", fields)
+
+    def test_rate_limiter(self):
+        clock = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+
+        limiter = RateLimiter(30, clock=lambda: clock[0], sleep=sleep)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(sleeps, [2.0, 2.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+# Importing the code to be tested
+from email_cache import SenderCache, Watermark, WatermarkStore
+
+
+class TestWatermark(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def test_same_timestamp(self):
+        watermark = Watermark()
+        stamp = datetime(2026, 10, 1, 9, 30, 15)
+        watermark.advance(stamp, "A")
+        self.assertFalse(watermark.is_new(stamp, "A"))
+        self.assertTrue(watermark.is_new(stamp, "B"))
+        self.assertFalse(watermark.is_new(datetime(2026, 10, 1, 9, 30), "C"))
+
+    def test_restrict_filter(self):
+        watermark = Watermark(datetime(2026, 10, 1, 13, 5, 40))
+        self.assertEqual(
+            watermark.restrict_filter("[Unread] = True"),
+            "([Unread] = True) AND [ReceivedTime] >= '2026-10-01 01:05 PM'",
+        )
+        self.assertEqual(Watermark().restrict_filter("[Unread]"), "[Unread]")
+
+    def test_store_round_trip(self):
+        path = os.path.join(self.temp_path, "state.json")
+        store = WatermarkStore(path)
+        store.get("\\\\box\\Inbox").advance(datetime(2026, 10, 1), "A")
+        store.save()
+        loaded = WatermarkStore(path).get("\\\\box\\Inbox")
+        self.assertEqual(loaded.received, datetime(2026, 10, 1))
+        self.assertEqual(loaded.entry_ids, {"A"})
+
+
+class TestSenderCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def test_lru_eviction(self):
+        cache = SenderCache(max_size=2)
+        cache.put("/CN=A", "a@example.com")
+        cache.put("/CN=B", "b@example.com")
+        self.assertEqual(cache.get("/CN=A"), "a@example.com")
+        cache.put("/CN=C", "c@example.com")
+        self.assertIsNone(cache.get("/CN=B"))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "size": 2})
+
+    def test_file_ttl(self):
+        path = os.path.join(self.temp_path, "senders.json")
+        cache = SenderCache(path=path)
+        cache.put("/CN=A", "a@example.com")
+        cache.save()
+        self.assertEqual(SenderCache(path=path).get("/CN=A"), "a@example.com")
+        self.assertIsNone(SenderCache(path=path, ttl=0).get("/CN=A"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import csv
+import json
+import shutil
+import tempfile
+
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Importing the code to be tested
+from email_export import open_writer
+
+COLUMNS = ["id", "subject", "attachments_count", "unread"]
+
+
+class TestExportWriters(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+        self.rows = [
+            [f"id{n}", f"Subject {n}", n % 3, n % 2 == 0] for n in range(25)
+        ]
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def test_csv_partial_file(self):
+        # A failure mid-run keeps every chunk written so far
+        with self.assertRaises(RuntimeError):
+            with open_writer("csv", self.temp_path, COLUMNS, 10) as writer:
+                for n, row in enumerate(self.rows):
+                    if n == 23:
+                        raise RuntimeError("COM died")
+                    writer.write(row)
+        with open(writer.path, newline="", encoding="utf-8") as f:
+            lines = list(csv.reader(f))
+        self.assertEqual(lines[0], COLUMNS)
+        self.assertEqual(len(lines) - 1, 23)
+
+    def test_jsonl(self):
+        with open_writer("jsonl", self.temp_path, COLUMNS, 10) as writer:
+            for row in self.rows:
+                writer.write(row)
+        with open(writer.path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 25)
+        self.assertEqual(records[3], dict(zip(COLUMNS, self.rows[3])))
+
+    @unittest.skipIf(pq is None, "pyarrow not installed")
+    def test_parquet_row_groups(self):
+        with open_writer("parquet", self.temp_path, COLUMNS, 10) as writer:
+            for row in self.rows:
+                writer.write(row)
+        parquet = pq.ParquetFile(writer.path)
+        self.assertEqual(parquet.metadata.num_rows, 25)
+        self.assertEqual(parquet.num_row_groups, 3)
+
+    @unittest.skipIf(pq is None, "pyarrow not installed")
+    def test_arrow_typed_columns(self):
+        columns = ["id", "sender", "received", "attachments"]
+        received = datetime(2026, 3, 2, 9, 30)
+        with open_writer("arrow", self.temp_path, columns, 10) as writer:
+            for n in range(25):
+                writer.write(
+                    [
+                        f"id{n}",
+                        f"Sender {n % 4}",
+                        received,
+                        ["a.pdf"] * (n % 2),
+                    ]
+                )
+        table = pa.ipc.open_file(writer.path).read_all()
+        self.assertTrue(pa.types.is_dictionary(table.schema.field(1).type))
+        # Chunks extend one dictionary: four senders stored once
+        sender = table.column("sender").combine_chunks()
+        self.assertEqual(len(sender.dictionary), 4)
+        df = table.to_pandas()
+        self.assertEqual(df["received"][0], received)
+        self.assertEqual(list(df["attachments"][1]), ["a.pdf"])
+
+    @unittest.skipIf(pq is None, "pyarrow not installed")
+    def test_parquet_formatted_rows(self):
+        # Rows already formatted for csv, as email_fanout merges them
+        columns = ["sender", "received", "attachments"]
+        with open_writer("parquet", self.temp_path, columns) as writer:
+            writer.write(["Ana", "03/02/26 09:30:00", "a.pdf|b.pdf"])
+            writer.write(["Ana", "03/02/26 10:00:00", "empty"])
+        df = pq.read_table(writer.path).to_pandas()
+        self.assertEqual(str(df["sender"].dtype), "category")
+        self.assertEqual(df["received"][0], datetime(2026, 3, 2, 9, 30))
+        self.assertEqual(list(df["attachments"][0]), ["a.pdf", "b.pdf"])
+        self.assertEqual(len(df["attachments"][1]), 0)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            open_writer("xml", self.temp_path, COLUMNS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import pandas as pd
+
+# Importing the code to be tested
+from email_fanout import export_targets, read_targets
+from fake_outlook import FakeBackend, FakeMailStore
+
+
+def fail_halfway(outlook, folder_path, **options):
+    with open(os.path.join(folder_path, "df.jsonl"), "w") as f:
+        f.write('{"id": "half", "subject": "written before failing"}\n')
+    raise RuntimeError("Outlook went away")
+
+
+class TestFanout(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+        self.store = FakeMailStore()
+        self.store.populate(40, seed=1)
+        for n in (1, 2):
+            self.store.add_mailbox(f"shared{n}@example.com")
+            self.store.populate(
+                20 * n, mailbox=f"shared{n}@example.com", seed=n
+            )
+        self.targets = os.path.join(self.temp_path, "targets.csv")
+        with open(self.targets, "w", encoding="utf-8") as f:
+            f.write("mailbox,folder\n")
+            f.write(",Inbox\n")
+            f.write("shared1@example.com,Inbox\n")
+            f.write("shared2@example.com,Inbox\n")
+            f.write("missing@example.com,Inbox\n")
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def test_export_targets(self):
+        results = export_targets(
+            read_targets(self.targets),
+            self.temp_path,
+            {"o_filter": "[Unread]=True", "columns": ["id", "subject"]},
+            "csv",
+            processes=2,
+            backend=FakeBackend(self.store),
+        )
+        self.assertEqual(
+            [entry["status"] for entry in results],
+            ["ok", "ok", "ok", "error"],
+        )
+        df = pd.read_csv(f"{self.temp_path}/df.csv")
+        self.assertEqual(
+            list(df.columns), ["mailbox", "folder", "id", "subject"]
+        )
+        self.assertEqual(len(df), sum(entry["rows"] for entry in results))
+        shared = df[df["mailbox"] == "shared2@example.com"]
+        unread = self.store.folder("Inbox", "shared2@example.com").Items
+        self.assertEqual(len(shared), len(unread.Restrict("[Unread]=True")))
+        self.assertFalse(os.path.exists(f"{self.temp_path}/.parts"))
+        status = pd.read_csv(f"{self.temp_path}/targets_results.csv")
+        self.assertEqual(len(status), 4)
+
+    # Test that rows of a target that failed are not merged
+    @unittest.skipUnless(
+        multiprocessing.get_start_method() == "fork",
+        "workers only run the patched method when forked",
+    )
+    def test_failed_target(self):
+        with mock.patch("email_fanout.Outlook.get_emails", fail_halfway):
+            results = export_targets(
+                read_targets(self.targets),
+                self.temp_path,
+                {"columns": ["id", "subject"]},
+                "jsonl",
+                processes=1,
+                backend=FakeBackend(self.store),
+            )
+        self.assertEqual({entry["status"] for entry in results}, {"error"})
+        with open(f"{self.temp_path}/df.jsonl", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "")
+
+    # Test that the mailbox is synced once, not by every worker
+    def test_sync_once(self):
+        self.store.reset_calls()
+        export_targets(
+            read_targets(self.targets),
+            self.temp_path,
+            {"o_filter": "[Unread]=True", "columns": ["id"]},
+            "csv",
+            processes=2,
+            backend=FakeBackend(self.store),
+            sync="full",
+        )
+        self.assertEqual(self.store.calls["SyncStart"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
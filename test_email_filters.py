@@ -0,0 +1,74 @@
+import unittest
+from datetime import datetime, timedelta
+
+# Importing the code to be tested
+from email_actions import parse_args
+from email_filters import MailFilter
+from fake_outlook import FakeMailStore
+
+
+class TestMailFilter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = FakeMailStore()
+        self.inbox = self.store.populate(300, seed=3)
+
+    def matching(self, mail_filter):
+        return {x.EntryID for x in self.inbox.Items.Restrict(str(mail_filter))}
+
+    def expected(self, test):
+        return {x.EntryID for x in self.inbox.Items if test(x)}
+
+    def test_to_dasl(self):
+        dasl = MailFilter().subject_contains("it's").unread().to_dasl()
+        self.assertEqual(
+            dasl,
+            "@SQL=(\"urn:schemas:httpmail:subject\" like '%it''s%') AND "
+            '("urn:schemas:httpmail:read" = 0)',
+        )
+        indexed = MailFilter(content_index=True).body_contains("invoice")
+        self.assertIn("ci_phrasematch 'invoice'", indexed.to_dasl())
+        self.assertIsNone(MailFilter().to_dasl())
+
+    def test_restrict(self):
+        since = datetime.now() - timedelta(days=10)
+        mail_filter = (
+            MailFilter()
+            .received_between(since, None)
+            .sender_domain("example.com")
+            .has_attachments()
+        )
+        self.assertEqual(
+            self.matching(mail_filter),
+            self.expected(
+                lambda x: x.ReceivedTime
+                >= since.replace(second=0, microsecond=0)
+                and x._props["_smtp"].endswith("@example.com")
+                and len(x.Attachments) > 0
+            ),
+        )
+
+    def test_sender_and_category(self):
+        message = self.inbox.Items.GetFirst()
+        message.Categories = "Red, Invoices"
+        mail_filter = (
+            MailFilter().sender(message._props["_smtp"]).category("Invoices")
+        )
+        self.assertEqual(self.matching(mail_filter), {message.EntryID})
+
+    def test_parse_args(self):
+        args = parse_args(["--subject_contains", "report"], user="test")
+        self.assertTrue(args.mail_filter.startswith("@SQL="))
+        args = parse_args(["--unread", "--mail_filter", "@SQL=x"], "test")
+        self.assertTrue(args.mail_filter.startswith("@SQL=(x) AND "))
+        # Without typed filters the default stays: unread, last 3 days
+        args = parse_args([], user="test")
+        self.assertIn('"urn:schemas:httpmail:read" = 0', args.mail_filter)
+        self.assertIn("<", args.mail_filter)
+        # A watch outlives the first midnight: its window has no end
+        args = parse_args(["--email_action", "watch"], user="test")
+        self.assertIn('"urn:schemas:httpmail:read" = 0', args.mail_filter)
+        self.assertNotIn("<", args.mail_filter)
+
+
+if __name__ == "__main__":
+    unittest.main()
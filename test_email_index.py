@@ -0,0 +1,84 @@
+import unittest
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+# Importing the code to be tested
+from email_index import MailIndex
+
+
+class TestMailIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+        self.index = MailIndex(os.path.join(self.temp_path, "index.sqlite"))
+        self.rows = [
+            {
+                "id": "A",
+                "store_id": "S",
+                "subject": "PO 4471 shipped",
+                "body": "Steel pipe order, ask ana@vendor-a.com",
+                "attachments": ["po_4471.pdf"],
+                "sender_add": "ana@vendor-a.com",
+                "received": datetime(2026, 1, 2, 10, 0),
+                "unread": True,
+            },
+            {
+                "id": "B",
+                "store_id": "S",
+                "subject": "Meeting",
+                "body": "About PO 4471 and 4472",
+                "attachments": [],
+                "sender_add": "luis@vendor-b.net",
+                "received": datetime(2026, 1, 3, 10, 0),
+                "unread": False,
+            },
+        ]
+        for row in self.rows:
+            self.index.add(row, "\\\\user@example.com\\Inbox")
+        self.index.flush()
+
+    def tearDown(self) -> None:
+        self.index.close()
+        shutil.rmtree(self.temp_path)
+
+    def test_search(self):
+        found = self.index.search('"4471"')
+        self.assertEqual({row["id"] for row in found}, {"A", "B"})
+        found = self.index.search('"4471"', senders=["vendor-a.com"])
+        self.assertEqual([row["id"] for row in found], ["A"])
+        # Attachment names are searchable too
+        self.assertEqual(len(self.index.search("attachments: pdf")), 1)
+        newest = self.index.search(since=datetime(2026, 1, 3))
+        self.assertEqual([row["id"] for row in newest], ["B"])
+
+    # Test that text FTS5 cannot parse is searched as phrases
+    def test_search_phrases(self):
+        found = self.index.search("PO-4471")
+        self.assertEqual({row["id"] for row in found}, {"A", "B"})
+        found = self.index.search("ana@vendor-a.com")
+        self.assertEqual([row["id"] for row in found], ["A"])
+
+    def test_upsert(self):
+        # A later run reading fewer columns keeps the others
+        self.index.add({"id": "A", "store_id": "S", "subject": "Renamed"})
+        self.index.flush()
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.search("shipped"), [])
+        found = self.index.search("renamed")
+        self.assertEqual(found[0]["sender_add"], "ana@vendor-a.com")
+        self.index.remove("B", "S")
+        self.assertEqual(self.index.search("meeting"), [])
+
+    # Test that a moved message keeps its text under its new EntryID
+    def test_move(self):
+        self.index.move("A", None, "A2", "\\\\user@example.com\\Inbox\\Done")
+        (found,) = self.index.search("shipped")
+        self.assertEqual(found["id"], "A2")
+        self.assertEqual(found["store_id"], "S")
+        self.assertTrue(found["folder"].endswith("Done"))
+        self.assertEqual(len(self.index), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
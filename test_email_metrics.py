@@ -0,0 +1,50 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+# Importing the code to be tested
+from email_metrics import Histogram, Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def test_histogram(self):
+        histogram = Histogram(buckets=(0.01, 0.1))
+        for seconds in (0.005, 0.05, 0.05, 3.0):
+            histogram.observe(seconds)
+        self.assertEqual(
+            list(histogram.cumulative()), [(0.01, 1), (0.1, 3), ("+Inf", 4)]
+        )
+        self.assertEqual(histogram.max, 3.0)
+
+    def test_write(self):
+        metrics = Metrics()
+        with metrics.span("Restrict"):
+            pass
+        metrics.observe("item", 0.002)
+        metrics.count("rows_exported", 7)
+
+        metrics.write(os.path.join(self.temp_path, "metrics.json"))
+        with open(os.path.join(self.temp_path, "metrics.json")) as f:
+            data = json.load(f)
+        self.assertEqual(data["spans"]["Restrict"]["count"], 1)
+        self.assertEqual(data["counters"], {"rows_exported": 7})
+
+        text = metrics.to_prometheus()
+        self.assertIn(
+            'email_actions_span_seconds_bucket{span="item",le="+Inf"} 1', text
+        )
+        self.assertIn(
+            'email_actions_events_total{name="rows_exported"} 7', text
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
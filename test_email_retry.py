@@ -0,0 +1,64 @@
+import unittest
+
+# Importing the code to be tested
+from email_retry import (
+    DISP_E_EXCEPTION,
+    RPC_E_CALL_REJECTED,
+    RPC_S_SERVER_UNAVAILABLE,
+    RetryPolicy,
+    classify,
+    hresult,
+)
+from fake_outlook import E_FAIL, FakeComError
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sleeps = []
+        self.policy = RetryPolicy(
+            attempts=3, base=1.0, sleep=self.sleeps.append, rand=lambda: 1.0
+        )
+
+    def flaky(self, *codes):
+        errors = [FakeComError(code, "boom") for code in codes]
+
+        def call():
+            if errors:
+                raise errors.pop(0)
+            return "ok"
+
+        return call
+
+    def test_classify(self):
+        self.assertEqual(
+            classify(FakeComError(RPC_E_CALL_REJECTED, "busy")), "transient"
+        )
+        self.assertEqual(
+            classify(FakeComError(RPC_S_SERVER_UNAVAILABLE, "gone")), "dead"
+        )
+        self.assertEqual(classify(FakeComError(E_FAIL, "no")), "permanent")
+        self.assertEqual(classify(ValueError("x")), "permanent")
+        # The code of an error raised inside the call is in excepinfo
+        wrapped = FakeComError(
+            DISP_E_EXCEPTION, "x", (0, "Outlook", "", None, 0, E_FAIL)
+        )
+        self.assertEqual(hresult(wrapped), E_FAIL)
+
+    def test_backoff(self):
+        call = self.flaky(RPC_E_CALL_REJECTED, RPC_E_CALL_REJECTED)
+        self.assertEqual(self.policy.call(call), "ok")
+        self.assertEqual(self.sleeps, [2.0, 4.0])
+        self.assertEqual(self.policy.retries, 2)
+
+    def test_gives_up(self):
+        with self.assertRaises(FakeComError):
+            self.policy.call(self.flaky(*[RPC_E_CALL_REJECTED] * 3))
+        # Permanent and dead errors are not retried
+        for code in (E_FAIL, RPC_S_SERVER_UNAVAILABLE):
+            with self.assertRaises(FakeComError):
+                self.policy.call(self.flaky(code))
+        self.assertEqual(len(self.sleeps), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from unittest import mock
+
+# Importing the code to be tested
+from email_actions import parse_args
+from email_server import ActionServer, main, parse_address, send_request
+from fake_outlook import FakeBackend, FakeMailStore
+
+
+class TestActionServer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+        self.store = FakeMailStore()
+        self.store.populate(50, seed=2)
+        self.authkey = b"test"
+        self.server = ActionServer(
+            "localhost:0", self.authkey, FakeBackend(self.store)
+        )
+        self.address = "%s:%d" % self.server.address
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        send_request({"email_action": "shutdown"}, self.address, self.authkey)
+        self.thread.join(5)
+        shutil.rmtree(self.temp_path)
+
+    def request(self, *argv):
+        args = parse_args(
+            [*argv, "--folder_path", self.temp_path], user="test"
+        )
+        return send_request(vars(args), self.address, self.authkey)
+
+    def test_session_reused(self):
+        for message in self.store.folder("Inbox").Items.Restrict(
+            "[Unread]=True"
+        ):
+            response = self.request(
+                "--email_action",
+                "mark_email",
+                "--email_id",
+                message.EntryID,
+            )
+            self.assertEqual(response, {"status": "ok"})
+        self.assertEqual(
+            len(self.store.folder("Inbox").Items.Restrict("[Unread]=True")), 0
+        )
+        # A single Outlook was opened for every request
+        self.assertEqual(self.store.calls["GetNamespace"], 1)
+
+    # Test that sync options pick their own session and metrics are written
+    def test_session_options(self):
+        metrics_path = f"{self.temp_path}/metrics.json"
+        for sync in ("none", "none", "folder"):
+            response = self.request(
+                "--email_action",
+                "get_emails",
+                "--output_format",
+                "csv",
+                "--sync",
+                sync,
+                "--metrics_path",
+                metrics_path,
+            )
+            self.assertEqual(response, {"status": "ok"})
+        self.assertEqual(
+            sorted(key[2] for key in self.server.sessions), ["folder", "none"]
+        )
+        with open(metrics_path, encoding="utf-8") as f:
+            self.assertIn("rows_exported", json.load(f)["counters"])
+
+    def test_bad_requests(self):
+        with Client(parse_address(self.address), authkey=self.authkey) as conn:
+            conn.send_bytes(b"not json")
+            self.assertEqual(json.loads(conn.recv_bytes())["status"], "error")
+        # A client leaving before sending anything
+        Client(parse_address(self.address), authkey=self.authkey).close()
+        response = send_request(
+            {"email_action": "ping"}, self.address, self.authkey
+        )
+        self.assertEqual(response, {"status": "ok"})
+
+    def test_error_response(self):
+        response = self.request(
+            "--email_action", "mark_email", "--email_id", "missing"
+        )
+        self.assertEqual(response["status"], "error")
+
+    # Test that nothing starts without a shared secret
+    def test_authkey_required(self):
+        with mock.patch.dict(os.environ, clear=True):
+            with self.assertRaises(RuntimeError):
+                ActionServer("localhost:0", backend=FakeBackend(self.store))
+            with self.assertRaises(RuntimeError):
+                send_request({"email_action": "ping"}, self.address)
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def run_client(self, address, key):
+        with mock.patch.dict(os.environ, {"EMAIL_ACTIONS_KEY": key}):
+            with mock.patch("email_server.os.getlogin", return_value="test"):
+                main(
+                    [
+                        "--address",
+                        address,
+                        "--email_action",
+                        "ping",
+                        "--folder_path",
+                        self.temp_path,
+                    ]
+                )
+        with open(f"{self.temp_path}/error.txt", encoding="utf-8") as f:
+            return f.read()
+
+    # Test that a failed connection still leaves a status file
+    def test_connection_errors(self):
+        # Nothing listens on the port once this listener is closed
+        server = ActionServer("localhost:0", b"right")
+        address = "%s:%d" % server.address
+        server.listener.close()
+        self.assertTrue(self.run_client(address, "right"))
+        os.remove(f"{self.temp_path}/error.txt")
+
+        server = ActionServer("localhost:0", b"right")
+        address = "%s:%d" % server.address
+
+        def accept():
+            with self.assertRaises(AuthenticationError):
+                server.listener.accept()
+
+        thread = threading.Thread(target=accept)
+        thread.start()
+        try:
+            self.assertTrue(self.run_client(address, "wrong"))
+        finally:
+            thread.join(5)
+            server.listener.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,232 @@
+import unittest
+import glob
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pandas as pd
+
+# Importing the code to be tested
+from email_actions import Outlook, default_filter
+from email_watch import Watcher
+from fake_outlook import FakeBackend, FakeMailStore
+
+
+class ScriptedBackend(FakeBackend):
+    """Runs one scripted step on each pump, then stops the watcher."""
+
+    def __init__(self, store, steps):
+        super().__init__(store)
+        self.steps = list(steps)
+        self.watcher = None
+
+    def pump(self):
+        if self.watcher is not None and self.watcher.running:
+            if self.steps:
+                self.steps.pop(0)()
+            else:
+                self.watcher.stop()
+        super().pump()
+
+
+class TestWatcher(unittest.TestCase):
+    # SetUp, executes before every function to test
+    def setUp(self) -> None:
+        self.temp_path = tempfile.mkdtemp()
+        self.state_path = f"{self.temp_path}/state.json"
+        self.store = FakeMailStore()
+        self.store.populate(20, seed=3)
+        self.store.add_folder("Inbox/Done")
+
+    # TearDown, executes after every function to test
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_path)
+
+    def watch(self, steps=(), o_filter="[Unread]=True", **kwargs):
+        backend = ScriptedBackend(self.store, steps)
+        outlook = Outlook(None, None, backend=backend)
+        watcher = Watcher(
+            outlook,
+            self.temp_path,
+            self.state_path,
+            o_filter,
+            output_format="jsonl",
+            columns=["id", "subject"],
+            max_wait=0,
+            **kwargs,
+        )
+        backend.watcher = watcher
+        try:
+            watcher.run(poll=0)
+        finally:
+            outlook.close()
+        return watcher
+
+    def exported(self):
+        # Every run writes its own file, oldest first by name
+        paths = sorted(glob.glob(f"{self.temp_path}/df_watch_*.jsonl"))
+        return pd.concat(
+            [pd.read_json(path, lines=True) for path in paths],
+            ignore_index=True,
+        )
+
+    # Test the startup sweep and mail arriving while watching
+    def test_run(self):
+        unread = sum(
+            1 for item in self.store.items.values() if item._props["UnRead"]
+        )
+        now = datetime.now().replace(microsecond=0) + timedelta(minutes=1)
+        watcher = self.watch(
+            [
+                lambda: self.store.add_message(
+                    Subject="First", ReceivedTime=now
+                ),
+                lambda: self.store.add_message(
+                    Subject="Second", ReceivedTime=now
+                ),
+            ]
+        )
+        self.assertEqual(watcher.processed, unread + 2)
+        df = self.exported()
+        self.assertEqual(len(df), unread + 2)
+        self.assertEqual(list(df["subject"][-2:]), ["First", "Second"])
+        with open(self.state_path, encoding="utf-8") as f:
+            (watermark,) = json.load(f).values()
+        self.assertEqual(len(watermark["entry_ids"]), 2)
+
+    # Test that mail received while nothing was watching is caught up
+    def test_resume(self):
+        self.watch()
+        first = list(self.exported()["subject"])
+        self.assertGreater(len(first), 0)
+        later = datetime.now().replace(microsecond=0) + timedelta(minutes=5)
+        self.store.add_message(Subject="Missed", ReceivedTime=later)
+        watcher = self.watch()
+        self.assertEqual(watcher.processed, 1)
+        # Rows of the first run are still there
+        self.assertEqual(list(self.exported()["subject"]), first + ["Missed"])
+
+    # Test that events beyond the queue size fall back to a sweep
+    def test_overflow(self):
+        def burst():
+            for n in range(5):
+                self.store.add_message(Subject=f"Burst {n}")
+
+        watcher = self.watch([burst], queue_size=2)
+        subjects = list(self.exported()["subject"])
+        self.assertEqual(
+            sorted(s for s in subjects if s.startswith("Burst")),
+            [f"Burst {n}" for n in range(5)],
+        )
+        self.assertEqual(len(subjects), len(set(watcher._seen)))
+
+    # Test that processed mail is marked and moved
+    def test_mark_move(self):
+        self.watch(
+            [lambda: self.store.add_message(Subject="Invoice")],
+            actions=("export", "mark", "move"),
+            new_folder="Done",
+        )
+        done = self.store.folder("Inbox/Done")._messages.values()
+        subjects = [item._props["Subject"] for item in done]
+        self.assertIn("Invoice", subjects)
+        self.assertTrue(all(not item._props["UnRead"] for item in done))
+
+    # Test that arrived mail outside the filter is left alone
+    def test_filter_arrivals(self):
+        self.watch(
+            [
+                lambda: self.store.add_message(Subject="Invoice"),
+                lambda: self.store.add_message(
+                    Subject="Personal", UnRead=False
+                ),
+            ],
+            actions=("export", "move"),
+            new_folder="Done",
+        )
+        self.assertNotIn("Personal", list(self.exported()["subject"]))
+        done = self.store.folder("Inbox/Done")._messages.values()
+        subjects = [item._props["Subject"] for item in done]
+        self.assertIn("Invoice", subjects)
+        self.assertNotIn("Personal", subjects)
+        self.assertIn(
+            "Personal",
+            [item._props["Subject"] for item in self.store.items.values()],
+        )
+
+    # Test that an item deleted meanwhile does not stop the watch
+    def test_item_vanished(self):
+        process = Watcher._process
+
+        def vanish_first(watcher, rows):
+            # Another client deletes the first item after it was read
+            if not watcher.processed:
+                gone = self.store.items[rows[0]["id"]]
+                gone._folder._drop_item(gone)
+            process(watcher, rows)
+
+        with mock.patch.object(Watcher, "_process", vanish_first):
+            watcher = self.watch(
+                [lambda: self.store.add_message(Subject="Invoice")],
+                actions=("export", "mark", "move"),
+                new_folder="Done",
+            )
+        self.assertEqual(watcher.failed, 1)
+        done = self.store.folder("Inbox/Done")._messages.values()
+        subjects = [item._props["Subject"] for item in done]
+        self.assertIn("Invoice", subjects)
+        self.assertEqual(len(done), watcher.processed - 1)
+
+    # Test that mail arriving while the startup sweep reads is not missed
+    def test_arrival_during_sweep(self):
+        sweep = Watcher.sweep
+
+        def sweep_then_arrive(watcher):
+            sweep(watcher)
+            # Arrives after the sweep read the folder
+            self.store.add_message(Subject="Meanwhile")
+
+        with mock.patch.object(Watcher, "sweep", sweep_then_arrive):
+            self.watch()
+        self.assertIn("Meanwhile", list(self.exported()["subject"]))
+
+    # Test that the default filter of a watch still matches after midnight
+    def test_default_filter(self):
+        later = datetime.now().replace(microsecond=0) + timedelta(days=2)
+        self.watch(
+            [
+                lambda: self.store.add_message(
+                    Subject="Tomorrow", SentOn=later, ReceivedTime=later
+                )
+            ],
+            default_filter(open_ended=True),
+        )
+        self.assertIn("Tomorrow", list(self.exported()["subject"]))
+
+    # Test that an arrival only reads mail from the watermark on
+    def test_arrival_cost(self):
+        self.store.populate(3000, seed=4)
+
+        def arrive():
+            self.store.reset_calls()
+            self.store.add_message(Subject="Invoice")
+
+        self.watch([arrive])
+        self.assertIn("Invoice", list(self.exported()["subject"]))
+        # One short read, not the whole filtered folder again
+        self.assertEqual(self.store.calls["GetArray"], 1)
+
+    def test_unknown_action(self):
+        outlook = Outlook(None, None, backend=FakeBackend(self.store))
+        with self.assertRaises(ValueError):
+            Watcher(outlook, self.temp_path, self.state_path, actions=["x"])
+        outlook.close()
+        self.assertFalse(os.path.exists(self.state_path))
+
+
+# Execute tests
+if __name__ == "__main__":
+    unittest.main()